@@ -18,27 +18,30 @@ contract AtomicSwap{
 
     address managmentAddress;
 
-    uint TIMEOUT_BLOCKS = 6 * 60 *24;
+    uint constant TIMEOUT_BLOCKS = 6 * 60 *24;
+    uint8 constant MAX_SEARCH_ARITY = 16;
+    uint16 constant CONFIRMATION_HEADERS = 7; // the first block of contention and the 6 blocks confirming it
 
+    // The small fields following the agreement share a single storage slot, and the
+    // search boundaries are kept in a fixed-size array, so no array lengths have to be
+    // written or checked in storage.
     struct Verification{
         Aggreement agreement;
-        uint current_height;
+        uint64 current_height;
         ContractState state;
-        //bytes32[] alice_btc_headers;
-        bytes32[] btc_headers;
-        bytes32[] bob_btc_headers;
         uint16 mined_blocks;
-        bytes32 last_hash;
-        bytes32 tx_hash;
-        //uint16 alice_current_resolving_header;
         uint16 bob_current_resolving_header;
         uint16 left_index;
         uint16 right_index;
         uint16 mid_index;
-        bool search_right;
+        uint8 search_arity; // 0 for the binary search, otherwise the number of segments per round of the k-ary search
+        bytes32 last_hash;
+        bytes32 tx_hash;
         bytes32 lower_bound_target_hash;
         bytes32 integrityCheck;
         bytes32 block_count_hash;
+        bytes32 bob_last_header; // hash of the last header Bob proved during a header mismatch
+        bytes32[17] btc_headers; // MAX_SEARCH_ARITY + 1 boundaries and claimed hashes of the search
     }
     struct Aggreement{
         address alice;
@@ -82,7 +85,18 @@ contract AtomicSwap{
         uint256 id
     );
     event next_upload_hash(
-        uint256 id
+        uint256 id,
+        uint256 index
+    );
+    event c_state(
+        uint256 id,
+        ContractState state
+    );
+    event next_upload_hashes(
+        uint256 id,
+        uint256 left_index,
+        uint256 right_index,
+        uint256 segments
     );
 
     constructor(address _managmentAddress) public {
@@ -95,6 +109,40 @@ contract AtomicSwap{
         managmentContract.verifier_callback(_id, _honest_party);
     }
 
+    // every state change restarts the timeout of the verification
+    function set_state(uint32 _id, Verification storage v, ContractState _state) private{
+        v.state = _state;
+        v.current_height = uint64(block.number);
+        emit c_state(_id, _state);
+    }
+
+    /**
+     * Lets a party end the verification if the other party did not make its next move
+     * within TIMEOUT_BLOCKS blocks. The party that was waiting is declared honest.
+     *
+     * @param   _id         ID returned by create_contract to identify the referenced contract
+     */
+    function timeout(uint32 _id) public{
+        Verification storage v = verification[_id];
+        require(block.number >= v.current_height + TIMEOUT_BLOCKS);
+
+        address waiting_party;
+        if(v.state == ContractState.INITIALIZED || v.state == ContractState.SEARCHING
+           || v.state == ContractState.HEADER_MISMATCH || v.state == ContractState.MATCHING_HASHES){
+            // Bob has to move next
+            waiting_party = v.agreement.alice;
+        } else if(v.state == ContractState.VERIFYED_CONTRACT || v.state == ContractState.CONFIRM_HASH){
+            // Alice has to move next
+            waiting_party = v.agreement.bob;
+        } else {
+            revert();
+        }
+        require(msg.sender == waiting_party);
+
+        set_state(_id, v, ContractState.FINISHED);
+        publish_result(_id, waiting_party);
+    }
+
     function start_verification(address _alice, address _bob, uint32 _id, bytes32 _integrityCheck, bytes32 _block_count_hash) public{
 
         require(msg.sender == managmentAddress);
@@ -105,8 +153,7 @@ contract AtomicSwap{
         v.integrityCheck = _integrityCheck;
         v.block_count_hash = _block_count_hash;
 
-        v.current_height = block.number;
-        v.state = ContractState.INITIALIZED;
+        set_state(_id, v, ContractState.INITIALIZED);
     }
 
     function verify_agreement(uint32 _id, bytes8 _btc_price, bytes20 _btc_addr, bytes32 _btc_starting_hash, bytes32 _btc_hash_target, uint16 _mined_blocks, bytes32 _last_hash, bytes32 tx_hash)public returns(uint32){
@@ -122,33 +169,34 @@ contract AtomicSwap{
             v.agreement.btc_receive_addr = _btc_addr;
             v.agreement.btc_price = _btc_price;
             v.lower_bound_target_hash = _btc_hash_target;
-            v.btc_headers = new bytes32[](3);
-            v.bob_btc_headers = new bytes32[](7);
             v.mined_blocks = _mined_blocks;
-            v.btc_headers[0]= v.agreement.btc_starting_block_hash;
-            v.btc_headers[1]=0;
-            v.btc_headers[2]=_last_hash;
             v.last_hash=_last_hash;
             v.tx_hash = tx_hash;
-            v.current_height = block.number;
-
-            for(uint16 i=0; i < 7; i++){
-                v.bob_btc_headers[i]=0;
-            }
-
-            v.state = ContractState.VERIFYED_CONTRACT;
+            set_state(_id, v, ContractState.VERIFYED_CONTRACT);
         }else{
+            set_state(_id, v, ContractState.FINISHED);
             publish_result(_id, v.agreement.alice);
         }
 
     }
 
+    // proof-of-work target agreed in verify_agreement, so that Bob can check his headers before uploading them
+    function target_hash(uint32 _id) public view returns(bytes32){
+        return verification[_id].lower_bound_target_hash;
+    }
+
+    // range of the search for the first block of contention, Bob's headers start after left_index
+    function search_range(uint32 _id) public view returns(uint16 left_index, uint16 right_index){
+        Verification storage v = verification[_id];
+        return (v.left_index, v.right_index);
+    }
+
     // Alice agrees with Bob's claimed block hashes
     function hashes_ok(uint32 _id)public {
         Verification storage v = verification[_id];
         require(v.state == ContractState.VERIFYED_CONTRACT);
         require(msg.sender == v.agreement.alice);
-        v.state = ContractState.MATCHING_HASHES;
+        set_state(_id, v, ContractState.MATCHING_HASHES);
     }
 
     // Alice disagrees with Bob's claimed block hashes
@@ -159,46 +207,132 @@ contract AtomicSwap{
         v.right_index = v.mined_blocks;
         v.left_index = 0;
         v.mid_index = v.left_index + ((v.right_index - v.left_index) / 2);
+        v.search_arity = 0;
         v.btc_headers[0] = v.agreement.btc_starting_block_hash;
-        v.state = ContractState.SEARCHING;
-        emit next_upload_hash(v.mid_index);
+        v.btc_headers[2] = v.last_hash;
+        set_state(_id, v, ContractState.SEARCHING);
+        emit next_upload_hash(_id, v.mid_index);
     }
 
     function search_claim(uint32 _id, bytes32 _btc_block_hash) public {
         Verification storage v = verification[_id];
         require(v.state == ContractState.SEARCHING);
+        require(v.search_arity == 0);
         require(msg.sender == v.agreement.bob);
         v.btc_headers[1]=_btc_block_hash;
-        v.state = ContractState.CONFIRM_HASH;
+        set_state(_id, v, ContractState.CONFIRM_HASH);
     }
 
     function search_partition(uint32 _id, bool _search_right) public{
         Verification storage v = verification[_id];
 
         require(v.state == ContractState.CONFIRM_HASH);
+        require(v.search_arity == 0);
         require(msg.sender == v.agreement.alice);
 
-        v.search_right = _search_right;
-        if(v.search_right){
+        if(_search_right){
             v.left_index = v.mid_index;
             v.mid_index = v.left_index + ((v.right_index - v.left_index) / 2);
             v.btc_headers[0] = v.btc_headers[1];
-            v.state = ContractState.SEARCHING;
-            emit next_upload_hash(v.mid_index);
+            set_state(_id, v, ContractState.SEARCHING);
+            emit next_upload_hash(_id, v.mid_index);
         }else{
             v.right_index = v.mid_index;
             v.mid_index = v.left_index + ((v.right_index - v.left_index) / 2);
             v.btc_headers[2] = v.btc_headers[1];
-            v.state = ContractState.SEARCHING;
-            emit next_upload_hash(v.mid_index);
+            set_state(_id, v, ContractState.SEARCHING);
+            emit next_upload_hash(_id, v.mid_index);
         }
         if (v.left_index + 1 == v.right_index){
-            v.bob_current_resolving_header = 1;
-            // left should be the last block on which alice and bob agree
-            v.bob_btc_headers[0] = v.btc_headers[0];
-            v.state = ContractState.HEADER_MISMATCH;
-            emit c_header_mismatch(_id);
+            start_header_mismatch(_id, v);
+        }
+    }
+
+    function start_header_mismatch(uint32 _id, Verification storage v) private{
+        v.bob_current_resolving_header = 1;
+        // left should be the last block on which alice and bob agree
+        v.bob_last_header = v.btc_headers[0];
+        set_state(_id, v, ContractState.HEADER_MISMATCH);
+        emit c_header_mismatch(_id);
+    }
+
+    /**
+     * K-ary variant of the search for the first block of contention.
+     * In every round, Bob uploads the hashes of the blocks that split the current range
+     * into _arity segments and Alice names the first segment she disagrees with.
+     * This takes log_k(mined_blocks) instead of log_2(mined_blocks) rounds.
+     *
+     * @param   _id         ID returned by create_contract to identify the referenced contract
+     *
+     * @param   _arity      Number of segments per round, between 2 and MAX_SEARCH_ARITY
+     */
+    function search_start_kary(uint32 _id, uint8 _arity) public {
+        Verification storage v = verification[_id];
+        require(v.state == ContractState.VERIFYED_CONTRACT);
+        require(msg.sender == v.agreement.alice);
+        require(_arity >= 2 && _arity <= MAX_SEARCH_ARITY);
+        v.search_arity = _arity;
+        v.left_index = 0;
+        v.right_index = v.mined_blocks;
+        // btc_headers[0] holds the left boundary, btc_headers[_arity] the right boundary
+        // and the entries in between the hashes claimed by Bob
+        v.btc_headers[0] = v.agreement.btc_starting_block_hash;
+        v.btc_headers[_arity] = v.last_hash;
+        set_state(_id, v, ContractState.SEARCHING);
+        emit next_upload_hashes(_id, v.left_index, v.right_index, search_segments(v));
+    }
+
+    // Bob uploads the hashes of the blocks at segment_index(v, 1) to segment_index(v, segments - 1)
+    function search_claim_kary(uint32 _id, bytes32[] memory _btc_block_hashes) public {
+        Verification storage v = verification[_id];
+        require(v.state == ContractState.SEARCHING);
+        require(v.search_arity != 0);
+        require(msg.sender == v.agreement.bob);
+        require(_btc_block_hashes.length + 1 == search_segments(v));
+        for(uint i = 0; i < _btc_block_hashes.length; i++){
+            v.btc_headers[i + 1] = _btc_block_hashes[i];
         }
+        set_state(_id, v, ContractState.CONFIRM_HASH);
+    }
+
+    // Alice names the first segment that contains a block she disagrees with
+    function search_segment(uint32 _id, uint8 _segment) public{
+        Verification storage v = verification[_id];
+
+        require(v.state == ContractState.CONFIRM_HASH);
+        require(v.search_arity != 0);
+        require(msg.sender == v.agreement.alice);
+
+        uint segments = search_segments(v);
+        require(_segment < segments);
+
+        uint16 left_index = segment_index(v, segments, _segment);
+        uint16 right_index = segment_index(v, segments, _segment + 1);
+        if(_segment > 0){
+            v.btc_headers[0] = v.btc_headers[_segment];
+        }
+        if(_segment + 1 < segments){
+            v.btc_headers[v.search_arity] = v.btc_headers[_segment + 1];
+        }
+        v.left_index = left_index;
+        v.right_index = right_index;
+
+        if (left_index + 1 == right_index){
+            start_header_mismatch(_id, v);
+        } else {
+            set_state(_id, v, ContractState.SEARCHING);
+            emit next_upload_hashes(_id, left_index, right_index, search_segments(v));
+        }
+    }
+
+    // ranges shorter than the arity are split into segments of a single block
+    function search_segments(Verification storage v) private view returns(uint){
+        uint range = v.right_index - v.left_index;
+        return range < v.search_arity ? range : v.search_arity;
+    }
+
+    function segment_index(Verification storage v, uint segments, uint segment) private view returns(uint16){
+        return uint16(v.left_index + (uint(v.right_index - v.left_index) * segment) / segments);
     }
 
     function resolve_header_mismatch(uint32 _id, bytes4 _version, bytes32 _prev_block_hash, bytes32 _merkle_root, bytes4 _timestamp, bytes4 _difficulty, bytes4 _nonce) public{
@@ -212,26 +346,31 @@ contract AtomicSwap{
                 if(v.last_hash != uploaded_hash){
                     emit c_finished(4);
                     publish_result(_id, v.agreement.alice);
-                    v.state = ContractState.FINISHED;
+                    set_state(_id, v, ContractState.FINISHED);
+                    return;
                 }
             } else if(v.left_index + v.bob_current_resolving_header == v.mined_blocks - 6){
                 if(v.tx_hash != uploaded_hash){
                     emit c_finished(3);
                     publish_result(_id, v.agreement.alice);
-                    v.state = ContractState.FINISHED;
+                    set_state(_id, v, ContractState.FINISHED);
+                    return;
                 }
             }
 
-            if(verify_header(_id, v.bob_btc_headers, v.bob_current_resolving_header, uploaded_hash, _prev_block_hash ,v.lower_bound_target_hash)){
+            if(verify_header(_id, v.bob_current_resolving_header, uploaded_hash, _prev_block_hash ,v.lower_bound_target_hash)){
 
-                    v.bob_btc_headers[v.bob_current_resolving_header] = uploaded_hash;
+                    v.bob_last_header = uploaded_hash;
                     v.bob_current_resolving_header++;
 
                     // Bob verified 6 BTC headers following the contented block (or 6 BTC headers following the BTC transaction), ensuring that his chain is the real one
-                    if(v.bob_current_resolving_header == v.bob_btc_headers.length || v.left_index + v.bob_current_resolving_header == v.mined_blocks ){
+                    if(v.bob_current_resolving_header == CONFIRMATION_HEADERS || v.left_index + v.bob_current_resolving_header == v.mined_blocks ){
                         publish_result(_id, v.agreement.bob);
-                        v.state = ContractState.FINISHED;
+                        set_state(_id, v, ContractState.FINISHED);
                         emit c_finished(0);
+                    } else {
+                        // every accepted header restarts Alice's timeout
+                        set_state(_id, v, ContractState.HEADER_MISMATCH);
                     }
                     
                     emit c_finished(1);
@@ -239,16 +378,95 @@ contract AtomicSwap{
             } else {
                 // one of Bob claimed headers is wrong
                 publish_result(_id, v.agreement.alice);
-                v.state = ContractState.FINISHED;
+                set_state(_id, v, ContractState.FINISHED);
                 emit c_finished(2);
             }
     }
 
-    function verify_header(uint32 _id, bytes32[] storage btc_headers, uint16 index, bytes32 hash, bytes32 prev_block, bytes32 target_hash) private returns (bool verified){
+    /**
+     * Lets Bob upload all remaining block headers of a header mismatch in one transaction.
+     * The headers are hashed and linked in memory, and only the outcome (or the progress,
+     * if not all headers were uploaded) is written to storage.
+     *
+     * @param   _id         ID returned by create_contract to identify the referenced contract
+     *
+     * @param   _headers    Consecutive 80-byte Bitcoin block headers, serialized as in Bitcoin
+     */
+    function resolve_header_chain(uint32 _id, bytes memory _headers) public{
+        Verification storage v = verification[_id];
+        require(msg.sender == v.agreement.bob);
+        require(v.state == ContractState.HEADER_MISMATCH);
+        require(_headers.length > 0 && _headers.length % 80 == 0);
+
+        uint index = v.bob_current_resolving_header;
+        uint left_index = v.left_index;
+        uint mined_blocks = v.mined_blocks;
+        bytes32 prev_hash = v.bob_last_header;
+        bytes32 target_hash = v.lower_bound_target_hash;
+
+        for(uint offset = 0; offset < _headers.length; offset += 80){
+            bytes32 uploaded_hash = double_sha256(_headers, offset, 80);
+
+            if(left_index + index == mined_blocks && v.last_hash != uploaded_hash){
+                finish_header_mismatch(_id, v, v.agreement.alice, 4);
+                return;
+            }
+            if(left_index + index == mined_blocks - 6 && v.tx_hash != uploaded_hash){
+                finish_header_mismatch(_id, v, v.agreement.alice, 3);
+                return;
+            }
+            // one of Bob claimed headers is wrong
+            if(read_bytes32(_headers, offset + 4) != prev_hash || !is_hash_smaller(uploaded_hash, target_hash)){
+                finish_header_mismatch(_id, v, v.agreement.alice, 2);
+                return;
+            }
+
+            prev_hash = uploaded_hash;
+            index++;
+
+            // Bob verified 6 BTC headers following the contented block (or 6 BTC headers following the BTC transaction), ensuring that his chain is the real one
+            if(index == CONFIRMATION_HEADERS || left_index + index == mined_blocks){
+                finish_header_mismatch(_id, v, v.agreement.bob, 0);
+                return;
+            }
+        }
+
+        v.bob_last_header = prev_hash;
+        v.bob_current_resolving_header = uint16(index);
+        // every accepted batch of headers restarts Alice's timeout
+        set_state(_id, v, ContractState.HEADER_MISMATCH);
+        emit c_finished(1);
+    }
+
+    function finish_header_mismatch(uint32 _id, Verification storage v, address _honest_party, uint256 _code) private{
+        set_state(_id, v, ContractState.FINISHED);
+        publish_result(_id, _honest_party);
+        emit c_finished(_code);
+    }
+
+    // sha256(sha256(_data[_offset:_offset + _length])) without copying the input
+    function double_sha256(bytes memory _data, uint _offset, uint _length) private view returns(bytes32 hash){
+        require(_offset + _length <= _data.length);
+        assembly {
+            let scratch := mload(0x40)
+            if iszero(staticcall(gas, 2, add(add(_data, 32), _offset), _length, scratch, 32)) { revert(0, 0) }
+            if iszero(staticcall(gas, 2, scratch, 32, scratch, 32)) { revert(0, 0) }
+            hash := mload(scratch)
+        }
+    }
+
+    function read_bytes32(bytes memory _data, uint _offset) private pure returns(bytes32 value){
+        require(_offset + 32 <= _data.length);
+        assembly {
+            value := mload(add(add(_data, 32), _offset))
+        }
+    }
+
+    function verify_header(uint32 _id, uint16 index, bytes32 hash, bytes32 prev_block, bytes32 target_hash) private returns (bool verified){
 
         Verification storage v = verification[_id];
 
-        if( ( index!=0 && v.bob_btc_headers[index - 1] != prev_block) ){
+        if( ( index!=0 && v.bob_last_header != prev_block) ){
             return false;
         }
 
@@ -300,164 +518,137 @@ contract AtomicSwap{
      *
      * @param   _tx                         The transaction in the bitcoin chain
      *
-     * @param   _merkle_indices             A binary number (ie 0b101010), where each digit tells us if the hash from the _merkle_root_hashes
-     *                                      should be concatenated on the right or left side.
+     * @param   _merkle_indices             Position of the transaction in the block. Bit i tells whether the hash at level i of the
+     *                                      merkle branch is the left sibling (bit set) or the right sibling (bit not set), which
+     *                                      allows branches of up to 256 levels.
      *
      * @param   _merkle_root_hashes         The hashes of the branches from the merkle tree.
      */
-    function verify_tx(uint8 _id, bytes4 _version, bytes32 _prev_block_hash,
+    function verify_tx(uint32 _id, bytes4 _version, bytes32 _prev_block_hash,
         bytes32 _merkle_root, bytes4 _timestamp, bytes4 _difficulty,
-        bytes4 _nonce, bytes memory _tx, uint16 _merkle_indices, bytes32[] memory _merkle_root_hashes) public {
+        bytes4 _nonce, bytes memory _tx, uint256 _merkle_indices, bytes32[] memory _merkle_root_hashes) public {
 
         Verification storage v = verification[_id];
 
         require(msg.sender == v.agreement.bob);
         require(v.state == ContractState.MATCHING_HASHES);
 
-        bytes32 uploaded_hash = sha256(sha256(abi.encodePacked(_version, _prev_block_hash, _merkle_root, _timestamp, _difficulty, _nonce)));
+        bytes32 uploaded_hash = double_sha256(abi.encodePacked(_version, _prev_block_hash, _merkle_root, _timestamp, _difficulty, _nonce), 0, 80);
 
         if( uploaded_hash == v.tx_hash &&
-            execute_tx_verification(_id, _version, _prev_block_hash, _merkle_root, _timestamp, _difficulty,
-                                    _nonce,  _tx, _merkle_indices, _merkle_root_hashes)){
+            execute_tx_verification(_id, _merkle_root, _tx, _merkle_indices, _merkle_root_hashes)){
             publish_result(_id, v.agreement.bob);
             emit bytesEvent(1);
         }else{
             publish_result(_id, v.agreement.alice);
             emit bytesEvent(0);
         }
-        v.state = ContractState.FINISHED;
+        set_state(_id, v, ContractState.FINISHED);
     }
 
-    function execute_tx_verification ( uint8 _id, bytes4 _version, bytes32 _prev_block_hash,
-                                        bytes32 _merkle_root, bytes4 _timestamp, bytes4 _difficulty,
-                                        bytes4 _nonce, bytes memory _tx, uint16 _merkle_indices, bytes32[] memory _merkle_root_hashes )private returns(bool){
+    function execute_tx_verification(uint32 _id, bytes32 _merkle_root, bytes memory _tx, uint256 _merkle_indices,
+                                     bytes32[] memory _merkle_root_hashes) private view returns(bool){
 
         Verification storage v = verification[_id];
 
-        bytes32 tx_hash = sha256(sha256(_tx));
+        bytes32 tx_hash = double_sha256(_tx, 0, _tx.length);
 
         if(!verify_merkle_root(tx_hash, _merkle_root_hashes, _merkle_root, _merkle_indices)){
             return false;
         }
 
-        //emit c_debug(0,0,0,0);
-
         return verify_tx_content(_tx, v.agreement.btc_receive_addr, v.agreement.btc_price);
     }
 
-    // Verify if the tx has an output which transfers at least amount satsoshi to the given address
-    function verify_tx_content(bytes memory _tx, bytes20 btc_address, bytes8 amount)private returns (bool){
-        uint offset = 0;
-        offset += 4;
-        if(sha3(_tx[offset], _tx[offset + 1]) == sha3('0001')){
+    /**
+     * Checks whether the transaction has a P2SH output (OP_HASH160 <20 bytes> ...) that pays at least
+     * _amount satoshi to _btc_address. The 8 value bytes of an output are compared as a big-endian
+     * number with the bytes8 price of the agreement. Counts and script lengths are read as varints
+     * and every field is read with a single memory load.
+     */
+    function verify_tx_content(bytes memory _tx, bytes20 _btc_address, bytes8 _amount) private pure returns (bool){
+        uint offset = 4;
+        // segwit marker and flag
+        if(read_uint(_tx, 4, 2) == 0x0001){
             offset += 2;
         }
 
-        uint number_inputs = uint(_tx[offset]);
-        offset+=1;
-        while (number_inputs >=1){
-            offset += 36;
-            offset += 5 + uint(_tx[offset]);
-            number_inputs -= 1;
+        uint count;
+        uint length;
+        (count, offset) = read_varint(_tx, offset);
+        for(uint i = 0; i < count; i++){
+            (length, offset) = read_varint(_tx, offset + 36);
+            offset += length + 4;
         }
-        uint number_outputs = uint(_tx[offset]);
-        offset += 1;
-        while(number_outputs >= 1){
-            //lets check if amount is enough
-            bytes32 amount_candidate_bytes = hex"";
-
-            for(uint i = 0; i < 8; i++){
-                amount_candidate_bytes |= bytes32(_tx[offset + i] & 0xFF) >> ((24 + i) * 8);
-            }
 
-            offset += 8;
-
-            if (uint(amount_candidate_bytes) >= uint(amount)){
-                offset += 1;
-                bytes32 calculated_btc_address;
-                bytes20 hashed_pub_key_candidate;
-
-                if(sha3(_tx[offset]) == sha3(hex'76')){
-                    offset += 2;
-                    uint data_length = uint(_tx[offset]);
-                    offset += 1;
-
-                    hashed_pub_key_candidate = "";
-                    for ( i = 0; i < data_length; i++){
-                        hashed_pub_key_candidate |= bytes20(_tx[offset + i] & 0xFF) >> (( i + 1) * 8);
-                    }
-                    offset += data_length;
+        (count, offset) = read_varint(_tx, offset);
+        for(i = 0; i < count; i++){
+            uint value = read_uint(_tx, offset, 8);
+            (length, offset) = read_varint(_tx, offset + 8);
 
-                    calculated_btc_address = get_btc_address(hashed_pub_key_candidate, data_length);
-                    if(calculated_btc_address == btc_address){
-                        return true;
-                    }
-                }
-                else if(sha3(_tx[offset]) == sha3(hex'a9')){
-                    offset += 1;
-                    data_length = uint(_tx[offset]);
-                    offset += 1;
-
-                    hashed_pub_key_candidate = "";
-                    for ( i = 0; i < data_length; i++){
-                        hashed_pub_key_candidate |= bytes20(_tx[offset + i] & 0xFF) >> (( i) * 8);
-                    }
-                    offset += data_length;
-                    if(hashed_pub_key_candidate == btc_address){
-                        return true;
-                    }
-                }
+            if(value >= uint(uint64(_amount)) && length >= 22 && read_uint(_tx, offset, 2) == 0xa914
+               && read_uint(_tx, offset + 2, 20) == uint(uint160(_btc_address))){
+                return true;
             }
-            number_outputs --;
+            offset += length;
         }
 
         return false;
     }
 
-    function get_btc_address(bytes32 hashed_pub_key_candidate, uint data_length) private returns(bytes32){
-        uint rows;
-        uint cols;
-        bytes21 test_hash = bytes21(hashed_pub_key_candidate);
-        bytes32 checksum = sha256(sha256(test_hash));
-        bytes32 hashed_btc_address = hashed_pub_key_candidate;
-        for (uint i = 0; i < 4; i++){
-            hashed_btc_address |= bytes32(checksum[i] & 0xFF) >> ((data_length + 1 +i) * 8);
+    // reads _length <= 32 bytes at _offset as a big-endian number
+    function read_uint(bytes memory _data, uint _offset, uint _length) private pure returns(uint value){
+        require(_offset + _length <= _data.length);
+        assembly {
+            value := div(mload(add(add(_data, 32), _offset)), exp(256, sub(32, _length)))
         }
-        return hashed_btc_address;
-
     }
-    function verify_merkle_root(bytes32 tx_hash, bytes32[] memory hashes, bytes32 old_merkle_root, uint16 _indices)
-        private returns(bool verified){
-    bytes32 new_merkle_root = calc_merkle_root(tx_hash, hashes, _indices);
-    if (new_merkle_root == old_merkle_root){
-        return true;
-    }
-    return false;
-
-    }
-
-    function calc_merkle_root(bytes32 _tx_hash, bytes32[] memory _hashes, uint16 _indices) private returns(bytes32){
-        bytes32 current_hash = _tx_hash;
-
-
-        for (uint8 i = 0; i < _hashes.length; i++){
-            bool right = is_right(_indices, i);
-            if (right == false){
-                bytes32 new_hash = sha256(sha256(abi.encodePacked(_hashes[i], current_hash)));
-                current_hash = new_hash;
-            }
-
-            else if (right == true){
-                current_hash = sha256(sha256(abi.encodePacked(current_hash, _hashes[i])));
-            }
 
+    // reads a Bitcoin varint and returns its value and the offset following it
+    function read_varint(bytes memory _data, uint _offset) private pure returns(uint value, uint offset){
+        uint prefix = read_uint(_data, _offset, 1);
+        if(prefix < 0xfd){
+            return (prefix, _offset + 1);
         }
 
-        return current_hash;
+        uint size = prefix == 0xfd ? 2 : (prefix == 0xfe ? 4 : 8);
+        uint big_endian = read_uint(_data, _offset + 1, size);
+        for(uint i = 0; i < size; i++){
+            value = (value << 8) | ((big_endian >> (8 * i)) & 0xff);
+        }
+        return (value, _offset + 1 + size);
     }
 
-    function is_right(uint16 _number, uint8 _index) private returns(bool){
-        return ( _number & (uint16(1) << (15 - _index)) ) > 0;
+    function verify_merkle_root(bytes32 tx_hash, bytes32[] memory hashes, bytes32 old_merkle_root, uint256 _indices)
+        private view returns(bool verified){
+        return calc_merkle_root(tx_hash, hashes, _indices) == old_merkle_root;
+    }
 
+    // Hashes the branch bottom up. Both children of a level are written into the same
+    // 64-byte scratch buffer, which also receives the output of both sha256 calls.
+    function calc_merkle_root(bytes32 _tx_hash, bytes32[] memory _hashes, uint256 _indices) private view returns(bytes32 current_hash){
+        require(_hashes.length <= 256);
+        current_hash = _tx_hash;
+        assembly {
+            let scratch := mload(0x40)
+            let hash_ptr := add(_hashes, 32)
+            let end := add(hash_ptr, mul(mload(_hashes), 32))
+            let indices := _indices
+            for { } lt(hash_ptr, end) { hash_ptr := add(hash_ptr, 32) } {
+                switch and(indices, 1)
+                case 0 {
+                    mstore(scratch, current_hash)
+                    mstore(add(scratch, 32), mload(hash_ptr))
+                }
+                default {
+                    mstore(scratch, mload(hash_ptr))
+                    mstore(add(scratch, 32), current_hash)
+                }
+                if iszero(staticcall(gas, 2, scratch, 64, scratch, 32)) { revert(0, 0) }
+                if iszero(staticcall(gas, 2, scratch, 32, scratch, 32)) { revert(0, 0) }
+                current_hash := mload(scratch)
+                indices := div(indices, 2)
+            }
+        }
     }
 }
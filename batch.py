@@ -0,0 +1,101 @@
+from web3 import Web3
+
+from client import SECURITY_DEPOSIT
+
+# share of the block gas limit a single batch transaction may use
+BLOCK_GAS_SHARE = 0.9
+
+
+# Measures the fixed and the per-entry gas cost of a batch function by
+# estimating batches of one and two entries.
+def measure_batch_gas(build, items, params):
+    single = build(items[:1]).estimateGas(dict(params(1)))
+    if len(items) < 2:
+        return single, 0
+    double = build(items[:2]).estimateGas(dict(params(2)))
+    item_gas = max(double - single, 0)
+    return single - item_gas, item_gas
+
+
+# Splits items into chunks whose estimated gas stays below gas_limit.
+def plan_chunks(items, base_gas, item_gas, gas_limit):
+    if item_gas == 0:
+        return [list(items)] if items else []
+    size = int((gas_limit - base_gas) // item_gas)
+    if size < 1:
+        raise ValueError("a single batch entry needs more than {} gas".format(gas_limit))
+    return [list(items[i:i + size]) for i in range(0, len(items), size)]
+
+
+# Sends all chunks of a batch without waiting in between and returns the receipts in order.
+def send_batch(w3, build, items, params, gas_limit=None):
+    if not items:
+        return []
+    if gas_limit is None:
+        gas_limit = int(w3.eth.getBlock('latest')['gasLimit'] * BLOCK_GAS_SHARE)
+
+    base_gas, item_gas = measure_batch_gas(build, items, params)
+
+    tx_hashes = []
+    for chunk in plan_chunks(items, base_gas, item_gas, gas_limit):
+        # keep some headroom, since later entries can touch more storage than the measured ones
+        gas = min(int((base_gas + item_gas * len(chunk)) * 1.2), gas_limit)
+        tx_hashes.append(build(chunk).transact(dict(params(len(chunk)), gas=gas)))
+
+    receipts = []
+    for tx_hash in tx_hashes:
+        receipt = w3.eth.waitForTransactionReceipt(tx_hash)
+        if receipt['status'] == 0:
+            raise RuntimeError("batch transaction {} failed".format(Web3.toHex(tx_hash)))
+        receipts.append(receipt)
+    return receipts
+
+
+def trade_ids(mediator, receipts):
+    ids = []
+    for receipt in receipts:
+        for event in mediator.events.TradeID().processReceipt(receipt):
+            ids.append(event['args']['_id'])
+    return ids
+
+
+# Creates one trade per agreement hash and returns the trade ids. If reuse_ids
+# is given, the storage of these finished trades is reused.
+def create_trades(w3, mediator, alice, agreements, price, gas_price=None, reuse_ids=None, gas_limit=None):
+    if gas_price is None:
+        gas_price = w3.eth.gasPrice
+    value = price + SECURITY_DEPOSIT * gas_price
+
+    def params(count):
+        return {'from': alice, 'value': value * count, 'gasPrice': gas_price}
+
+    if reuse_ids is None:
+        build = lambda chunk: mediator.functions.create_batch(chunk)
+        items = list(agreements)
+    else:
+        build = lambda chunk: mediator.functions.create_batch([id for id, _ in chunk], [agreement for _, agreement in chunk])
+        items = list(zip(reuse_ids, agreements))
+
+    return trade_ids(mediator, send_batch(w3, build, items, params, gas_limit))
+
+
+def accept_trades(w3, mediator, bob, ids, gas_price=None, gas_limit=None):
+    if gas_price is None:
+        gas_price = w3.eth.gasPrice
+
+    def params(count):
+        return {'from': bob, 'value': SECURITY_DEPOSIT * gas_price * count, 'gasPrice': gas_price}
+
+    build = lambda chunk: mediator.functions.accept_batch(chunk)
+    return send_batch(w3, build, list(ids), params, gas_limit)
+
+
+def finish_trades(w3, mediator, alice, ids, gas_price=None, gas_limit=None):
+    if gas_price is None:
+        gas_price = w3.eth.gasPrice
+
+    def params(count):
+        return {'from': alice, 'gasPrice': gas_price}
+
+    build = lambda chunk: mediator.functions.finish_batch(chunk)
+    return send_batch(w3, build, list(ids), params, gas_limit)
@@ -0,0 +1,260 @@
+import argparse
+import contextlib
+import io
+import json
+import subprocess
+import sys
+import tempfile
+import time
+
+from web3 import Web3
+
+import trade
+from client import agreement_hash
+from deploy import compile_source_file, deploy_contract
+from slots import SlotPool
+
+BLOCK_GAS_LIMIT = 8000000
+MAX_MINED_BLOCKS = 2**16 - 1  # largest chain verify_agreement accepts
+
+# Mediator functions paid from a party's security deposit, all others are verifier calls
+# that have to be covered by the verification fee (worst_case_cost_atomic_swap).
+MEDIATOR_FUNCTIONS = ('create', 'accept', 'finish', 'abort', 'contest', 'init_verification', 'timeout')
+
+# functions whose gas is compared against a baseline run
+COMPARED_FUNCTIONS = ('create', 'accept', 'contest', 'init_verification', 'search_partition', 'verify_agreement', 'finish')
+
+SCENARIOS = (
+    ('1', trade.scenario_1),
+    ('2.1', trade.scenario_2_1),
+    ('2.2', trade.scenario_2_2),
+    ('3', trade.scenario_3),
+)
+
+
+# in-process chain, no node required
+def tester_web3(gas_limit=BLOCK_GAS_LIMIT):
+    from eth_tester import EthereumTester, PyEVMBackend
+    from web3 import EthereumTesterProvider
+
+    genesis = PyEVMBackend.generate_genesis_params(overrides={'gas_limit': gas_limit})
+    w3 = Web3( EthereumTesterProvider(EthereumTester(PyEVMBackend(genesis_parameters=genesis))) )
+    w3.eth.defaultAccount = w3.eth.accounts[0]
+    return w3
+
+
+def deploy(w3):
+    bytecode, abi = compile_source_file('.', 'mediator.sol')
+    mediator = w3.eth.contract( address=deploy_contract(w3, bytecode, abi), abi=abi)
+
+    bytecode, abi = compile_source_file('.', 'atomicswap.sol')
+    verifier = w3.eth.contract( address=deploy_contract(w3, bytecode, abi, params=mediator.address), abi=abi)
+    return mediator, verifier
+
+
+def summarize(name, trace, elapsed, alice, bob):
+    parties = {alice: 'alice', bob: 'bob'}
+    result = {
+        'scenario': name,
+        'time': elapsed,
+        'transactions': len(trace),
+        'gas': 0,
+        'functions': {},
+        'mediator_gas': {'alice': 0, 'bob': 0},
+        'verifier_gas': {'alice': 0, 'bob': 0},
+    }
+    for function, sender, receipt in trace:
+        gas = receipt['gasUsed']
+        result['gas'] += gas
+        calls = result['functions'].setdefault(function, {'calls': 0, 'gas': 0, 'max': 0})
+        calls['calls'] += 1
+        calls['gas'] += gas
+        calls['max'] = max(calls['max'], gas)
+        key = 'mediator_gas' if function in MEDIATOR_FUNCTIONS else 'verifier_gas'
+        result[key][parties[sender]] += gas
+    return result
+
+
+# returns the violated limits of a path, the deposits only cover a single party's share
+def check(result):
+    failures = []
+    for party in ('alice', 'bob'):
+        if result['mediator_gas'][party] > trade.SECURITY_DEPOSIT:
+            failures.append("scenario {}: {} spends {} gas in the mediator, SECURITY_DEPOSIT is {}".format(
+                result['scenario'], party, result['mediator_gas'][party], trade.SECURITY_DEPOSIT))
+        if result['verifier_gas'][party] > trade.worst_case_cost_atomic_swap:
+            failures.append("scenario {}: {} spends {} gas in the verifier, worst_case_cost_atomic_swap is {}".format(
+                result['scenario'], party, result['verifier_gas'][party], trade.worst_case_cost_atomic_swap))
+    return failures
+
+
+def run(w3, quiet=True, slot_trades=5, mined_blocks=MAX_MINED_BLOCKS):
+    alice = w3.eth.accounts[0]
+    bob = w3.eth.accounts[1]
+    mediator, verifier = deploy(w3)
+
+    results = []
+    out = io.StringIO() if quiet else sys.stdout
+    with contextlib.redirect_stdout(out):
+        verifier_id = trade.register_verifier(w3, mediator, verifier, alice)
+        trade_id = None
+        for name, scenario in SCENARIOS:
+            trace = []
+            start = time.time()
+            if trade_id is None:
+                trade_id = scenario(w3, mediator, verifier, alice, bob, verifier_id, trace)
+            else:
+                # the dispute paths reuse the storage of the finished honest trade
+                scenario(w3, mediator, verifier, alice, bob, verifier_id, trade_id, trace)
+            results.append(summarize(name, trace, time.time() - start, alice, bob))
+        slots = measure_slot_reuse(w3, mediator, alice, bob, verifier_id, slot_trades)
+        if mined_blocks:
+            results += run_worst_case(w3, mediator, verifier, alice, bob, mined_blocks)
+    return results, slots
+
+
+# The example chain of trade.py has 20 blocks, so its scenarios cannot reach the worst-case
+# gas. These paths of profile_verifier.py search the largest possible chain (binary and
+# 16-ary) and verify a transaction at the deepest Merkle branch.
+def run_worst_case(w3, mediator, verifier, alice, bob, mined_blocks):
+    from profile_verifier import MERKLE_DEPTH, Profiler  # profile_verifier imports this module
+
+    profiler = Profiler(w3, mediator, verifier, alice, bob)
+    parties = {'alice': alice, 'bob': bob}
+    paths = (
+        ('binary_search', lambda: profiler.binary_search(mined_blocks)),
+        ('kary_search_16', lambda: profiler.kary_search(mined_blocks, 16)),
+        ('spv', lambda: profiler.spv(MERKLE_DEPTH, 1, 2)),
+    )
+    results = []
+    for name, replay in paths:
+        first = len(profiler.records)
+        start = time.time()
+        replay()
+        elapsed = time.time() - start
+        trace = [(function, parties[party], {'gasUsed': gas}) for _, function, party, gas, _ in profiler.records[first:]]
+        results.append(summarize("worst case {} ({} blocks)".format(name, mined_blocks), trace, elapsed, alice, bob))
+    return results
+
+
+# Gas of create(bytes32) compared with create(id, bytes32) on slots recycled by a SlotPool:
+# count trades are created in fresh slots and finished, then count more take their place.
+def measure_slot_reuse(w3, mediator, alice, bob, verifier_id, count=5):
+    security_deposit = trade.SECURITY_DEPOSIT * w3.eth.gasPrice
+    # only the trades of this measurement, the finished trade of the scenarios would be reused
+    pool = SlotPool(w3, mediator, start_block=w3.eth.blockNumber + 1)
+    agreements = [agreement_hash(verifier_id, Web3.soliditySha3(['uint256'], [i])) for i in range(2 * count)]
+
+    fresh, reused, trade_ids = [], [], []
+
+    def run_trades(agreements):
+        pool.sync()
+        for agreement in agreements:
+            value = trade.eth_price + security_deposit
+            trade_id = pool.acquire(alice)
+            if trade_id is None:
+                receipt = trade.transact(w3, mediator.functions.create(agreement), {'from': alice, 'value': value})
+                trade_id = mediator.events.TradeID().processReceipt(receipt)[0]['args']['_id']
+                fresh.append(receipt['gasUsed'])
+            else:
+                receipt = trade.transact(w3, mediator.functions.create(trade_id, agreement), {'from': alice, 'value': value})
+                reused.append(receipt['gasUsed'])
+            trade.transact(w3, mediator.functions.accept(trade_id), {'from': bob, 'value': security_deposit})
+            trade_ids.append(trade_id)
+
+    run_trades(agreements[:count])
+    for trade_id in trade_ids:
+        trade.transact(w3, mediator.functions.finish(trade_id), {'from': alice})
+    run_trades(agreements[count:])
+
+    fresh_gas = sum(fresh) // len(fresh)
+    reused_gas = sum(reused) // len(reused)
+    return {'create': fresh_gas, 'create_reused': reused_gas, 'saved_per_create': fresh_gas - reused_gas}
+
+
+# average gas per call of every function over the scenarios of trade.py
+def function_gas(results):
+    scenarios = [name for name, _ in SCENARIOS]
+    calls = {}
+    for result in results:
+        if result['scenario'] not in scenarios:
+            continue
+        for function, stats in result['functions'].items():
+            total = calls.setdefault(function, [0, 0])
+            total[0] += stats['calls']
+            total[1] += stats['gas']
+    return {function: gas // count for function, (count, gas) in calls.items()}
+
+
+# compares the average gas per call with a baseline written by --json, e.g. on an older commit
+def compare_baseline(results, baseline):
+    before = function_gas(baseline['results'])
+    after = function_gas(results)
+    rows = []
+    for function in COMPARED_FUNCTIONS:
+        if function in before and function in after:
+            rows.append({'function': function, 'before': before[function], 'after': after[function],
+                         'saved': before[function] - after[function]})
+    return rows
+
+
+# runs the benchmark of another commit in a temporary git worktree and returns its --json output
+def run_baseline(rev):
+    path = tempfile.mkdtemp(prefix="benchmark-")
+    subprocess.check_call(["git", "worktree", "add", "--detach", path, rev])
+    try:
+        # a failing check of the old commit still prints its results
+        process = subprocess.run([sys.executable, "benchmark.py", "--json"], cwd=path, stdout=subprocess.PIPE)
+        if not process.stdout.strip():
+            raise RuntimeError("benchmark of {} exited with {} and printed no results".format(rev, process.returncode))
+        return json.loads(process.stdout.decode())
+    finally:
+        subprocess.check_call(["git", "worktree", "remove", "--force", path])
+
+
+def print_results(results):
+    for result in results:
+        print("Scenario {}: {} transactions, {} gas, {:.2f}s".format(
+            result['scenario'], result['transactions'], result['gas'], result['time']))
+        for function, calls in sorted(result['functions'].items()):
+            print("    {:<22} {:>3} calls {:>9} gas (max {})".format(function, calls['calls'], calls['gas'], calls['max']))
+        for party in ('alice', 'bob'):
+            print("    {:<22} mediator {:>9} gas, verifier {:>9} gas".format(
+                party, result['mediator_gas'][party], result['verifier_gas'][party]))
+        print("")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Measure gas and time of every trade path on an in-process chain.")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    parser.add_argument('--verbose', action='store_true', help="show the output of the scenarios")
+    parser.add_argument('--gas-limit', type=int, default=BLOCK_GAS_LIMIT)
+    parser.add_argument('--baseline', help="JSON output of an earlier run to compare the gas per function with")
+    parser.add_argument('--baseline-rev', help="git revision to run the baseline on, e.g. 38a2129^ for the storage layout change")
+    parser.add_argument('--mined-blocks', type=int, default=MAX_MINED_BLOCKS, help="chain length of the worst-case paths, 0 to skip them")
+    args = parser.parse_args()
+
+    results, slots = run(tester_web3(args.gas_limit), quiet=not args.verbose, mined_blocks=args.mined_blocks)
+    failures = [failure for result in results for failure in check(result)]
+
+    comparison = None
+    if args.baseline_rev:
+        comparison = compare_baseline(results, run_baseline(args.baseline_rev))
+    elif args.baseline:
+        f = open(args.baseline, "r")
+        comparison = compare_baseline(results, json.load(f))
+        f.close()
+
+    if args.json:
+        print(json.dumps({'results': results, 'slots': slots, 'comparison': comparison, 'failures': failures}, indent=2))
+    else:
+        print_results(results)
+        print("create(bytes32): {} gas, create(id, bytes32) on a recycled slot: {} gas, saved {} gas per create\n".format(
+            slots['create'], slots['create_reused'], slots['saved_per_create']))
+        for row in comparison or []:
+            print("{:<22} {:>9} -> {:>9} gas ({:+d})".format(row['function'], row['before'], row['after'], -row['saved']))
+        for failure in failures:
+            print("FAIL " + failure)
+
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,38 @@
+import hashlib
+
+HEADER_SIZE = 80
+
+
+def double_sha256(data):
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+
+# Serializes a block header as in Bitcoin. Hashes are given as displayed by
+# block explorers (big-endian), all integers are written little-endian.
+def pack_header(version, prev_block_hash, merkle_root, timestamp, bits, nonce):
+    return (version.to_bytes(4, 'little')
+            + prev_block_hash.to_bytes(32, 'little')
+            + merkle_root.to_bytes(32, 'little')
+            + timestamp.to_bytes(4, 'little')
+            + bits.to_bytes(4, 'little')
+            + nonce.to_bytes(4, 'little'))
+
+
+# Hash of a serialized header in internal byte order, as computed by the verifier.
+def header_hash(header):
+    return double_sha256(header)
+
+
+def prev_block_hash(header):
+    return header[4:36]
+
+
+# Concatenates serialized headers into the payload of AtomicSwap.resolve_header_chain.
+def pack_headers(headers):
+    headers = [bytes(header) for header in headers]
+    for i, header in enumerate(headers):
+        if len(header) != HEADER_SIZE:
+            raise ValueError("header {} has {} bytes instead of {}".format(i, len(header), HEADER_SIZE))
+        if i > 0 and prev_block_hash(header) != header_hash(headers[i - 1]):
+            raise ValueError("header {} does not extend header {}".format(i, i - 1))
+    return b''.join(headers)
@@ -0,0 +1,305 @@
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from enum import IntEnum
+
+from web3 import Web3, HTTPProvider
+
+from manifest import MANIFEST_FILE, load_manifest
+from metrics import MetricsServer, Tracer, perf_time
+from receipts import ReceiptResolver
+
+
+SECURITY_DEPOSIT = 400000  # has to match Mediator.SECURITY_DEPOSIT
+RECOVER_INTERVAL = 10  # seconds between two recoveries of the transaction pipeline
+RECEIPT_TIMEOUT = 600  # seconds a trade waits for a receipt before the step fails
+
+# mirrors Mediator.ContractState
+class ContractState(IntEnum):
+    CREATED = 0
+    ACCEPTED = 1
+    REVEALED = 2
+    CONTENDED = 3
+    WAITING = 4
+    FINISHED = 5
+
+
+# lifecycle in which both parties remain honest
+HONEST = ('create', 'accept', 'finish')
+
+
+class TradeError(Exception):
+    pass
+
+
+# errors of a call that reverts: TradeError if it was mined, the ContractLogicError (a ValueError)
+# or JSON-RPC error of the gas estimate, or TransactionFailed with eth-tester
+REVERTED = (TradeError, ValueError)
+try:
+    from eth_tester.exceptions import TransactionFailed
+    REVERTED += (TransactionFailed,)
+except ImportError:
+    pass
+
+
+def agreement_hash(verifier_id, trade_conditions):
+    return Web3.soliditySha3(['uint32', 'bytes32'], [verifier_id, trade_conditions])
+
+
+class Trade:
+    """
+    State of a single trade as seen by the client. Every trade is driven
+    independently through its steps, so many of them can be in flight at once.
+    """
+
+    def __init__(self, alice, bob, agreement, price, trade_id=None, steps=HONEST):
+        self.alice = alice
+        self.bob = bob
+        self.agreement = agreement
+        self.price = price
+        self.id = trade_id
+        self.steps = steps
+        self.state = None
+        self.receipts = {}
+        self.error = None
+
+        # only needed for contested trades
+        self.witness = None
+        self.verifier_id = None
+        self.verifier_cost = None
+        self.trade_conditions = None
+
+    def __repr__(self):
+        state = self.state.name if self.state is not None else None
+        return "Trade(id={}, state={})".format(self.id, state)
+
+
+class TradeClient:
+    """
+    Drives many trades concurrently against the mediator. Every blocking web3
+    call runs on a shared thread pool, so all trades share one provider, and
+    the receipts of all trades are resolved by a single ReceiptResolver that
+    follows the chain. If a TransactionPipeline is given, transactions are
+    signed locally instead of by the node (and its nonce gaps and dropped
+    transactions are recovered while trades run), and with a SlotPool new trades
+    reuse the storage of finished ones. A Tracer records a span per call.
+    """
+
+    def __init__(self, w3, mediator, verifier=None, gas_price=None,
+                 max_workers=64, poll_interval=0.5, concurrency=None, pipeline=None,
+                 receipt_timeout=RECEIPT_TIMEOUT, confirmations=0, slots=None, tracer=None, recover_interval=RECOVER_INTERVAL):
+        self.w3 = w3
+        self.mediator = mediator
+        self.verifier = verifier
+        self.gas_price = gas_price if gas_price is not None else w3.eth.gasPrice
+        self.poll_interval = poll_interval
+        self.concurrency = concurrency
+        self.pipeline = pipeline
+        self.slots = slots
+        self.tracer = tracer if tracer is not None else Tracer(enabled=False)
+        self.recover_interval = recover_interval
+        self.executor = ThreadPoolExecutor(max_workers)
+        self.resolver = ReceiptResolver(w3, self.call, poll_interval, receipt_timeout, confirmations)
+
+    # the mediator derives deposits from tx.gasprice, so every transaction of
+    # the client uses the same gas price
+    @property
+    def security_deposit(self):
+        return SECURITY_DEPOSIT * self.gas_price
+
+    async def call(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    async def wait_for_receipt(self, tx_hash):
+        return await self.resolver.wait(tx_hash)
+
+    # Sends a call and waits for its receipt. The span of the call splits the time
+    # into preparation (building the call and estimating its gas), signing, submission,
+    # waiting in the mempool until the timestamp of the including block, and waiting
+    # for the receipt after that.
+    async def transact(self, trade, name, function, params):
+        span = self.tracer.start(trade.id, name)
+        head = self.resolver.head
+        params = dict(params, gasPrice=self.gas_price)
+        receipt = None
+        try:
+            if self.pipeline is not None:
+                account, transaction = await self.call(self.pipeline.prepare, function, params)
+                span.mark('prepare')
+                signed = await self.call(self.pipeline.sign_transaction, account, transaction)
+                span.mark('sign')
+                tx_hash = await self.call(self.pipeline.send_signed, signed, name)
+            else:
+                # the node signs the call, so only the gas estimate is prepared here
+                if 'gas' not in params:
+                    params['gas'] = await self.call(function.estimateGas, params)
+                span.mark('prepare')
+                tx_hash = await self.call(function.transact, params)
+            span.mark('submit')
+            receipt = await self.wait_for_receipt(tx_hash)
+            inclusion = self.resolver.included.get(bytes(tx_hash))
+            if inclusion is not None:
+                span.mark('mempool', perf_time(inclusion.timestamp))
+            span.mark('receipt')
+        except Exception as e:
+            self.tracer.finish(span, error=e)
+            raise
+
+        # a new trade gets its id with the receipt of create
+        if trade.id is None and receipt['status'] == 1:
+            trade.id = self.mediator.events.TradeID().processReceipt(receipt)[0]['args']['_id']
+            span.trade_id = trade.id
+        self.tracer.finish(span, receipt, head)
+
+        trade.receipts[name] = receipt
+        if receipt['status'] == 0:
+            raise TradeError("{} of trade {} failed in transaction {}".format(
+                name, trade.id, Web3.toHex(tx_hash)))
+        return receipt
+
+    async def create(self, trade):
+        value = trade.price + self.security_deposit
+        if trade.id is None and self.slots is not None:
+            trade.id = self.slots.acquire(trade.alice)
+            if trade.id is not None:
+                try:
+                    await self.transact(trade, 'create', self.mediator.functions.create(trade.id, trade.agreement),
+                                        {'from': trade.alice, 'value': value})
+                except REVERTED:
+                    # the slot was taken in the meantime, fall back to a new one
+                    self.slots.cancel(trade.id)
+                    trade.id = None
+                except Exception:
+                    self.slots.cancel(trade.id)
+                    raise
+                else:
+                    trade.state = ContractState.CREATED
+                    return
+
+        if trade.id is None:
+            function = self.mediator.functions.create(trade.agreement)
+        else:
+            # reuse the storage of a finished trade
+            function = self.mediator.functions.create(trade.id, trade.agreement)
+
+        await self.transact(trade, 'create', function, {'from': trade.alice, 'value': value})
+        trade.state = ContractState.CREATED
+
+    async def accept(self, trade):
+        function = self.mediator.functions.accept(trade.id)
+        await self.transact(trade, 'accept', function, {'from': trade.bob, 'value': self.security_deposit})
+        trade.state = ContractState.ACCEPTED
+
+    async def finish(self, trade):
+        function = self.mediator.functions.finish(trade.id)
+        await self.transact(trade, 'finish', function, {'from': trade.alice})
+        trade.state = ContractState.FINISHED
+        self.release(trade)
+
+    async def abort(self, trade):
+        function = self.mediator.functions.abort(trade.id)
+        await self.transact(trade, 'abort', function, {'from': trade.alice})
+        trade.state = ContractState.FINISHED
+        self.release(trade)
+
+    def release(self, trade):
+        if self.slots is not None:
+            self.slots.release(trade.alice, trade.id)
+
+    async def contest(self, trade):
+        function = self.mediator.functions.contest(trade.id, trade.witness)
+        value = self.gas_price * trade.verifier_cost
+        await self.transact(trade, 'contest', function, {'from': trade.bob, 'value': value})
+        trade.state = ContractState.CONTENDED
+
+    async def init_verification(self, trade):
+        function = self.mediator.functions.init_verification(trade.id, trade.verifier_id, trade.trade_conditions)
+        value = self.gas_price * trade.verifier_cost
+        await self.transact(trade, 'init_verification', function, {'from': trade.alice, 'value': value})
+        trade.state = ContractState.WAITING
+
+    async def run_trade(self, trade, semaphore=None):
+        try:
+            if semaphore is not None:
+                async with semaphore:
+                    await self._run_steps(trade)
+            else:
+                await self._run_steps(trade)
+        except Exception as e:
+            trade.error = e
+        return trade
+
+    async def _run_steps(self, trade):
+        for step in trade.steps:
+            await getattr(self, step)(trade)
+
+    # fills nonce gaps and rebroadcasts dropped transactions of the pipeline
+    async def recover(self):
+        while True:
+            await asyncio.sleep(self.recover_interval)
+            try:
+                await self.call(self.pipeline.recover)
+            except Exception:
+                pass  # the node may be unavailable for a moment, the next round tries again
+
+    async def run_trades(self, trades):
+        semaphore = asyncio.Semaphore(self.concurrency) if self.concurrency else None
+        self.resolver.start()
+        recovery = asyncio.ensure_future(self.recover()) if self.pipeline is not None else None
+        try:
+            return await asyncio.gather(*[self.run_trade(trade, semaphore) for trade in trades])
+        finally:
+            if recovery is not None:
+                recovery.cancel()
+            await self.resolver.stop()
+
+    def run(self, trades):
+        return asyncio.run(self.run_trades(trades))
+
+
+# Contracts come from the manifest written by deploy.py; the loose *.abi and *.addr
+# files of older deployments are still read if there is no manifest.
+def load_contract(w3, name):
+    if os.path.exists(MANIFEST_FILE):
+        return load_manifest().contract(w3, name)
+    f = open("./{}.abi".format(name), "r")
+    abi = json.load(f)
+    f.close()
+    f = open("./{}.addr".format(name), "r")
+    address = f.read()
+    f.close()
+    return w3.eth.contract(address=address, abi=abi)
+
+
+if __name__ == "__main__":
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    w3 = Web3( HTTPProvider("http://127.0.0.1:8545") )
+
+    alice = w3.eth.accounts[0]
+    bob = w3.eth.accounts[1]
+
+    mediator = load_contract(w3, "mediator")
+    verifier = load_contract(w3, "atomic-swap-verifier")
+
+    tracer = Tracer()
+    host, port = MetricsServer(tracer).start()
+    print("Serving metrics on http://{}:{}/metrics".format(host, port))
+
+    client = TradeClient(w3, mediator, verifier, tracer=tracer)
+
+    trades = []
+    for i in range(count):
+        trade_conditions = Web3.soliditySha3(['uint256'], [i])
+        trades.append(Trade(alice, bob, agreement_hash(0, trade_conditions), 1000000000000000))
+
+    client.run(trades)
+
+    failed = [trade for trade in trades if trade.error is not None]
+    print("Finished {} of {} trades".format(len(trades) - len(failed), len(trades)))
+    for trade in failed:
+        print("{}: {}".format(trade, trade.error))
@@ -1,30 +1,97 @@
+import argparse
+import hashlib
 import json
 import os
+import re
 
+import rlp
+from eth_utils import keccak, to_bytes, to_checksum_address
 from web3 import Web3, HTTPProvider
 
-from solcx import install_solc, set_solc_version
-install_solc('v0.4.26')
-set_solc_version('v0.4.26')
-
-from solcx import compile_standard
+from manifest import MANIFEST_FILE, write_manifest
+
+SOLC_VERSION = 'v0.4.26'
+CACHE_DIR = '.solc-cache'
+VERIFIER_COST = 1343000  # worst_case_cost_atomic_swap in trade.py, not yet confirmed by a run of profile_verifier.py
+REGISTER_GAS = 100000
+
+solc_ready = False
+
+# installing and selecting the compiler takes seconds, so it only happens once a source has to be compiled
+def setup_solc():
+    global solc_ready
+    if not solc_ready:
+        from solcx import install_solc, set_solc_version
+        install_solc(SOLC_VERSION)
+        set_solc_version(SOLC_VERSION)
+        solc_ready = True
+
+# hashes a source file together with every file it imports
+def source_hashes(file_path, name, hashes=None):
+    if hashes is None:
+        hashes = {}
+    if name in hashes:
+        return hashes
+
+    f = open(os.path.join(file_path, name), "rb")
+    source = f.read()
+    f.close()
+
+    hashes[name] = hashlib.sha256(source).hexdigest()
+    for imported in re.findall(rb'^\s*import\s[^"\']*["\']([^"\']+)["\']', source, re.M):
+        source_hashes(file_path, imported.decode(), hashes)
+    return hashes
+
+def cache_key(file_path, name, output_selection):
+    key = {
+        'solc': SOLC_VERSION,
+        'sources': source_hashes(file_path, name),
+        'outputSelection': output_selection,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+def load_cached(key):
+    try:
+        f = open(os.path.join(CACHE_DIR, key + ".json"), "r")
+    except FileNotFoundError:
+        return None
+    artifact = json.load(f)
+    f.close()
+    return artifact["bytecode"], artifact["abi"]
+
+def store_cached(key, bytecode, abi):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = os.path.join(CACHE_DIR, key + ".json")
+    f = open(path + ".tmp", "w")
+    json.dump({'bytecode': bytecode, 'abi': abi}, f)
+    f.close()
+    os.replace(path + ".tmp", path)
 
 def compile_source_file(file_path, name):
 
+    output_selection = {
+        '*': {
+            '*': ["metadata", "evm.bytecode", "evm.bytecode.sourceMap"],
+        },
+            'def': {name: [ "abi", "evm.bytecode.opcodes" ]},
+    }
+
+    key = cache_key(file_path, name, output_selection)
+    cached = load_cached(key)
+    if cached is not None:
+        return cached
+
     input = {
         'language': 'Solidity',
         'sources' : {
             name: {'urls': [file_path+"/"+name]}},
         'settings':{
-            'outputSelection': {
-                '*': {
-                    '*': ["metadata", "evm.bytecode", "evm.bytecode.sourceMap"],
-                },
-                    'def': {name: [ "abi", "evm.bytecode.opcodes" ]},
-            }
+            'outputSelection': output_selection
             }
     }
 
+    setup_solc()
+    from solcx import compile_standard
     output = compile_standard(input, allow_paths=file_path)
 
     contracts = output["contracts"]
@@ -35,6 +102,7 @@ def compile_source_file(file_path, name):
     metadata = json.loads(metadata)
     abi = metadata["output"]["abi"]
 
+    store_cached(key, bytecode, abi)
     return bytecode, abi
 
 
@@ -50,35 +118,79 @@ def deploy_contract(w3, bytecode, abi, params=None):
     address = receipt['contractAddress']
     return address
 
-w3 = Web3( HTTPProvider("http://127.0.0.1:8545") )
-
-w3.eth.defaultAccount = w3.eth.accounts[0]
-
-# deploy mediator contract
-bytecode, abi = compile_source_file('.', 'mediator.sol')
-
-address = deploy_contract(w3, bytecode, abi)
-print("Deployed mediator smart contract to: {0}".format(address))
-
-
-f = open("mediator.abi", "w")
-json.dump(abi, f)
-f.close()
-
-f = open("mediator.addr", "w")
-f.write(address)
-f.close()
-
-#deploy atomic swap verifier contract
-bytecode, abi = compile_source_file('.', 'atomicswap.sol')
-
-address = deploy_contract(w3, bytecode, abi, params=address)
-print("Deployed atomic swap verifier to: {0}".format( address))
-
-f = open("atomic-swap-verifier.abi", "w")
-json.dump(abi, f)
-f.close()
-
-f = open("atomic-swap-verifier.addr", "w")
-f.write(address)
-f.close()
\ No newline at end of file
+# address of the contract created by the transaction of sender with the given nonce
+def contract_address(sender, nonce):
+    return to_checksum_address(keccak(rlp.encode([to_bytes(hexstr=sender), nonce]))[12:])
+
+# Deploys the mediator and every verifier and registers the verifiers. The addresses follow
+# from the deployer's nonces, so all transactions are submitted back to back without waiting
+# for the previous ones to be mined. verifiers maps names to (source file, verifier cost).
+def deploy_all(w3, verifiers, deployer=None, file_path='.'):
+    deployer = deployer or w3.eth.defaultAccount
+    sources = ['mediator.sol'] + sorted(set(source for source, _ in verifiers.values()))
+    compiled = dict((source, compile_source_file(file_path, source)) for source in sources)
+
+    nonce = w3.eth.getTransactionCount(deployer, 'pending')
+    mediator_address = contract_address(deployer, nonce)
+    bytecode, abi = compiled['mediator.sol']
+    submitted = [(w3.eth.contract(abi=abi, bytecode=bytecode).constructor().transact({'from': deployer}), mediator_address)]
+    mediator = w3.eth.contract(address=mediator_address, abi=abi)
+
+    names = list(verifiers)
+    addresses = {}
+    for i, name in enumerate(names):
+        addresses[name] = contract_address(deployer, nonce + 1 + i)
+        bytecode, abi = compiled[verifiers[name][0]]
+        tx_hash = w3.eth.contract(abi=abi, bytecode=bytecode).constructor(mediator_address).transact({'from': deployer})
+        submitted.append((tx_hash, addresses[name]))
+
+    # the mediator is not mined yet, so the gas of register_verifier cannot be estimated
+    registrations = []
+    for name in names:
+        function = mediator.functions.register_verifier(addresses[name], verifiers[name][1])
+        registrations.append(function.transact({'from': deployer, 'gas': REGISTER_GAS}))
+
+    for tx_hash, address in submitted:
+        receipt = w3.eth.waitForTransactionReceipt(tx_hash)
+        if receipt['status'] == 0 or receipt['contractAddress'] != address:
+            raise RuntimeError("deployment of {} failed".format(address))
+
+    abis = {'mediator': compiled['mediator.sol'][1]}
+    contracts = {'mediator': {'address': mediator_address, 'abi': 'mediator'}}
+    for name, tx_hash in zip(names, registrations):
+        receipt = w3.eth.waitForTransactionReceipt(tx_hash)
+        events = mediator.events.RegisteredVerifer().processReceipt(receipt)
+        if receipt['status'] == 0 or not events:
+            raise RuntimeError("registration of {} failed".format(name))
+        source, cost = verifiers[name]
+        abis[source] = compiled[source][1]
+        contracts[name] = {'address': addresses[name], 'abi': source, 'verifier_id': events[0]['args']['_id'], 'verifier_cost': cost}
+    return abis, contracts
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Deploy the mediator and the verifiers and register the verifiers.")
+    parser.add_argument('--verifier', action='append', metavar="NAME=SOURCE[:COST]",
+                        help="verifier to deploy, may be repeated (default: atomic-swap-verifier=atomicswap.sol)")
+    parser.add_argument('--verifier-cost', type=int, default=VERIFIER_COST, help="cost of verifiers that do not name their own")
+    parser.add_argument('--manifest', default=MANIFEST_FILE)
+    args = parser.parse_args()
+
+    verifiers = {}
+    for spec in args.verifier or ["atomic-swap-verifier=atomicswap.sol"]:
+        name, source = spec.split("=", 1)
+        source, _, cost = source.partition(":")
+        verifiers[name] = (source, int(cost) if cost else args.verifier_cost)
+
+    w3 = Web3( HTTPProvider("http://127.0.0.1:8545") )
+
+    w3.eth.defaultAccount = w3.eth.accounts[0]
+
+    abis, contracts = deploy_all(w3, verifiers)
+    for name, entry in contracts.items():
+        print("Deployed {0} to: {1}".format(name, entry['address']))
+        if 'verifier_id' in entry:
+            print("    registered with id {0} and cost {1}".format(entry['verifier_id'], entry['verifier_cost']))
+
+    write_manifest(w3.eth.chainId, abis, contracts, args.manifest)
+    print("Wrote {0}".format(args.manifest))
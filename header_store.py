@@ -0,0 +1,268 @@
+import argparse
+import mmap
+import os
+import time
+
+from web3 import Web3, HTTPProvider
+
+from btc import HEADER_SIZE, header_hash, pack_headers, prev_block_hash
+from client import load_contract
+from search import segment_points
+
+HASH_SIZE = 32
+CONFIRMATIONS = 6  # headers AtomicSwap expects after the first block of contention
+
+
+# mirrors AtomicSwap.is_hash_smaller: both hashes are compared as little-endian numbers
+def is_hash_smaller(hash1, hash2):
+    return int.from_bytes(hash1, 'little') < int.from_bytes(hash2, 'little')
+
+
+class HeaderStore:
+    """
+    Flat file of consecutive 80-byte Bitcoin headers, with a second file holding the
+    32-byte hash of every header. Both files are memory-mapped, and a hash -> height
+    dictionary is built from the hash file on open and extended on every append, so
+    lookups in both directions take constant time.
+    """
+
+    def __init__(self, path, base_height=0):
+        self.path = path
+        self.hash_path = path + ".hashes"
+        self.base_height = base_height
+        for p in (self.path, self.hash_path):
+            if not os.path.exists(p):
+                open(p, "wb").close()
+        self.open()
+
+    def open(self):
+        self.headers_file = open(self.path, "rb")
+        self.hashes_file = open(self.hash_path, "rb")
+        self.headers_map = self.hashes_map = None
+        self.remap()
+        self.heights = {}
+        for i in range(self.count):
+            self.heights[self.hashes_map[i * HASH_SIZE:(i + 1) * HASH_SIZE]] = self.base_height + i
+
+    # maps both files again after they grew
+    def remap(self):
+        self.unmap()
+        self.count = os.path.getsize(self.path) // HEADER_SIZE
+        if self.count:
+            self.headers_map = mmap.mmap(self.headers_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.hashes_map = mmap.mmap(self.hashes_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def unmap(self):
+        if self.headers_map is not None:
+            self.headers_map.close()
+            self.hashes_map.close()
+            self.headers_map = self.hashes_map = None
+
+    def close(self):
+        self.unmap()
+        self.headers_file.close()
+        self.hashes_file.close()
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def tip_height(self):
+        return self.base_height + self.count - 1
+
+    def append(self, headers):
+        headers = list(headers)
+        if not headers:
+            return
+        if self.count and prev_block_hash(headers[0]) != self.hash(self.tip_height):
+            raise ValueError("header does not extend the tip of the store")
+        pack_headers(headers)  # checks sizes and links
+
+        hashes = [header_hash(header) for header in headers]
+        f = open(self.path, "ab")
+        f.write(b''.join(headers))
+        f.close()
+        f = open(self.hash_path, "ab")
+        f.write(b''.join(hashes))
+        f.close()
+
+        # only the new headers are added to the index
+        height = self.base_height + self.count
+        self.remap()
+        for i, block_hash in enumerate(hashes):
+            self.heights[block_hash] = height + i
+
+    def position(self, height):
+        i = height - self.base_height
+        if i < 0 or i >= self.count:
+            raise KeyError("no header at height {}".format(height))
+        return i
+
+    def header(self, height):
+        i = self.position(height)
+        return bytes(self.headers_map[i * HEADER_SIZE:(i + 1) * HEADER_SIZE])
+
+    def headers(self, height, count):
+        i = self.position(height)
+        self.position(height + count - 1)
+        return [bytes(self.headers_map[j * HEADER_SIZE:(j + 1) * HEADER_SIZE]) for j in range(i, i + count)]
+
+    # hash in internal byte order, as uploaded to the verifier
+    def hash(self, height):
+        i = self.position(height)
+        return bytes(self.hashes_map[i * HASH_SIZE:(i + 1) * HASH_SIZE])
+
+    def height_of(self, block_hash):
+        return self.heights.get(bytes(block_hash))
+
+    def check_pow(self, height, target_hash):
+        return is_hash_smaller(self.hash(height), target_hash)
+
+    # checks the proof of work of all headers in [start, end] against the agreed target
+    def check_chain(self, start, end, target_hash):
+        return all(self.check_pow(height, target_hash) for height in range(start, end + 1))
+
+
+class Dispute:
+
+    def __init__(self, trade_id, start_height, mined_blocks):
+        self.trade_id = trade_id
+        self.start_height = start_height
+        self.mined_blocks = mined_blocks
+        self.left_index = 0
+        self.right_index = mined_blocks
+
+
+class DisputeResponder:
+    """
+    Answers the verifier on Bob's behalf: every next_upload_hash(es) event is answered
+    with the claimed hashes from the header store, and a header mismatch with a single
+    resolve_header_chain transaction. Transactions are sent as soon as the event is seen,
+    so every round only takes as long as the node needs to include them.
+
+    The range of the search is read from the verifier (search_range) at the block of
+    every event, so the responder does not depend on having seen all previous rounds.
+
+    Before uploading, the headers are checked against the proof-of-work target of the
+    verification (lower_bound_target_hash), which is read from the verifier unless
+    target_hash is given.
+    """
+
+    def __init__(self, w3, verifier, store, bob, target_hash=None, check_pow=True):
+        self.w3 = w3
+        self.verifier = verifier
+        self.store = store
+        self.bob = bob
+        self.target_hash = target_hash
+        self.check_pow = check_pow
+        self.disputes = {}
+        self.filters = [
+            (self.on_next_upload_hash, verifier.events.next_upload_hash.createFilter(fromBlock='latest')),
+            (self.on_next_upload_hashes, verifier.events.next_upload_hashes.createFilter(fromBlock='latest')),
+            (self.on_header_mismatch, verifier.events.c_header_mismatch.createFilter(fromBlock='latest')),
+        ]
+
+    # starting_hash is the hash Alice and Bob agreed on, mined_blocks the length of Bob's claimed chain
+    def watch(self, trade_id, starting_hash, mined_blocks):
+        start_height = self.store.height_of(starting_hash)
+        if start_height is None:
+            raise KeyError("starting block of trade {} is not in the header store".format(trade_id))
+        if start_height + mined_blocks > self.store.tip_height:
+            raise KeyError("header store does not reach the last block claimed in trade {}".format(trade_id))
+        self.disputes[trade_id] = Dispute(trade_id, start_height, mined_blocks)
+
+    def send(self, function):
+        return function.transact({'from': self.bob})
+
+    def target(self, trade_id):
+        if self.target_hash is not None:
+            return self.target_hash
+        return self.verifier.functions.target_hash(trade_id).call()
+
+    # left and right index of the search as stored in the verifier after the block of the event
+    def update_range(self, dispute, event):
+        dispute.left_index, dispute.right_index = self.verifier.functions.search_range(dispute.trade_id).call(
+            block_identifier=event['blockNumber'])
+
+    def on_next_upload_hash(self, event):
+        dispute = self.disputes.get(event['args']['id'])
+        if dispute is None:
+            return
+        self.update_range(dispute, event)
+
+        # the search is over and the header mismatch follows in the same transaction
+        if dispute.left_index + 1 == dispute.right_index:
+            return
+        index = event['args']['index']
+        self.send(self.verifier.functions.search_claim(dispute.trade_id, self.store.hash(dispute.start_height + index)))
+
+    def on_next_upload_hashes(self, event):
+        args = event['args']
+        dispute = self.disputes.get(args['id'])
+        if dispute is None:
+            return
+        dispute.left_index, dispute.right_index = args['left_index'], args['right_index']
+        points = segment_points(args['left_index'], args['right_index'], args['segments'])
+        hashes = [self.store.hash(dispute.start_height + p) for p in points[1:-1]]
+        self.send(self.verifier.functions.search_claim_kary(dispute.trade_id, hashes))
+
+    def on_header_mismatch(self, event):
+        dispute = self.disputes.get(event['args']['id'])
+        if dispute is None:
+            return
+        # Bob's headers start after the last block both parties agree on, for the binary and the k-ary search
+        self.update_range(dispute, event)
+
+        start = dispute.start_height + dispute.left_index + 1
+        count = min(CONFIRMATIONS, dispute.mined_blocks - dispute.left_index)
+        if self.check_pow and not self.store.check_chain(start, start + count - 1, self.target(dispute.trade_id)):
+            raise ValueError("stored headers of trade {} do not meet the agreed target".format(dispute.trade_id))
+
+        self.send(self.verifier.functions.resolve_header_chain(dispute.trade_id, pack_headers(self.store.headers(start, count))))
+        del self.disputes[dispute.trade_id]
+
+    def poll(self):
+        for handler, event_filter in self.filters:
+            for event in event_filter.get_new_entries():
+                handler(event)
+
+    def run(self, poll_interval=1):
+        while self.disputes:
+            self.poll()
+            time.sleep(poll_interval)
+
+
+def import_headers(store, path):
+    f = open(path, "rb")
+    data = f.read()
+    f.close()
+    try:
+        data = bytes.fromhex(data.decode().replace("\n", "").strip())
+    except ValueError:
+        pass
+    store.append([data[i:i + HEADER_SIZE] for i in range(0, len(data), HEADER_SIZE)])
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Answer the atomic swap verifier from a local header store.")
+    parser.add_argument('store', help="path of the header store")
+    parser.add_argument('--import', dest='import_path', help="append raw or hex encoded headers from this file")
+    parser.add_argument('--base-height', type=int, default=0, help="height of the first header in the store")
+    parser.add_argument('--trade', nargs=3, action='append', default=[], metavar=('ID', 'STARTING_HASH', 'MINED_BLOCKS'),
+                        help="dispute to answer; the starting hash is given in internal byte order as in trade.py")
+    parser.add_argument('--no-pow-check', action='store_true', help="upload headers without checking them against the agreed target")
+    args = parser.parse_args()
+
+    store = HeaderStore(args.store, args.base_height)
+    if args.import_path:
+        import_headers(store, args.import_path)
+        print("Header store holds {} headers up to height {}".format(len(store), store.tip_height))
+
+    if args.trade:
+        w3 = Web3( HTTPProvider("http://127.0.0.1:8545") )
+        verifier = load_contract(w3, "atomic-swap-verifier")
+        responder = DisputeResponder(w3, verifier, store, w3.eth.accounts[1], check_pow=not args.no_pow_check)
+        for trade_id, starting_hash, mined_blocks in args.trade:
+            responder.watch(int(trade_id), Web3.toBytes(hexstr=starting_hash), int(mined_blocks))
+        responder.run()
@@ -0,0 +1,198 @@
+import json
+import sqlite3
+import sys
+
+from eth_utils import event_abi_to_log_topic
+from web3 import Web3, HTTPProvider
+
+from client import ContractState, load_contract
+
+# verifier events whose only argument is a result code rather than a trade id
+CODE_EVENTS = ('c_finished',)
+
+# arguments of verifier events stored in the value column, all arguments are kept in args
+VALUE_ARGS = ('index', 'state')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS checkpoint (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    last_block INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS trades (
+    id INTEGER PRIMARY KEY,
+    state INTEGER NOT NULL,
+    alice TEXT,
+    bob TEXT,
+    block_number INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS trades_alice ON trades (alice, state);
+CREATE INDEX IF NOT EXISTS trades_bob ON trades (bob, state);
+CREATE TABLE IF NOT EXISTS verifiers (
+    id INTEGER PRIMARY KEY,
+    address TEXT NOT NULL,
+    deposit INTEGER NOT NULL,
+    block_number INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS verifier_events (
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    event TEXT NOT NULL,
+    trade_id INTEGER,
+    value INTEGER,
+    args TEXT,
+    tx_hash TEXT NOT NULL,
+    PRIMARY KEY (block_number, log_index)
+);
+CREATE INDEX IF NOT EXISTS verifier_events_trade ON verifier_events (trade_id, block_number);
+'''
+
+
+# event arguments as JSON, bytes as hex strings
+def encode_args(args):
+    return json.dumps(dict((name, Web3.toHex(value) if isinstance(value, bytes) else value) for name, value in args.items()), sort_keys=True)
+
+
+class EventIndexer:
+    """
+    Incrementally indexes mediator events and all verifier events into SQLite. Logs are
+    fetched for all contracts at once in block ranges of chunk_size, and every
+    range is committed together with the checkpoint, so an interrupted sync
+    resumes after the last stored range.
+
+    Blocks younger than `confirmations` are not indexed, which keeps
+    short reorgs out of the store.
+    """
+
+    def __init__(self, w3, mediator, verifiers=(), path='smartjudge.db', chunk_size=2000, confirmations=0, start_block=0):
+        self.w3 = w3
+        self.mediator = mediator
+        self.verifiers = list(verifiers)
+        self.chunk_size = chunk_size
+        self.confirmations = confirmations
+        self.start_block = start_block
+
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        # databases of older versions store no event arguments
+        columns = [row[1] for row in self.db.execute('PRAGMA table_info(verifier_events)')]
+        if 'args' not in columns:
+            self.db.execute('ALTER TABLE verifier_events ADD COLUMN args TEXT')
+
+        # topic -> (contract, event name) for every event we know how to decode
+        self.events = {}
+        for contract in [mediator] + self.verifiers:
+            for abi in contract.abi:
+                if abi['type'] == 'event':
+                    self.events[(contract.address, Web3.toHex(event_abi_to_log_topic(abi)))] = (contract, abi['name'])
+
+    @property
+    def last_block(self):
+        row = self.db.execute('SELECT last_block FROM checkpoint WHERE id = 0').fetchone()
+        return row[0] if row is not None else self.start_block - 1
+
+    def sync(self, to_block=None):
+        if to_block is None:
+            to_block = self.w3.eth.blockNumber - self.confirmations
+
+        from_block = self.last_block + 1
+        addresses = [contract.address for contract in [self.mediator] + self.verifiers]
+
+        while from_block <= to_block:
+            end = min(from_block + self.chunk_size - 1, to_block)
+            logs = self.w3.eth.getLogs({'fromBlock': from_block, 'toBlock': end, 'address': addresses})
+            with self.db:
+                for log in logs:
+                    self.store(log)
+                self.db.execute('INSERT OR REPLACE INTO checkpoint (id, last_block) VALUES (0, ?)', (end,))
+            from_block = end + 1
+
+        return self.last_block
+
+    def store(self, log):
+        if not log['topics']:
+            return
+        key = (log['address'], Web3.toHex(log['topics'][0]))
+        if key not in self.events:
+            return
+        contract, name = self.events[key]
+        event = getattr(contract.events, name)().processLog(log)
+        args = event['args']
+
+        if contract.address == self.mediator.address:
+            if name == 'TradeState':
+                self.store_trade_state(args['_id'], args['_state'], args['_sender'], log['blockNumber'])
+            elif name == 'RegisteredVerifer':
+                self.db.execute('INSERT OR REPLACE INTO verifiers (id, address, deposit, block_number) VALUES (?, ?, ?, ?)',
+                                (args['_id'], args['_verifier'], args['_deposit'], log['blockNumber']))
+        else:
+            # every verifier event, including those without a trade id such as addressEvent
+            if name in CODE_EVENTS:
+                trade_id, value = None, args['id']
+            else:
+                trade_id = args.get('id')
+                value = next((args[arg] for arg in VALUE_ARGS if arg in args), None)
+            self.db.execute('INSERT OR REPLACE INTO verifier_events (block_number, log_index, address, event, trade_id, value, args, tx_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            (log['blockNumber'], log['logIndex'], log['address'], name, trade_id, value, encode_args(args), Web3.toHex(log['transactionHash'])))
+
+    def store_trade_state(self, trade_id, state, sender, block_number):
+        if state == ContractState.CREATED:
+            # a reused trade id starts over with a new Alice and without Bob
+            self.db.execute('INSERT OR REPLACE INTO trades (id, state, alice, bob, block_number) VALUES (?, ?, ?, NULL, ?)',
+                            (trade_id, state, sender, block_number))
+        elif state == ContractState.ACCEPTED:
+            self.db.execute('UPDATE trades SET state = ?, bob = ?, block_number = ? WHERE id = ?',
+                            (state, sender, block_number, trade_id))
+        else:
+            self.db.execute('UPDATE trades SET state = ?, block_number = ? WHERE id = ?',
+                            (state, block_number, trade_id))
+
+    def trade(self, trade_id):
+        return self.db.execute('SELECT id, state, alice, bob, block_number FROM trades WHERE id = ?', (trade_id,)).fetchone()
+
+    # trades in which the address takes part, served from the (party, state) indices
+    def trades_for(self, address, state=None):
+        if state is None:
+            query = 'SELECT id FROM trades WHERE alice = ? UNION SELECT id FROM trades WHERE bob = ?'
+            params = (address, address)
+        else:
+            query = 'SELECT id FROM trades WHERE alice = ? AND state = ? UNION SELECT id FROM trades WHERE bob = ? AND state = ?'
+            params = (address, int(state), address, int(state))
+        return [row[0] for row in self.db.execute(query, params)]
+
+    # (id, alice) of every FINISHED trade, i.e., every slot that can be reused with create(id, hash)
+    def finished_trades(self):
+        return self.db.execute('SELECT id, alice FROM trades WHERE state = ?', (int(ContractState.FINISHED),)).fetchall()
+
+    def verifier_events_for(self, trade_id):
+        return self.db.execute('SELECT block_number, event, value FROM verifier_events WHERE trade_id = ? ORDER BY block_number, log_index',
+                               (trade_id,)).fetchall()
+
+    # (block_number, event, arguments) of the verifier events of a trade, e.g., the
+    # left_index, right_index and segments of next_upload_hashes
+    def verifier_event_args_for(self, trade_id):
+        rows = self.db.execute('SELECT block_number, event, args FROM verifier_events WHERE trade_id = ? ORDER BY block_number, log_index',
+                               (trade_id,)).fetchall()
+        return [(block_number, event, json.loads(args) if args is not None else None) for block_number, event, args in rows]
+
+    def verifier_id(self, address):
+        row = self.db.execute('SELECT id FROM verifiers WHERE address = ?', (address,)).fetchone()
+        return row[0] if row is not None else None
+
+    def close(self):
+        self.db.close()
+
+
+if __name__ == "__main__":
+
+    w3 = Web3( HTTPProvider("http://127.0.0.1:8545") )
+
+    mediator = load_contract(w3, "mediator")
+    verifier = load_contract(w3, "atomic-swap-verifier")
+
+    indexer = EventIndexer(w3, mediator, [verifier])
+    last_block = indexer.sync()
+    print("Indexed events up to block {}".format(last_block))
+
+    for address in sys.argv[1:]:
+        print("{}: accepted trades {}".format(address, indexer.trades_for(address, ContractState.ACCEPTED)))
@@ -0,0 +1,234 @@
+import argparse
+import json
+import random
+import sys
+import time
+
+from web3 import Web3, HTTPProvider
+
+import trade as scenario
+from client import SECURITY_DEPOSIT, ContractState, Trade, TradeClient, TradeError, agreement_hash
+from manifest import load_manifest
+from metrics import MetricsServer, Tracer
+from txpipeline import TransactionPipeline
+
+# steps of every kind of trade; verified trades end with the verifier's callback into
+# the mediator, which happens in the same transaction as verify_tx
+KINDS = {
+    'honest': ('create', 'accept', 'finish'),
+    'contested': ('create', 'accept', 'contest', 'finish'),
+    'verified': ('create', 'accept', 'contest', 'init_verification', 'verify_agreement', 'hashes_ok', 'verify_tx'),
+}
+
+# lifecycle spans, from the submission of the first step to the inclusion of the second
+SPANS = (
+    ('create', 'accept'),
+    ('accept', 'finish'),
+    ('accept', 'contest'),
+    ('contest', 'finish'),
+    ('contest', 'init_verification'),
+    ('contest', 'verifier_callback'),
+    ('create', 'finish'),
+    ('create', 'verifier_callback'),
+)
+
+# upper bounds of the latency histogram buckets in seconds
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class LoadTrade(Trade):
+
+    def __init__(self, kind, alice, bob, agreement, price):
+        Trade.__init__(self, alice, bob, agreement, price, steps=KINDS[kind])
+        self.kind = kind
+        self.timings = {}  # step -> (submitted, included) in seconds since the epoch
+
+
+class LoadClient(TradeClient):
+    """
+    TradeClient that records when every step of a trade was submitted and
+    included, and that also runs Bob's and Alice's side of the verification
+    with the Bitcoin data of trade.py.
+    """
+
+    async def transact(self, trade, name, function, params):
+        submitted = time.time()
+        receipt = await TradeClient.transact(self, trade, name, function, params)
+        trade.timings[name] = (submitted, time.time())
+        return receipt
+
+    async def verify_agreement(self, trade):
+        function = self.verifier.functions.verify_agreement(
+            trade.id, *scenario.agreement_terms(), scenario.btc_mined_blocks,
+            Web3.toBytes(hexstr=scenario.btc_last_hash), Web3.toBytes(hexstr=scenario.btc_tx_hash))
+        await self.transact(trade, 'verify_agreement', function, {'from': trade.bob})
+
+    async def hashes_ok(self, trade):
+        await self.transact(trade, 'hashes_ok', self.verifier.functions.hashes_ok(trade.id), {'from': trade.alice})
+
+    async def verify_tx(self, trade):
+        function = self.verifier.functions.verify_tx(
+            trade.id, scenario.btc_tx_block_version, scenario.btc_tx_block_prev_hash, scenario.btc_tx_block_merkle_root,
+            scenario.btc_tx_block_timestamp, scenario.btc_tx_block_difficulty, scenario.btc_tx_block_nonce,
+            scenario.btc_transaction, scenario.btc_block_merkle_indices, scenario.btc_merkle_hashes)
+        receipt = await self.transact(trade, 'verify_tx', function, {'from': trade.bob})
+        if not any(log['address'] == self.mediator.address for log in receipt['logs']):
+            raise TradeError("verification of trade {} did not finish the trade".format(trade.id))
+        trade.timings['verifier_callback'] = trade.timings['verify_tx']
+        trade.state = ContractState.FINISHED
+
+
+def load_keys(count, seed):
+    return [Web3.toHex(Web3.keccak(text="loadgen {} {}".format(seed, i))) for i in range(count)]
+
+
+# sends value to every address from the node's accounts, submitting all transfers before waiting
+def fund(w3, addresses, value):
+    funders = w3.eth.accounts
+    tx_hashes = [w3.eth.sendTransaction({'from': funders[i % len(funders)], 'to': address, 'value': value})
+                 for i, address in enumerate(addresses)]
+    for tx_hash in tx_hashes:
+        if w3.eth.waitForTransactionReceipt(tx_hash)['status'] == 0:
+            raise RuntimeError("funding transaction {} failed".format(Web3.toHex(tx_hash)))
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in KINDS:
+            raise ValueError("unknown kind of trade {}".format(kind))
+        weights[kind] = float(weight)
+    return weights
+
+
+# assigns the kinds in proportion to their weights and in random order
+def make_kinds(count, weights, rng):
+    total = sum(weights.values())
+    kinds = []
+    for kind, weight in weights.items():
+        kinds += [kind] * int(round(count * weight / total))
+    kinds = (kinds + [max(weights, key=weights.get)] * count)[:count]
+    rng.shuffle(kinds)
+    return kinds
+
+
+def make_trades(kinds, pairs, verifier_id, verifier_cost, price):
+    trade_conditions = Web3.soliditySha3(['bytes8', 'bytes20', 'bytes32', 'bytes32'], scenario.agreement_terms())
+    witness = Web3.soliditySha3(['uint16', 'bytes32'], [scenario.btc_mined_blocks, Web3.toBytes(hexstr=scenario.btc_last_hash)])
+    trades = []
+    for i, kind in enumerate(kinds):
+        alice, bob = pairs[i % len(pairs)]
+        trade = LoadTrade(kind, alice, bob, agreement_hash(verifier_id, trade_conditions), price)
+        trade.witness = witness
+        trade.verifier_id = verifier_id
+        trade.verifier_cost = verifier_cost
+        trade.trade_conditions = trade_conditions
+        trades.append(trade)
+    return trades
+
+
+# nearest-rank percentile of a sorted list
+def percentile(values, p):
+    return values[max(0, int(-(-len(values) * p // 100)) - 1)]
+
+
+def latency_stats(values):
+    values = sorted(values)
+    histogram = {}
+    for bound in BUCKETS:
+        histogram[str(bound)] = sum(1 for value in values if value <= bound)
+    histogram['+Inf'] = len(values)
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': values[-1],
+        'histogram': histogram,  # cumulative counts of latencies up to each bound
+    }
+
+
+def report(trades, elapsed, config):
+    finished = [trade for trade in trades if trade.error is None]
+    steps, spans = {}, {}
+    for trade in finished:
+        for step, (submitted, included) in trade.timings.items():
+            steps.setdefault(step, []).append(included - submitted)
+        for first, second in SPANS:
+            if first in trade.timings and second in trade.timings:
+                spans.setdefault("{}->{}".format(first, second), []).append(trade.timings[second][1] - trade.timings[first][0])
+
+    transactions = sum(len(trade.receipts) for trade in trades)
+    kinds = {}
+    for trade in trades:
+        counts = kinds.setdefault(trade.kind, {'trades': 0, 'failed': 0})
+        counts['trades'] += 1
+        counts['failed'] += trade.error is not None
+
+    return {
+        'config': config,
+        'elapsed': elapsed,
+        'trades': len(trades),
+        'failed': len(trades) - len(finished),
+        'kinds': kinds,
+        'trades_per_second': len(finished) / elapsed,
+        'transactions_per_second': transactions / elapsed,
+        'gas_per_second': sum(r['gasUsed'] for trade in trades for r in trade.receipts.values()) / elapsed,
+        'steps': dict((step, latency_stats(values)) for step, values in steps.items()),
+        'spans': dict((span, latency_stats(values)) for span, values in spans.items()),
+        'errors': sorted(set(str(trade.error) for trade in trades if trade.error is not None))[:10],
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Drive many concurrent trades between funded account pairs and report throughput and latency.")
+    parser.add_argument('--node', default="http://127.0.0.1:8545")
+    parser.add_argument('--pairs', type=int, default=20, help="number of Alice/Bob account pairs")
+    parser.add_argument('--trades', type=int, default=200)
+    parser.add_argument('--mix', default="honest=0.8,contested=0.15,verified=0.05", help="weights of the kinds of trades")
+    parser.add_argument('--concurrency', type=int, default=None, help="maximum number of trades in flight")
+    parser.add_argument('--price', type=int, default=10**15, help="wei Alice pays per trade")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="file to write the JSON report to instead of stdout")
+    parser.add_argument('--metrics-port', type=int, help="serve the spans and metrics of every call on this port during the run")
+    args = parser.parse_args()
+
+    w3 = Web3( HTTPProvider(args.node) )
+    manifest = load_manifest()
+    mediator = manifest.contract(w3, "mediator")
+    verifier = manifest.contract(w3, "atomic-swap-verifier")
+    verifier_id = manifest.verifier_id("atomic-swap-verifier")
+    verifier_cost = manifest.verifier_cost("atomic-swap-verifier")
+
+    rng = random.Random(args.seed)
+    kinds = make_kinds(args.trades, parse_mix(args.mix), rng)
+
+    pipeline = TransactionPipeline(w3, load_keys(2 * args.pairs, args.seed))
+    addresses = pipeline.addresses
+    pairs = list(zip(addresses[0::2], addresses[1::2]))
+
+    # deposits, verification fee and the gas of every transaction of a party's trades, twice over
+    gas_price = pipeline.gas_price
+    trades_per_pair = -(-args.trades // args.pairs)
+    fund(w3, addresses, 2 * trades_per_pair * (args.price + gas_price * (SECURITY_DEPOSIT + 2 * verifier_cost)))
+
+    trades = make_trades(kinds, pairs, verifier_id, verifier_cost, args.price)
+    tracer = Tracer(enabled=args.metrics_port is not None)
+    if tracer.enabled:
+        MetricsServer(tracer, port=args.metrics_port).start()
+    client = LoadClient(w3, mediator, verifier, gas_price=gas_price, concurrency=args.concurrency, pipeline=pipeline, tracer=tracer)
+
+    start = time.time()
+    client.run(trades)
+    result = report(trades, time.time() - start, vars(args))
+
+    if args.output:
+        f = open(args.output, "w")
+        json.dump(result, f, indent=2)
+        f.close()
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print("")
@@ -0,0 +1,82 @@
+import json
+import os
+import zlib
+
+MANIFEST_FILE = "deployment.manifest"
+MANIFEST_VERSION = 1
+
+loaded = {}  # path -> Manifest, so every process reads and decompresses the file only once
+
+
+class Manifest:
+    """
+    Addresses, ABIs and verifier ids of a deployment, written by deploy.py as
+    zlib-compressed JSON. Contracts deployed from the same source share a
+    single copy of their ABI, and contract objects are only built when they
+    are first used.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.contracts = {}  # (w3, name) -> web3 contract
+
+    @property
+    def names(self):
+        return list(self.data['contracts'])
+
+    @property
+    def verifiers(self):
+        return [name for name, entry in self.data['contracts'].items() if 'verifier_id' in entry]
+
+    def entry(self, name):
+        try:
+            return self.data['contracts'][name]
+        except KeyError:
+            raise KeyError("{} is not part of the deployment".format(name))
+
+    def address(self, name):
+        return self.entry(name)['address']
+
+    def abi(self, name):
+        return self.data['abis'][self.entry(name)['abi']]
+
+    def verifier_id(self, name):
+        return self.entry(name)['verifier_id']
+
+    def verifier_cost(self, name):
+        return self.entry(name)['verifier_cost']
+
+    def contract(self, w3, name):
+        key = (w3, name)
+        if key not in self.contracts:
+            self.contracts[key] = w3.eth.contract(address=self.address(name), abi=self.abi(name))
+        return self.contracts[key]
+
+
+def encode(chain_id, abis, contracts):
+    data = {'version': MANIFEST_VERSION, 'chain_id': chain_id, 'abis': abis, 'contracts': contracts}
+    return zlib.compress(json.dumps(data, separators=(',', ':'), sort_keys=True).encode(), 9)
+
+
+def decode(raw):
+    data = json.loads(zlib.decompress(raw).decode())
+    if data.get('version') != MANIFEST_VERSION:
+        raise ValueError("unsupported manifest version {}".format(data.get('version')))
+    return Manifest(data)
+
+
+def write_manifest(chain_id, abis, contracts, path=MANIFEST_FILE):
+    f = open(path + ".tmp", "wb")
+    f.write(encode(chain_id, abis, contracts))
+    f.close()
+    os.replace(path + ".tmp", path)
+    loaded.pop(path, None)
+
+
+def load_manifest(path=MANIFEST_FILE):
+    if path not in loaded:
+        f = open(path, "rb")
+        raw = f.read()
+        f.close()
+        loaded[path] = decode(raw)
+    return loaded[path]
@@ -17,31 +17,33 @@ contract Mediator{
     FINISHED
   }
 
+  // Funds are stored as uint96 next to the addresses, and block heights, gas prices
+  // and gas amounts as uint64, so that every struct uses as few storage slots as possible.
   struct Verification{
-    uint256 costs;
     address contract_address;
+    uint64 costs;
   }
 
   struct Agreement{
-    ContractState state;
     address alice;
-    uint alice_funds;
+    uint96 alice_funds;
     address bob;
-    uint bob_funds;
+    uint96 bob_funds;
     bytes32 agreement_hash;
-    uint current_height;
-    uint gascost;
+    uint64 current_height;
+    uint64 gascost;
+    ContractState state;
   }
 
   struct Contention{
-    bool revealed_data;
     bytes32 witness;
+    uint64 verification_fee_made;
     uint32 verifier_id;
-    uint256 verification_fee_made;
+    bool revealed_data;
   }
 
-  uint256 SECURITY_DEPOSIT = 400000; // 400000 gas worst case costs until verification for Alice
-  uint64 TIMEOUT_BLOCKS = 6 * 60 * 24; // 24 hours
+  uint256 constant SECURITY_DEPOSIT = 400000; // 400000 gas worst case costs until verification for Alice
+  uint64 constant TIMEOUT_BLOCKS = 6 * 60 * 24; // 24 hours
 
   mapping(uint32 => Agreement) agreements;
   mapping(uint32 => Verification) verifications;
@@ -53,6 +55,7 @@ contract Mediator{
 
   event RegisteredVerifer(address indexed _verifier, uint256 indexed _deposit, uint32 _id);
   event TradeID(uint32 _id);
+  event TradeState(uint32 indexed _id, ContractState _state, address indexed _sender);
 
   /**
    * Lets Alice create a new contract based on a hash and returns
@@ -65,17 +68,9 @@ contract Mediator{
    * @return    Id used to process this contract
    **/
    function create(bytes32 agreement_hash) public payable{
-       require(msg.value >= SECURITY_DEPOSIT * tx.gasprice);
-
        Agreement storage a = agreements[storage_counter];
 
-       a.state = ContractState.CREATED;
-       a.agreement_hash = agreement_hash;
-       a.alice = msg.sender;
-       a.alice_funds = SECURITY_DEPOSIT * tx.gasprice;
-       a.bob_funds = msg.value - SECURITY_DEPOSIT * tx.gasprice;
-       a.current_height = block.number;
-       a.gascost = tx.gasprice;
+       open_agreement(storage_counter, a, agreement_hash, msg.value);
 
        emit TradeID(storage_counter);
        storage_counter++;
@@ -95,15 +90,92 @@ contract Mediator{
    function create(uint32 id, bytes32 agreement_hash) public payable{
        Agreement storage a = agreements[id];
 
-       require(msg.value >= SECURITY_DEPOSIT * tx.gasprice);
        require(a.state == ContractState.FINISHED);
 
-       a.state = ContractState.CREATED;
-       a.agreement_hash = agreement_hash;
+       open_agreement(id, a, agreement_hash, msg.value);
+   }
+
+  /**
+   * Lets Alice create several new contracts in one transaction.
+   * msg.value is split evenly across all contracts, so every share has
+   * to cover the SECURITY_DEPOSIT as for a single contract.
+   * One TradeID is emitted per contract, in the order of the given hashes.
+   *
+   * @param agreement_hashes  Hashes of the selected verifier and the initial terms of each contract
+   **/
+   function create_batch(bytes32[] agreement_hashes) public payable{
+       uint value = split_value(agreement_hashes.length);
+       uint32 id = storage_counter;
+
+       for(uint i = 0; i < agreement_hashes.length; i++){
+           Agreement storage a = agreements[id];
+
+           open_agreement(id, a, agreement_hashes[i], value);
+
+           emit TradeID(id);
+           id++;
+       }
+
+       storage_counter = id;
+   }
+
+  /**
+   * Lets Alice create several new contracts in one transaction, reusing
+   * the storage of finished contracts.
+   * msg.value is split evenly across all contracts.
+   *
+   * @param ids               Ids of finished contracts selected for the processing of the new contracts
+   * @param agreement_hashes  Hashes of the selected verifier and the initial terms of each contract
+   **/
+   function create_batch(uint32[] ids, bytes32[] agreement_hashes) public payable{
+       require(ids.length == agreement_hashes.length);
+       uint value = split_value(ids.length);
+
+       for(uint i = 0; i < ids.length; i++){
+           Agreement storage a = agreements[ids[i]];
+
+           require(a.state == ContractState.FINISHED);
+           open_agreement(ids[i], a, agreement_hashes[i], value);
+
+           emit TradeID(ids[i]);
+       }
+   }
+
+   function open_agreement(uint32 id, Agreement storage a, bytes32 agreement_hash, uint value) private{
+       require(value >= SECURITY_DEPOSIT * tx.gasprice);
+
        a.alice = msg.sender;
-       a.alice_funds = SECURITY_DEPOSIT * tx.gasprice;
-       a.bob_funds = msg.value - SECURITY_DEPOSIT * tx.gasprice;
-       a.current_height = block.number;
+       a.alice_funds = to_funds(SECURITY_DEPOSIT * tx.gasprice);
+       a.bob_funds = to_funds(value - SECURITY_DEPOSIT * tx.gasprice);
+       a.agreement_hash = agreement_hash;
+       a.current_height = uint64(block.number);
+       a.gascost = to_uint64(tx.gasprice);
+       a.state = ContractState.CREATED;
+
+       emit TradeState(id, ContractState.CREATED, msg.sender);
+   }
+
+   function to_funds(uint value) private pure returns(uint96){
+       require(value < 2**96);
+       return uint96(value);
+   }
+
+   function to_uint64(uint value) private pure returns(uint64){
+       require(value < 2**64);
+       return uint64(value);
+   }
+
+   // the funds are summed up as uint, as the sum of two uint96 values may overflow
+   function total_funds(Agreement storage a) private view returns(uint){
+       return uint(a.alice_funds) + a.bob_funds;
+   }
+
+   // splits msg.value evenly across a batch, without leaving any remainder in the contract
+   function split_value(uint count) private view returns(uint){
+       require(count > 0);
+       uint value = msg.value / count;
+       require(value * count == msg.value);
+       return value;
    }
 
   /**
@@ -117,8 +189,9 @@ contract Mediator{
        require(msg.sender == a.alice);
        require(a.state == ContractState.CREATED);
 
-       a.alice.transfer(a.alice_funds + a.bob_funds);
+       a.alice.transfer(total_funds(a));
        a.state = ContractState.FINISHED;
+       emit TradeState(id, ContractState.FINISHED, msg.sender);
    }
 
   /**
@@ -130,16 +203,36 @@ contract Mediator{
    * @param id              The id of the processed contract
    **/
    function accept(uint32 id) payable public{
+       accept_agreement(id, msg.value);
+   }
 
+  /**
+   * This function lets Bob accept several contracts in one transaction.
+   * msg.value is split evenly across all contracts, so every share has
+   * to cover the deposit as for a single contract.
+   *
+   * @param ids             The ids of the processed contracts
+   **/
+   function accept_batch(uint32[] ids) payable public{
+       uint value = split_value(ids.length);
+
+       for(uint i = 0; i < ids.length; i++){
+           accept_agreement(ids[i], value);
+       }
+   }
+
+   function accept_agreement(uint32 id, uint value) private{
        Agreement storage a = agreements[id];
 
        require(a.state == ContractState.CREATED);
-       require(msg.value >= SECURITY_DEPOSIT * tx.gasprice);
+       require(value >= SECURITY_DEPOSIT * tx.gasprice);
 
        a.bob = msg.sender;
-       a.bob_funds += msg.value;
-       a.current_height = block.number;
+       a.bob_funds = to_funds(a.bob_funds + value);
+       a.current_height = uint64(block.number);
        a.state = ContractState.ACCEPTED;
+
+       emit TradeState(id, ContractState.ACCEPTED, msg.sender);
    }
 
   /**
@@ -150,7 +243,21 @@ contract Mediator{
    * @param id              The id of the processed contract
    **/
    function finish(uint32 id) public{
+       finish_agreement(id);
+   }
+
+  /**
+   * This function lets Alice end several contracts gracefully in one transaction.
+   *
+   * @param ids             The ids of the processed contracts
+   **/
+   function finish_batch(uint32[] ids) public{
+       for(uint i = 0; i < ids.length; i++){
+           finish_agreement(ids[i]);
+       }
+   }
 
+   function finish_agreement(uint32 id) private{
        Agreement storage a = agreements[id];
 
        require(a.state == ContractState.ACCEPTED || a.state == ContractState.REVEALED || a.state == ContractState.CONTENDED);
@@ -159,6 +266,7 @@ contract Mediator{
        a.alice.transfer(a.alice_funds);
        a.bob.transfer(a.bob_funds);
        a.state = ContractState.FINISHED;
+       emit TradeState(id, ContractState.FINISHED, msg.sender);
    }
 
   /**
@@ -180,16 +288,17 @@ contract Mediator{
        require(msg.sender == a.bob);
 
        data[id] = revealed_data;
-       a.current_height = block.number;
+       a.current_height = uint64(block.number);
        a.state = ContractState.REVEALED;
+       emit TradeState(id, ContractState.REVEALED, msg.sender);
 
        uint256 fees = (gas_beginning - gasleft() + 28000) * tx.gasprice/2;
        if(fees > a.alice_funds){
            fees = a.alice_funds;
        }
 
-       a.alice_funds -= fees;
-       a.bob_funds += fees;
+       a.alice_funds -= uint96(fees);
+       a.bob_funds = to_funds(a.bob_funds + fees);
    }
 
   /**
@@ -214,19 +323,20 @@ contract Mediator{
       cont.revealed_data = (a.state == ContractState.REVEALED);
 
       cont.witness = witness;
-      cont.verification_fee_made = msg.value/a.gascost;
+      cont.verification_fee_made = to_uint64(msg.value/a.gascost);
 
-      a.bob_funds += msg.value;
-      a.current_height = block.number;
+      a.bob_funds = to_funds(a.bob_funds + msg.value);
+      a.current_height = uint64(block.number);
       a.state = ContractState.CONTENDED;
+      emit TradeState(id, ContractState.CONTENDED, msg.sender);
 
       uint256 fees = (gas_beginning - gasleft() + 28000) * tx.gasprice/2;
       if(fees > a.alice_funds){
           fees = a.alice_funds;
       }
 
-      a.alice_funds -= fees;
-      a.bob_funds += fees;
+      a.alice_funds -= uint96(fees);
+      a.bob_funds = to_funds(a.bob_funds + fees);
    }
 
 
@@ -246,7 +356,7 @@ contract Mediator{
     require(msg.sender == a.alice);
     require(a.state == ContractState.CONTENDED);
 
-    a.alice_funds += msg.value;
+    a.alice_funds = to_funds(a.alice_funds + msg.value);
 
     if( a.agreement_hash == sha3(abi.encodePacked(verifier_id, initial_witness)) ){
 
@@ -254,14 +364,16 @@ contract Mediator{
         Verifier used_verifier = Verifier(verifications[verifier_id].contract_address);
 
         if(contentions[id].verification_fee_made != verifications[verifier_id].costs){
-          a.alice.transfer(a.bob_funds + a.alice_funds);
+          a.alice.transfer(total_funds(a));
           a.state = ContractState.FINISHED;
+          emit TradeState(id, ContractState.FINISHED, msg.sender);
           return;
         }
 
         if(msg.value/a.gascost != verifications[verifier_id].costs){
-          a.bob.transfer(a.bob_funds + a.alice_funds);
+          a.bob.transfer(total_funds(a));
           a.state = ContractState.FINISHED;
+          emit TradeState(id, ContractState.FINISHED, msg.sender);
           return;
         }
         
@@ -272,11 +384,13 @@ contract Mediator{
         }
         
         a.state = ContractState.WAITING;
+        emit TradeState(id, ContractState.WAITING, msg.sender);
 
     } else {
 
-        a.bob.transfer(a.alice_funds + a.bob_funds);
+        a.bob.transfer(total_funds(a));
         a.state = ContractState.FINISHED;
+        emit TradeState(id, ContractState.FINISHED, msg.sender);
 
     }
   }
@@ -296,11 +410,12 @@ contract Mediator{
        require(msg.sender == verifications[contentions[id].verifier_id].contract_address);
 
        if(honest_party == a.bob)
-         a.bob.transfer(a.bob_funds + a.alice_funds);
+         a.bob.transfer(total_funds(a));
        else
-         a.alice.transfer(a.bob_funds + a.alice_funds);
+         a.alice.transfer(total_funds(a));
 
        a.state = ContractState.FINISHED;
+       emit TradeState(id, ContractState.FINISHED, msg.sender);
    }
 
   /**
@@ -315,10 +430,11 @@ contract Mediator{
         require( (msg.sender == a.alice && (a.state == ContractState.ACCEPTED || a.state == ContractState.REVEALED))
                  || (msg.sender == a.bob && a.state == ContractState.CONTENDED));
 
-         require( a.current_height + TIMEOUT_BLOCKS >= block.number );
+         require( block.number >= a.current_height + TIMEOUT_BLOCKS );
 
-         msg.sender.transfer(a.bob_funds + a.alice_funds);
+         msg.sender.transfer(total_funds(a));
          a.state = ContractState.FINISHED;
+         emit TradeState(id, ContractState.FINISHED, msg.sender);
     }
 
   /**
@@ -334,7 +450,7 @@ contract Mediator{
    function register_verifier(address verifier_address, uint256 verifier_cost) public{
        Verification storage v = verifications[verifier_counter];
        v.contract_address = verifier_address;
-       v.costs = verifier_cost;
+       v.costs = to_uint64(verifier_cost);
        emit RegisteredVerifer(verifier_address, verifier_cost, verifier_counter);
        verifier_counter++;
    }
@@ -0,0 +1,264 @@
+import bisect
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+METRICS_PORT = 9464
+
+# phases of a contract call, in order; calls sent through the node have no separate signing phase.
+# mempool ends at the timestamp of the including block, receipt covers the rest of the wait
+# (propagation of the block, polling and confirmations).
+PHASES = ('prepare', 'sign', 'submit', 'mempool', 'receipt')
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BLOCK_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+GAS_BUCKETS = (25000, 50000, 100000, 200000, 400000, 800000, 1600000, 3200000)
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last entry counts values above every bound
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Counters and histograms keyed by name and labels, rendered in the Prometheus
+    text format. Labels are tuples of (name, value) pairs.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.types = {}  # name -> (type, help)
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> Histogram
+
+    def declare(self, name, kind, help):
+        self.types[name] = (kind, help)
+
+    # callers that update several metrics at once hold self.lock themselves
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, buckets, value, labels=()):
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (kind, help) in sorted(self.types.items()):
+                lines.append("# HELP {} {}".format(name, help))
+                lines.append("# TYPE {} {}".format(name, kind))
+                for (metric, labels), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append("{}{} {}".format(name, format_labels(labels), value))
+                for (metric, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append("{}_bucket{} {}".format(name, format_labels(labels + (('le', bound),)), cumulative))
+                    lines.append("{}_sum{} {}".format(name, format_labels(labels), histogram.sum))
+                    lines.append("{}_count{} {}".format(name, format_labels(labels), histogram.count))
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(key, value) for key, value in labels) + "}"
+
+
+class Span:
+    """
+    Timing of a single contract call. mark() closes the phase that ran since the
+    previous mark, so every phase costs a single clock read.
+    """
+
+    __slots__ = ('trade_id', 'function', 'start', 'last', 'phases', 'tx_hash', 'gas_used', 'block_delay', 'status')
+
+    def __init__(self, trade_id, function):
+        self.trade_id = trade_id
+        self.function = function
+        self.start = self.last = time.perf_counter()
+        self.phases = {}
+        self.tx_hash = None
+        self.gas_used = None
+        self.block_delay = None  # blocks between the head at submission and the including block
+        self.status = None
+
+    # at ends the phase earlier than now, e.g., at a block timestamp; it is clamped
+    # between the previous mark and now
+    def mark(self, phase, at=None):
+        now = time.perf_counter()
+        if at is not None:
+            now = min(max(at, self.last), now)
+        self.phases[phase] = now - self.last
+        self.last = now
+
+    def to_dict(self):
+        return {
+            'trade_id': self.trade_id,
+            'function': self.function,
+            'duration': self.last - self.start,
+            'phases': self.phases,
+            'tx_hash': self.tx_hash,
+            'gas_used': self.gas_used,
+            'block_delay': self.block_delay,
+            'status': self.status,
+        }
+
+
+# converts a time in seconds since the epoch (e.g., a block timestamp) to the clock of the spans
+def perf_time(timestamp):
+    return timestamp - time.time() + time.perf_counter()
+
+
+class NullSpan:
+
+    def mark(self, phase, at=None):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+    """
+    Collects the spans of contract calls. Finished spans update the counters and
+    histograms of a Metrics registry, are kept in a bounded buffer for /spans and
+    are optionally written as JSON lines to sink. A disabled tracer hands out a
+    span that ignores every mark.
+    """
+
+    def __init__(self, metrics=None, max_spans=10000, sink=None, enabled=True):
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.spans = deque(maxlen=max_spans)
+        self.sink = sink
+        self.enabled = enabled
+
+        self.metrics.declare('smartjudge_calls_total', 'counter', "Contract calls by function and status")
+        self.metrics.declare('smartjudge_gas_used_total', 'counter', "Gas used by function")
+        self.metrics.declare('smartjudge_phase_seconds', 'histogram', "Time spent in each phase of a contract call")
+        self.metrics.declare('smartjudge_call_seconds', 'histogram', "Time from preparing a contract call until its receipt")
+        self.metrics.declare('smartjudge_gas_used', 'histogram', "Gas used per contract call")
+        self.metrics.declare('smartjudge_block_delay', 'histogram', "Blocks between submission and inclusion")
+
+    def start(self, trade_id, function):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(trade_id, function)
+
+    def finish(self, span, receipt=None, head=None, error=None):
+        if span is NULL_SPAN:
+            return
+        if error is not None:
+            span.status = 'error'
+        elif receipt is not None:
+            span.status = 'ok' if receipt['status'] == 1 else 'reverted'
+            span.tx_hash = receipt['transactionHash'].hex()
+            span.gas_used = receipt['gasUsed']
+            if head is not None:
+                span.block_delay = receipt['blockNumber'] - head
+
+        function = (('function', span.function),)
+        metrics = self.metrics
+        with metrics.lock:
+            metrics.inc('smartjudge_calls_total', function + (('status', span.status),))
+            metrics.observe('smartjudge_call_seconds', SECONDS_BUCKETS, span.last - span.start, function)
+            for phase, seconds in span.phases.items():
+                metrics.observe('smartjudge_phase_seconds', SECONDS_BUCKETS, seconds, function + (('phase', phase),))
+            if span.gas_used is not None:
+                metrics.inc('smartjudge_gas_used_total', function, span.gas_used)
+                metrics.observe('smartjudge_gas_used', GAS_BUCKETS, span.gas_used, function)
+            if span.block_delay is not None:
+                metrics.observe('smartjudge_block_delay', BLOCK_BUCKETS, span.block_delay, function)
+            self.spans.append(span)
+            if self.sink is not None:
+                self.sink.write(json.dumps(span.to_dict()) + "\n")
+
+    def recent(self, limit=100):
+        with self.metrics.lock:
+            spans = list(self.spans)[-limit:]
+        return [span.to_dict() for span in spans]
+
+
+# limit of /spans?limit=N, None if the query is not a positive integer
+def parse_limit(query, default=100):
+    params = parse_qs(query, keep_blank_values=True)
+    if 'limit' not in params:
+        return default
+    try:
+        limit = int(params['limit'][-1])
+    except ValueError:
+        return None
+    return limit if limit > 0 else None
+
+
+class MetricsServer:
+    """
+    Serves /metrics in the Prometheus text format and the latest spans as JSON
+    on /spans?limit=N from a daemon thread.
+    """
+
+    def __init__(self, tracer, host="127.0.0.1", port=METRICS_PORT):
+        self.tracer = tracer
+        self.address = (host, port)
+        self.server = None
+
+    def start(self):
+        tracer = self.tracer
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                path, _, query = self.path.partition("?")
+                if path == "/metrics":
+                    self.reply("text/plain; version=0.0.4", tracer.metrics.render())
+                elif path == "/spans":
+                    limit = parse_limit(query)
+                    if limit is None:
+                        self.send_error(400, "limit has to be a positive integer")
+                    else:
+                        self.reply("application/json", json.dumps(tracer.recent(limit)))
+                else:
+                    self.send_error(404)
+
+            def reply(self, content_type, body):
+                body = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(self.address, Handler)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        return self.server.server_address
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
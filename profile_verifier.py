@@ -0,0 +1,282 @@
+import argparse
+import json
+import random
+from collections import Counter
+
+from web3 import Web3, HTTPProvider
+
+from benchmark import BLOCK_GAS_LIMIT, deploy, tester_web3
+from btc import double_sha256, header_hash, pack_header, pack_headers
+from client import SECURITY_DEPOSIT, agreement_hash
+from search import binary_mid, segment_points
+from spv import calc_merkle_root
+
+MAX_MINED_BLOCKS = 2**16 - 1  # verify_agreement takes the number of mined blocks as uint16
+MERKLE_DEPTH = 16  # a block of 4M weight units holds less than 2^15 transactions
+CONFIRMATIONS = 6  # headers Bob uploads after the first block of contention
+PROVISIONAL_COST = 10000000  # verifier cost registered while profiling, high enough for every path
+HOTSPOTS = 8
+
+MAX_TARGET = b'\xff' * 32  # every header hash is smaller, so synthetic headers need no proof of work
+BTC_PRICE = bytes.fromhex("1b17143000000000")
+BTC_ADDRESS = bytes.fromhex("659c2a9bc407f28b3f44caaeb01c6ead271d76aa")
+
+# calls of the mediator, which are covered by the security deposits and not by the verifier cost
+MEDIATOR_FUNCTIONS = ('create', 'accept', 'contest', 'init_verification')
+
+
+def random_bytes(rng, size):
+    return rng.getrandbits(8 * size).to_bytes(size, 'big')
+
+
+# Consecutive headers starting at a random block; merkle_roots maps positions to roots
+# that have to be used instead of random ones.
+def synthetic_chain(length, rng, merkle_roots=None):
+    merkle_roots = merkle_roots or {}
+    headers = []
+    prev_hash = random_bytes(rng, 32)
+    for i in range(length + 1):
+        root = merkle_roots.get(i, random_bytes(rng, 32))
+        header = pack_header(0x20000000, int.from_bytes(prev_hash, 'little'), int.from_bytes(root, 'little'),
+                             1500000000 + 600 * i, 0x1d00ffff, i)
+        headers.append(header)
+        prev_hash = header_hash(header)
+    return headers
+
+
+# Transaction with P2PKH inputs, a change output and the P2SH output paying Alice, which
+# comes last so that the verifier has to parse every other output first.
+def synthetic_tx(rng, inputs=1, outputs=2):
+    tx = (1).to_bytes(4, 'little') + bytes([inputs])
+    for i in range(inputs):
+        tx += random_bytes(rng, 32) + i.to_bytes(4, 'little') + bytes([107]) + random_bytes(rng, 107) + b'\xff' * 4
+    tx += bytes([outputs])
+    for _ in range(outputs - 1):
+        tx += (50000).to_bytes(8, 'little') + bytes([25]) + b'\x76\xa9\x14' + random_bytes(rng, 20) + b'\x88\xac'
+    tx += BTC_PRICE + bytes([23]) + b'\xa9\x14' + BTC_ADDRESS + b'\x87'
+    tx += bytes(4)
+    return tx
+
+
+def header_fields(header):
+    return header[0:4], header[4:36], header[36:68], header[68:72], header[72:76], header[76:80]
+
+
+CALL_OPS = ('CALL', 'STATICCALL', 'DELEGATECALL', 'CALLCODE')
+
+
+# Gas per opcode of the outermost call frame. Calls are charged with everything they
+# spent, i.e., the gas left before the call minus the gas left at the next step of the
+# outer frame, so a single pass over the trace suffices.
+def opcode_gas(struct_logs):
+    gas = Counter()
+    if not struct_logs:
+        return gas
+    depth = struct_logs[0]['depth']
+    call = None  # (op, gas left, gas cost) of a call of the outer frame that has not returned yet
+    for log in struct_logs:
+        if log['depth'] != depth:
+            continue
+        if call is not None:
+            gas[call[0]] += call[1] - log['gas']
+            call = None
+        if log['op'] in CALL_OPS:
+            call = (log['op'], log['gas'], log['gasCost'])
+        else:
+            gas[log['op']] += log['gasCost']
+    if call is not None:
+        gas[call[0]] += call[2]
+    return gas
+
+
+class Profiler:
+    """
+    Replays every path of the atomic swap verifier with synthetic Bitcoin data and
+    records the gas of every transaction. If the node offers debug_traceTransaction,
+    the gas of each transaction is also broken down by opcode.
+    """
+
+    def __init__(self, w3, mediator, verifier, alice, bob, seed=0):
+        self.w3 = w3
+        self.mediator = mediator
+        self.verifier = verifier
+        self.alice = alice
+        self.bob = bob
+        self.rng = random.Random(seed)
+        self.gas_price = w3.eth.gasPrice
+        self.tracing = True
+        self.records = []
+
+        receipt = self.transact(None, mediator.functions.register_verifier(verifier.address, PROVISIONAL_COST), alice)
+        self.verifier_id = mediator.events.RegisteredVerifer().processReceipt(receipt)[0]['args']['_id']
+
+    def trace(self, tx_hash):
+        if not self.tracing:
+            return None
+        try:
+            result = self.w3.manager.request_blocking('debug_traceTransaction', [Web3.toHex(tx_hash), {'disableStorage': True, 'disableMemory': True}])
+        except Exception:
+            self.tracing = False
+            return None
+        return opcode_gas(result['structLogs'])
+
+    def transact(self, path, function, sender, value=0):
+        tx_hash = function.transact({'from': sender, 'value': value, 'gasPrice': self.gas_price})
+        receipt = self.w3.eth.waitForTransactionReceipt(tx_hash)
+        if receipt['status'] == 0:
+            raise RuntimeError("{} failed on path {}".format(function.fn_name, path))
+        if path is not None:
+            party = 'alice' if sender == self.alice else 'bob'
+            self.records.append((path, function.fn_name, party, receipt['gasUsed'], self.trace(tx_hash)))
+        return receipt
+
+    # runs a trade up to the VERIFYED_CONTRACT state of the verifier
+    def open_verification(self, path, chain, mined_blocks, tx_position):
+        starting_hash = header_hash(chain[0])
+        last_hash = header_hash(chain[mined_blocks])
+        tx_hash = header_hash(chain[tx_position])
+        trade_conditions = Web3.soliditySha3(['bytes8', 'bytes20', 'bytes32', 'bytes32'], [BTC_PRICE, BTC_ADDRESS, starting_hash, MAX_TARGET])
+        witness = Web3.soliditySha3(['uint16', 'bytes32'], [mined_blocks, last_hash])
+        deposit = SECURITY_DEPOSIT * self.gas_price
+        fee = PROVISIONAL_COST * self.gas_price
+
+        receipt = self.transact(path, self.mediator.functions.create(agreement_hash(self.verifier_id, trade_conditions)), self.alice, 1 + deposit)
+        trade_id = self.mediator.events.TradeID().processReceipt(receipt)[0]['args']['_id']
+        self.transact(path, self.mediator.functions.accept(trade_id), self.bob, deposit)
+        self.transact(path, self.mediator.functions.contest(trade_id, witness), self.bob, fee)
+        self.transact(path, self.mediator.functions.init_verification(trade_id, self.verifier_id, trade_conditions), self.alice, fee)
+        self.transact(path, self.verifier.functions.verify_agreement(trade_id, BTC_PRICE, BTC_ADDRESS, starting_hash, MAX_TARGET,
+                                                                     mined_blocks, last_hash, tx_hash), self.bob)
+        return trade_id
+
+    # Binary search over the longest possible chain, followed by six resolve_header_mismatch
+    # calls. Alice disputes a block close to the end, so Bob's headers include the block
+    # that has to match the agreed tx_hash.
+    def binary_search(self, mined_blocks):
+        path = 'binary_search'
+        chain = synthetic_chain(mined_blocks, self.rng)
+        disputed = mined_blocks - CONFIRMATIONS - 2
+        trade_id = self.open_verification(path, chain, mined_blocks, mined_blocks - CONFIRMATIONS)
+
+        self.transact(path, self.verifier.functions.search_start(trade_id), self.alice)
+        left, right = 0, mined_blocks
+        while left + 1 != right:
+            mid = binary_mid(left, right)
+            self.transact(path, self.verifier.functions.search_claim(trade_id, header_hash(chain[mid])), self.bob)
+            search_right = mid < disputed
+            self.transact(path, self.verifier.functions.search_partition(trade_id, search_right), self.alice)
+            left, right = (mid, right) if search_right else (left, mid)
+
+        for header in chain[left + 1:left + 1 + CONFIRMATIONS]:
+            self.transact(path, self.verifier.functions.resolve_header_mismatch(trade_id, *header_fields(header)), self.bob)
+
+    # k-ary search with the largest arity, followed by a single resolve_header_chain
+    def kary_search(self, mined_blocks, arity):
+        path = 'kary_search_{}'.format(arity)
+        chain = synthetic_chain(mined_blocks, self.rng)
+        disputed = mined_blocks - CONFIRMATIONS - 2
+        trade_id = self.open_verification(path, chain, mined_blocks, mined_blocks - CONFIRMATIONS)
+
+        self.transact(path, self.verifier.functions.search_start_kary(trade_id, arity), self.alice)
+        left, right = 0, mined_blocks
+        while left + 1 != right:
+            points = segment_points(left, right, arity)
+            self.transact(path, self.verifier.functions.search_claim_kary(trade_id, [header_hash(chain[p]) for p in points[1:-1]]), self.bob)
+            segment = max(i for i in range(len(points) - 1) if points[i] < disputed)
+            self.transact(path, self.verifier.functions.search_segment(trade_id, segment), self.alice)
+            left, right = points[segment], points[segment + 1]
+
+        headers = chain[left + 1:left + 1 + min(CONFIRMATIONS, mined_blocks - left)]
+        self.transact(path, self.verifier.functions.resolve_header_chain(trade_id, pack_headers(headers)), self.bob)
+
+    # Alice accepts the chain and Bob proves his transaction with a branch of the given depth
+    def spv(self, depth, inputs, outputs):
+        path = 'spv'
+        mined_blocks = 13  # the smallest chain verify_agreement accepts
+        tx = synthetic_tx(self.rng, inputs, outputs)
+        hashes = [random_bytes(self.rng, 32) for _ in range(depth)]
+        position = 2**depth - 1
+        root = calc_merkle_root(double_sha256(tx), hashes, position)
+        tx_position = mined_blocks - CONFIRMATIONS
+        chain = synthetic_chain(mined_blocks, self.rng, {tx_position: root})
+        trade_id = self.open_verification(path, chain, mined_blocks, tx_position)
+
+        self.transact(path, self.verifier.functions.hashes_ok(trade_id), self.alice)
+        self.transact(path, self.verifier.functions.verify_tx(trade_id, *header_fields(chain[tx_position]), tx, position, hashes), self.bob)
+
+
+def summarize(records):
+    paths = {}
+    for path, function, party, gas, opcodes in records:
+        p = paths.setdefault(path, {'functions': {}, 'verifier_gas': {'alice': 0, 'bob': 0}, 'mediator_gas': {'alice': 0, 'bob': 0}, 'opcodes': Counter()})
+        f = p['functions'].setdefault(function, {'calls': 0, 'gas': 0, 'max': 0, 'opcodes': Counter()})
+        f['calls'] += 1
+        f['gas'] += gas
+        f['max'] = max(f['max'], gas)
+        key = 'mediator_gas' if function in MEDIATOR_FUNCTIONS else 'verifier_gas'
+        p[key][party] += gas
+        if opcodes is not None and function not in MEDIATOR_FUNCTIONS:
+            f['opcodes'].update(opcodes)
+            p['opcodes'].update(opcodes)
+
+    for p in paths.values():
+        p['hotspots'] = p.pop('opcodes').most_common(HOTSPOTS)
+        for f in p['functions'].values():
+            f['hotspots'] = f.pop('opcodes').most_common(HOTSPOTS)
+    return paths
+
+
+# The verifier cost is the most gas a single honest party spends in the verifier on any
+# path, since both parties make a deposit of verifier_cost * gas price.
+def recommend(paths, margin=0.0):
+    gas, path, party = max((p['verifier_gas'][party], name, party) for name, p in paths.items() for party in ('alice', 'bob'))
+    cost = int(gas * (1 + margin))
+    cost = -(-cost // 1000) * 1000
+    return {'verifier_cost': cost, 'gas': gas, 'path': path, 'party': party, 'margin': margin}
+
+
+def print_report(paths, recommendation, tracing):
+    for name, p in paths.items():
+        print("Path {}: alice {} gas, bob {} gas in the verifier".format(name, p['verifier_gas']['alice'], p['verifier_gas']['bob']))
+        for function, f in p['functions'].items():
+            print("    {:<26} {:>3} calls {:>9} gas (max {})".format(function, f['calls'], f['gas'], f['max']))
+            if f['hotspots']:
+                print("        " + ", ".join("{} {}".format(op, gas) for op, gas in f['hotspots']))
+        print("")
+    if not tracing:
+        print("The node does not support debug_traceTransaction, no opcode hotspots were recorded.\n")
+    print("verifier_cost: {verifier_cost} ({party} spends {gas} gas on path {path}, margin {margin:.0%})".format(**recommendation))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Profile the worst-case gas of every path of the atomic swap verifier.")
+    parser.add_argument('--node', help="URL of a node offering debug_traceTransaction (default: in-process eth-tester without traces)")
+    parser.add_argument('--mined-blocks', type=int, default=MAX_MINED_BLOCKS)
+    parser.add_argument('--arity', type=int, default=16)
+    parser.add_argument('--merkle-depth', type=int, default=MERKLE_DEPTH)
+    parser.add_argument('--tx-inputs', type=int, default=1)
+    parser.add_argument('--tx-outputs', type=int, default=2)
+    parser.add_argument('--margin', type=float, default=0.0, help="safety margin on top of the measured gas, e.g., 0.05")
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    if args.node:
+        w3 = Web3( HTTPProvider(args.node) )
+        w3.eth.defaultAccount = w3.eth.accounts[0]
+    else:
+        w3 = tester_web3(BLOCK_GAS_LIMIT)
+
+    mediator, verifier = deploy(w3)
+    profiler = Profiler(w3, mediator, verifier, w3.eth.accounts[0], w3.eth.accounts[1])
+    profiler.binary_search(args.mined_blocks)
+    profiler.kary_search(args.mined_blocks, args.arity)
+    profiler.spv(args.merkle_depth, args.tx_inputs, args.tx_outputs)
+
+    paths = summarize(profiler.records)
+    recommendation = recommend(paths, args.margin)
+
+    if args.json:
+        print(json.dumps({'paths': paths, 'recommendation': recommendation, 'traced': profiler.tracing}, indent=2))
+    else:
+        print_report(paths, recommendation, profiler.tracing)
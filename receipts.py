@@ -0,0 +1,172 @@
+import asyncio
+
+from web3 import Web3
+
+try:
+    from web3.exceptions import TransactionNotFound
+except ImportError:  # older web3 versions return None for unknown receipts
+    TransactionNotFound = ()
+
+
+REORG_DEPTH = 64  # blocks whose hashes and transactions are remembered to detect reorgs
+
+
+class Inclusion:
+
+    def __init__(self, block_number, block_hash, timestamp=None):
+        self.block_number = block_number
+        self.block_hash = block_hash
+        self.timestamp = timestamp  # timestamp of the including block, unknown for receipts looked up directly
+
+
+class ReceiptResolver:
+    """
+    Resolves the receipts of many pending transactions by following the chain
+    instead of polling every transaction on its own. Every new block is fetched
+    once; receipts are only requested for transactions somebody waits for, once
+    their block is `confirmations` deep. Blocks that no longer link to the known
+    chain are rolled back and scanned again, so receipts of orphaned blocks are
+    never handed out. A hash that is not among the remembered blocks when wait()
+    registers it is looked up once with getTransactionReceipt, so transactions
+    mined before the resolver started or more than reorg_depth blocks ago
+    resolve as well.
+    """
+
+    def __init__(self, w3, call=None, poll_interval=0.5, timeout=None, confirmations=0, reorg_depth=REORG_DEPTH, start_block=None):
+        self.w3 = w3
+        self.call_fn = call
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.confirmations = confirmations
+        self.reorg_depth = reorg_depth
+
+        self.waiters = {}  # tx hash -> (future, deadline)
+        self.unchecked = set()  # waited for hashes that were not in the remembered blocks when registered
+        self.included = {}  # tx hash -> Inclusion, for every transaction of the remembered blocks
+        self.blocks = {}  # block number -> (block hash, tx hashes)
+        self.next_block = start_block  # defaults to the head when the resolver starts
+        self.head = None  # latest block number seen by poll
+        self.task = None
+
+    async def call(self, fn, *args):
+        if self.call_fn is not None:
+            return await self.call_fn(fn, *args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, fn, *args)
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.follow())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def wait(self, tx_hash, timeout=None):
+        tx_hash = bytes(tx_hash)
+        timeout = timeout if timeout is not None else self.timeout
+        loop = asyncio.get_running_loop()
+        if tx_hash not in self.waiters:
+            deadline = loop.time() + timeout if timeout is not None else None
+            self.waiters[tx_hash] = (loop.create_future(), deadline)
+            if tx_hash not in self.included:
+                self.unchecked.add(tx_hash)
+        self.start()
+        return await asyncio.shield(self.waiters[tx_hash][0])
+
+    async def follow(self):
+        try:
+            if self.next_block is None:
+                self.next_block = await self.call(lambda: self.w3.eth.blockNumber)
+            while True:
+                await self.poll()
+                await asyncio.sleep(self.poll_interval)
+        except Exception as e:
+            # a failing node fails everybody who waits instead of leaving them hanging
+            for future, _ in self.waiters.values():
+                if not future.done():
+                    future.set_exception(e)
+            self.waiters = {}
+            raise
+
+    async def poll(self):
+        head = await self.call(lambda: self.w3.eth.blockNumber)
+        self.head = head
+        while self.next_block <= head:
+            block = await self.call(self.w3.eth.getBlock, self.next_block)
+            if block is None:
+                break
+            parent = self.blocks.get(self.next_block - 1)
+            if parent is not None and parent[0] != block['parentHash']:
+                self.rollback(self.next_block - 1)
+                continue
+            self.add_block(block)
+            self.next_block += 1
+
+        await self.resolve(head)
+        self.expire()
+
+    def add_block(self, block):
+        tx_hashes = [bytes(tx_hash) for tx_hash in block['transactions']]
+        self.blocks[block['number']] = (block['hash'], tx_hashes)
+        for tx_hash in tx_hashes:
+            self.included[tx_hash] = Inclusion(block['number'], block['hash'], block['timestamp'])
+
+        old = block['number'] - self.reorg_depth
+        if old in self.blocks:
+            for tx_hash in self.blocks.pop(old)[1]:
+                self.included.pop(tx_hash, None)
+
+    # forgets the orphaned block and rescans it; repeated until the chains join again
+    def rollback(self, number):
+        _, tx_hashes = self.blocks.pop(number)
+        for tx_hash in tx_hashes:
+            self.included.pop(tx_hash, None)
+        self.next_block = number
+
+    # looks up hashes that may have been mined outside the remembered blocks
+    async def check(self):
+        unchecked, self.unchecked = self.unchecked, set()
+        for tx_hash in unchecked:
+            if tx_hash in self.included or tx_hash not in self.waiters:
+                continue
+            try:
+                receipt = await self.call(self.w3.eth.getTransactionReceipt, tx_hash)
+            except TransactionNotFound:
+                receipt = None
+            # still pending transactions are found in a later block
+            if receipt is not None and tx_hash not in self.included:
+                self.included[tx_hash] = Inclusion(receipt['blockNumber'], receipt['blockHash'])
+
+    async def resolve(self, head):
+        await self.check()
+        for tx_hash, (future, _) in list(self.waiters.items()):
+            inclusion = self.included.get(tx_hash)
+            if inclusion is None or inclusion.block_number + self.confirmations > head:
+                continue
+            try:
+                receipt = await self.call(self.w3.eth.getTransactionReceipt, tx_hash)
+            except TransactionNotFound:
+                receipt = None
+            # the receipt may already belong to a block we have not seen yet after a reorg
+            if receipt is None or receipt['blockHash'] != inclusion.block_hash:
+                continue
+            del self.waiters[tx_hash]
+            if inclusion.block_number not in self.blocks:
+                del self.included[tx_hash]  # found by check(), no block will forget it
+            if not future.done():
+                future.set_result(receipt)
+
+    def expire(self):
+        now = asyncio.get_running_loop().time()
+        for tx_hash, (future, deadline) in list(self.waiters.items()):
+            if deadline is not None and now > deadline:
+                del self.waiters[tx_hash]
+                if not future.done():
+                    future.set_exception(asyncio.TimeoutError(
+                        "transaction {} was not mined in time".format(Web3.toHex(tx_hash))))
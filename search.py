@@ -0,0 +1,257 @@
+import argparse
+import time
+
+from web3 import Web3, HTTPProvider
+
+from client import SECURITY_DEPOSIT, agreement_hash, load_contract
+
+BLOCK_TIME = 15  # seconds until a transaction is included, i.e., one Ethereum block
+
+# Estimated gas of the search transactions (Byzantium/Petersburg prices as used by solc 0.4.26
+# targets). The storage accesses are counted from the packed Verification layout: the indices,
+# the arity, the state and current_height share one slot, and every field assignment is a
+# separate load and store of that slot, as solc 0.4.26 emits them without the optimizer.
+# Only the intrinsic gas is validated: calldata_gas matches the ABI encoding of the search calls
+# for trade ids of two bytes and random hashes, and overestimates one-byte ids (64 gas) and
+# hashes with zero bytes (64 gas per byte). The storage and execution part has not been
+# compared with a node yet; `--measure` prints the measured gas next to the estimate. Nodes
+# running Istanbul or later charge other prices for calldata, SLOAD and SSTORE.
+MODEL_VALIDATED = False
+TX_BASE = 21000
+CALLDATA_ZERO = 4
+CALLDATA_NONZERO = 68
+SSTORE_SET = 20000
+SSTORE_RESET = 5000
+SLOAD = 200
+EXECUTION = 2500  # dispatch, access checks and memory handling of a call
+LOG = 375
+LOG_TOPIC = 375  # every event has its signature as the only topic
+LOG_DATA = 8
+
+# data bytes of the events of the search
+STATE_LOG = 64  # c_state(id, state), emitted by set_state in every call
+UPLOAD_HASH_LOG = 64  # next_upload_hash(id, index)
+UPLOAD_HASHES_LOG = 128  # next_upload_hashes(id, left_index, right_index, segments)
+HEADER_MISMATCH_LOG = 32  # c_header_mismatch(id)
+
+
+def segment_points(left, right, arity):
+    # mirrors AtomicSwap.search_segments and AtomicSwap.segment_index
+    segments = min(right - left, arity)
+    return [left + ((right - left) * i) // segments for i in range(segments + 1)]
+
+
+def binary_mid(left, right):
+    # mirrors the binary search in AtomicSwap.search_partition
+    return left + (right - left) // 2
+
+
+# Worst-case number of rounds until the range shrinks to a single block.
+def search_rounds(mined_blocks, arity):
+    rounds = {}
+
+    def worst(length):
+        if length <= 1:
+            return 0
+        if length not in rounds:
+            points = segment_points(0, length, arity)
+            rounds[length] = 1 + max(worst(b - a) for a, b in zip(points, points[1:]))
+        return rounds[length]
+
+    return worst(mined_blocks)
+
+
+def calldata_gas(words):
+    # selector plus ABI words, where ids and indices are mostly zero bytes and hashes are not
+    return 4 * CALLDATA_NONZERO + sum(CALLDATA_NONZERO * nonzero + CALLDATA_ZERO * (32 - nonzero) for nonzero in words)
+
+
+def call_gas(words, sloads, sstores_set, sstores_reset, logs=(STATE_LOG,)):
+    gas = TX_BASE + EXECUTION + calldata_gas(words) + sloads * SLOAD
+    gas += sstores_set * SSTORE_SET + sstores_reset * SSTORE_RESET
+    gas += sum(LOG + LOG_TOPIC + LOG_DATA * size for size in logs)
+    return gas
+
+
+# start_header_mismatch at the end of the last round: bob_current_resolving_header and set_state
+# rewrite the shared slot, bob_last_header is a new slot of a fresh verification
+def header_mismatch_gas():
+    return 4 * SLOAD + SSTORE_SET + 3 * SSTORE_RESET + 2 * (LOG + LOG_TOPIC) + LOG_DATA * (STATE_LOG + HEADER_MISMATCH_LOG)
+
+
+# Estimated gas of the whole binary search (search_claim + search_partition per round).
+def binary_search_gas(mined_blocks):
+    rounds = search_rounds(mined_blocks, 2)
+    gas = 0
+    for r in range(rounds):
+        # btc_headers[1] of a fresh verification is zero until the first claim; state,
+        # arity and bob are read, set_state rewrites the shared slot twice
+        claim = call_gas([2, 32], 5, 1 if r == 0 else 0, 2 if r == 0 else 3)
+        # index arithmetic reads the shared slot 15 times; left (or right) and mid index,
+        # the moved boundary hash and set_state's two fields are rewritten
+        partition = call_gas([2, 1], 15, 0, 5, logs=(STATE_LOG, UPLOAD_HASH_LOG))
+        if r == rounds - 1:
+            partition += header_mismatch_gas()
+        gas += claim + partition
+    return gas
+
+
+# Estimated gas of the whole k-ary search (search_claim_kary + search_segment per round).
+def kary_search_gas(mined_blocks, arity):
+    gas = 0
+    length = mined_blocks
+    first = True
+    while length > 1:
+        points = segment_points(0, length, arity)
+        hashes = len(points) - 2
+        # worst case: Alice always names the largest segment
+        length = max(b - a for a, b in zip(points, points[1:]))
+
+        # the claimed entries of btc_headers are new slots in the first round only
+        new_slots = hashes if first else 0
+        claim = call_gas([2, 1, 1] + [32] * hashes, 9, new_slots, hashes - new_slots + 2)
+        if length > 1:
+            # both boundary hashes, left and right index and set_state's two fields
+            segment = call_gas([2, 1], 24, 0, 6, logs=(STATE_LOG, UPLOAD_HASHES_LOG))
+        else:
+            # the last round ends in start_header_mismatch instead of set_state and next_upload_hashes
+            segment = call_gas([2, 1], 18, 0, 4, logs=()) + header_mismatch_gas()
+        gas += claim + segment
+        first = False
+    return gas
+
+
+def compare(mined_blocks_values, arities):
+    rows = []
+    for mined_blocks in mined_blocks_values:
+        row = {
+            'mined_blocks': mined_blocks,
+            'binary': {
+                'rounds': search_rounds(mined_blocks, 2),
+                'gas': binary_search_gas(mined_blocks),
+            }
+        }
+        for arity in arities:
+            row[arity] = {
+                'rounds': search_rounds(mined_blocks, arity),
+                'gas': kary_search_gas(mined_blocks, arity),
+            }
+        rows.append(row)
+    return rows
+
+
+def estimated_gas(mined_blocks, arity=None):
+    return binary_search_gas(mined_blocks) if arity is None else kary_search_gas(mined_blocks, arity)
+
+
+def print_comparison(rows, arities):
+    header = "{:>12} | {:>22}".format("mined_blocks", "binary rounds/gas/time")
+    for arity in arities:
+        header += " | {:>22}".format("k={} rounds/gas/time".format(arity))
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        line = "{:>12} | ".format(row['mined_blocks'])
+        cells = [row['binary']] + [row[arity] for arity in arities]
+        line += " | ".join("{:>4} {:>9} {:>6}s".format(c['rounds'], c['gas'], 2 * c['rounds'] * BLOCK_TIME) for c in cells)
+        print(line)
+
+
+# Brings a fresh trade into the VERIFYED_CONTRACT state of the atomic swap verifier,
+# using synthetic BTC data (the search does not inspect the uploaded hashes).
+def open_dispute(w3, mediator, verifier, verifier_id, verifier_cost, alice, bob, mined_blocks):
+    gas_price = w3.eth.gasPrice
+    security_deposit = SECURITY_DEPOSIT * gas_price
+
+    btc_amount = Web3.toBytes(hexstr="0x1b17143000000000")
+    btc_address = Web3.toBytes(hexstr="0x659c2a9bc407f28b3f44caaeb01c6ead271d76aa")
+    btc_header = Web3.toBytes(hexstr="0xbc4aceb11443ae1576bf38888fc9c660c950fdfb644921000000000000000000")
+    btc_difficulty = Web3.toBytes(hexstr="0x0000000000000000000000000000000000000000002945010000000000000000")
+    btc_last_hash = Web3.toBytes(hexstr="0x0202ac4d3ac56a5102f265b77ecdf1c011b8463f6d720a000000000000000000")
+    btc_tx_hash = Web3.toBytes(hexstr="0x10ae727d9ec0e6312c7e47e567d6049b95886e00ca564f000000000000000000")
+
+    trade_conditions = Web3.soliditySha3(['bytes8', 'bytes20', 'bytes32', 'bytes32'], [btc_amount, btc_address, btc_header, btc_difficulty])
+    witness = Web3.soliditySha3(['uint16', 'bytes32'], [mined_blocks, btc_last_hash])
+
+    tx_hash = mediator.functions.create(agreement_hash(verifier_id, trade_conditions)).transact({'from': alice, 'value': security_deposit, 'gasPrice': gas_price})
+    receipt = w3.eth.waitForTransactionReceipt(tx_hash)
+    trade_id = mediator.events.TradeID().processReceipt(receipt)[0]['args']['_id']
+
+    calls = [
+        (mediator.functions.accept(trade_id), {'from': bob, 'value': security_deposit}),
+        (mediator.functions.contest(trade_id, witness), {'from': bob, 'value': gas_price * verifier_cost}),
+        (mediator.functions.init_verification(trade_id, verifier_id, trade_conditions), {'from': alice, 'value': gas_price * verifier_cost}),
+        (verifier.functions.verify_agreement(trade_id, btc_amount, btc_address, btc_header, btc_difficulty, mined_blocks, btc_last_hash, btc_tx_hash), {'from': bob}),
+    ]
+    for function, params in calls:
+        tx_hash = function.transact(dict(params, gasPrice=gas_price))
+        w3.eth.waitForTransactionReceipt(tx_hash)
+
+    return trade_id
+
+
+# Runs a search on chain in which Alice disagrees with every block from disputed_block on
+# and returns the gas used by the rounds (without search_start, like the estimate) and the elapsed time.
+def measure_search(w3, verifier, trade_id, alice, bob, mined_blocks, disputed_block, arity=None):
+
+    def send(function, sender):
+        receipt = w3.eth.waitForTransactionReceipt(function.transact({'from': sender}))
+        return receipt['gasUsed']
+
+    def block_hash(index):
+        return Web3.soliditySha3(['uint256'], [index])
+
+    gas = 0
+    start = time.time()
+    left, right = 0, mined_blocks
+
+    if arity is None:
+        send(verifier.functions.search_start(trade_id), alice)
+        while left + 1 != right:
+            mid = binary_mid(left, right)
+            gas += send(verifier.functions.search_claim(trade_id, block_hash(mid)), bob)
+            search_right = mid < disputed_block
+            gas += send(verifier.functions.search_partition(trade_id, search_right), alice)
+            left, right = (mid, right) if search_right else (left, mid)
+    else:
+        send(verifier.functions.search_start_kary(trade_id, arity), alice)
+        while left + 1 != right:
+            points = segment_points(left, right, arity)
+            gas += send(verifier.functions.search_claim_kary(trade_id, [block_hash(p) for p in points[1:-1]]), bob)
+            segment = max(i for i in range(len(points) - 1) if points[i] < disputed_block)
+            gas += send(verifier.functions.search_segment(trade_id, segment), alice)
+            left, right = points[segment], points[segment + 1]
+
+    return gas, time.time() - start
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Compare the binary and the k-ary search for the first block of contention.")
+    parser.add_argument('--mined-blocks', type=int, nargs='+', default=[13, 20, 50, 100, 500, 1000, 10000, 65535])
+    parser.add_argument('--arity', type=int, nargs='+', default=[4, 8, 16])
+    parser.add_argument('--measure', action='store_true', help="run every search on the node at 127.0.0.1:8545 instead of estimating the gas")
+    parser.add_argument('--verifier-id', type=int, default=0)
+    parser.add_argument('--verifier-cost', type=int, default=1343000)
+    args = parser.parse_args()
+
+    if not args.measure:
+        print_comparison(compare(args.mined_blocks, args.arity), args.arity)
+        print("\ntime assumes one block ({}s) per transaction and two transactions per round".format(BLOCK_TIME))
+        if not MODEL_VALIDATED:
+            print("gas is estimated for the packed storage layout with pre-Istanbul prices and has not been validated on a node, run --measure to compare")
+    else:
+        w3 = Web3( HTTPProvider("http://127.0.0.1:8545") )
+        alice = w3.eth.accounts[0]
+        bob = w3.eth.accounts[1]
+        mediator = load_contract(w3, "mediator")
+        verifier = load_contract(w3, "atomic-swap-verifier")
+
+        for mined_blocks in args.mined_blocks:
+            for arity in [None] + args.arity:
+                trade_id = open_dispute(w3, mediator, verifier, args.verifier_id, args.verifier_cost, alice, bob, mined_blocks)
+                # the worst case for both searches is a dispute at the very end of the range
+                gas, elapsed = measure_search(w3, verifier, trade_id, alice, bob, mined_blocks, mined_blocks - 1, arity)
+                estimate = estimated_gas(mined_blocks, arity)
+                print("mined_blocks={} {}: {} gas (estimated {}, {:+.1%}), {:.2f}s".format(
+                    mined_blocks, "binary" if arity is None else "k={}".format(arity), gas, estimate, (estimate - gas) / gas, elapsed))
@@ -0,0 +1,92 @@
+import threading
+
+from eth_utils import event_abi_to_log_topic
+from web3 import Web3
+
+from client import ContractState
+
+
+class SlotPool:
+    """
+    Free-list of FINISHED trade ids per account, fed by the mediator's TradeState
+    events. A trade id belongs to the account that created the last trade in it,
+    so accounts do not compete for the same slots. Reusing a slot with
+    create(id, hash) overwrites non-zero storage, which is much cheaper than the
+    fresh slots written by create(hash).
+    """
+
+    def __init__(self, w3, mediator, start_block=0, chunk_size=2000, confirmations=0):
+        self.w3 = w3
+        self.mediator = mediator
+        self.chunk_size = chunk_size
+        self.confirmations = confirmations
+        self.last_block = start_block - 1
+        self.owners = {}  # trade id -> account that created the current trade
+        self.free = {}  # account -> set of FINISHED trade ids
+        self.reserved = set()  # ids handed out by acquire() whose CREATED event was not seen yet
+        self.lock = threading.Lock()
+
+    # seeds the pool from an EventIndexer instead of replaying all events
+    def load(self, indexer):
+        with self.lock:
+            for trade_id, alice in indexer.finished_trades():
+                self.owners[trade_id] = alice
+                self.free.setdefault(alice, set()).add(trade_id)
+            self.last_block = max(self.last_block, indexer.last_block)
+
+    def sync(self, to_block=None):
+        if to_block is None:
+            to_block = self.w3.eth.blockNumber - self.confirmations
+
+        event = self.mediator.events.TradeState()
+        topic = event_abi_to_log_topic(event.abi)
+        from_block = self.last_block + 1
+        while from_block <= to_block:
+            end = min(from_block + self.chunk_size - 1, to_block)
+            logs = self.w3.eth.getLogs({'fromBlock': from_block, 'toBlock': end, 'address': self.mediator.address,
+                                        'topics': [Web3.toHex(topic)]})
+            with self.lock:
+                for log in logs:
+                    args = event.processLog(log)['args']
+                    self.apply(args['_id'], args['_state'], args['_sender'])
+                self.last_block = end
+            from_block = end + 1
+        return self.last_block
+
+    def apply(self, trade_id, state, sender):
+        if state == ContractState.CREATED:
+            previous = self.owners.get(trade_id)
+            if previous is not None:
+                self.free.get(previous, set()).discard(trade_id)
+            self.owners[trade_id] = sender
+            self.reserved.discard(trade_id)
+        elif state == ContractState.FINISHED and trade_id not in self.reserved:
+            owner = self.owners.get(trade_id)
+            if owner is not None:
+                self.free.setdefault(owner, set()).add(trade_id)
+
+    # returns a FINISHED trade id of owner, or None if a new slot is needed
+    def acquire(self, owner):
+        with self.lock:
+            free = self.free.get(owner)
+            if not free:
+                return None
+            trade_id = free.pop()
+            self.reserved.add(trade_id)
+            return trade_id
+
+    # gives back a slot that could not be used; it returns to the pool with its next FINISHED event
+    def cancel(self, trade_id):
+        with self.lock:
+            self.reserved.discard(trade_id)
+
+    # puts a trade the caller saw finishing back into the pool without waiting for its event
+    def release(self, owner, trade_id):
+        with self.lock:
+            self.owners[trade_id] = owner
+            self.reserved.discard(trade_id)
+            self.free.setdefault(owner, set()).add(trade_id)
+
+    def available(self, owner):
+        with self.lock:
+            return len(self.free.get(owner, ()))
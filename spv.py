@@ -0,0 +1,256 @@
+import argparse
+from collections import OrderedDict
+
+from btc import HEADER_SIZE, double_sha256, header_hash
+
+BLOCK_FILE_MAGIC = bytes.fromhex('f9beb4d9')  # mainnet magic of Bitcoin Core's blk*.dat files
+MAX_MERKLE_DEPTH = 256  # AtomicSwap.verify_tx takes the merkle indices as uint256
+
+
+def read_varint(data, offset):
+    prefix = data[offset]
+    if prefix < 0xfd:
+        return prefix, offset + 1
+    size = {0xfd: 2, 0xfe: 4, 0xff: 8}[prefix]
+    return int.from_bytes(data[offset + 1:offset + 1 + size], 'little'), offset + 1 + size
+
+
+# Parses the transaction at offset and returns its serialization without witness data
+# (which determines the txid) together with the offset of the next transaction.
+def parse_tx(data, offset):
+    start = offset
+    offset += 4
+    segwit = data[offset] == 0 and data[offset + 1] == 1
+    if segwit:
+        offset += 2
+    body_start = offset
+
+    count, offset = read_varint(data, offset)
+    for _ in range(count):
+        offset += 36
+        length, offset = read_varint(data, offset)
+        offset += length + 4
+    count, offset = read_varint(data, offset)
+    for _ in range(count):
+        offset += 8
+        length, offset = read_varint(data, offset)
+        offset += length
+    body_end = offset
+
+    if segwit:
+        inputs, _ = read_varint(data, body_start)
+        for _ in range(inputs):
+            items, offset = read_varint(data, offset)
+            for _ in range(items):
+                length, offset = read_varint(data, offset)
+                offset += length
+
+    locktime = data[offset:offset + 4]
+    offset += 4
+    stripped = data[start:start + 4] + data[body_start:body_end] + locktime
+    return stripped, offset
+
+
+class Block:
+
+    def __init__(self, raw):
+        raw = bytes(raw)
+        self.header = raw[:HEADER_SIZE]
+        self.hash = header_hash(self.header)
+
+        count, offset = read_varint(raw, HEADER_SIZE)
+        self.transactions = []
+        for _ in range(count):
+            tx, offset = parse_tx(raw, offset)
+            self.transactions.append(tx)
+        self.txids = [double_sha256(tx) for tx in self.transactions]
+        self.positions = {txid: i for i, txid in enumerate(self.txids)}
+
+    @property
+    def merkle_root(self):
+        return self.header[36:68]
+
+    # header fields in the form expected by AtomicSwap.verify_tx
+    def header_fields(self):
+        h = self.header
+        return h[0:4], h[4:36], h[36:68], h[68:72], h[72:76], h[76:80]
+
+
+# Hashes a whole tree level in one go; odd levels repeat their last node as in Bitcoin.
+def hash_level(level):
+    if len(level) % 2 == 1:
+        level = level + [level[-1]]
+    joined = b''.join(level)
+    return [double_sha256(joined[i:i + 64]) for i in range(0, len(joined), 64)]
+
+
+class MerkleTree:
+
+    def __init__(self, txids):
+        self.levels = [list(txids)]
+        while len(self.levels[-1]) > 1:
+            self.levels.append(hash_level(self.levels[-1]))
+
+    @property
+    def root(self):
+        return self.levels[-1][0]
+
+    # Returns the branch and the indices in the format of AtomicSwap.calc_merkle_root,
+    # which are the position of the transaction: bit i is set if the hash at level i
+    # is the left sibling.
+    def branch(self, position):
+        if len(self.levels) - 1 > MAX_MERKLE_DEPTH:
+            raise ValueError("merkle tree is deeper than the {} levels supported by the verifier".format(MAX_MERKLE_DEPTH))
+        indices = position
+        hashes = []
+        for level in self.levels[:-1]:
+            sibling = position ^ 1
+            hashes.append(level[sibling] if sibling < len(level) else level[position])
+            position //= 2
+        return hashes, indices
+
+
+# mirrors AtomicSwap.calc_merkle_root
+def calc_merkle_root(tx_hash, hashes, indices):
+    current = tx_hash
+    for i, h in enumerate(hashes):
+        if (indices >> i) & 1:
+            current = double_sha256(h + current)
+        else:
+            current = double_sha256(current + h)
+    return current
+
+
+# Mirrors AtomicSwap.verify_tx_content, which only accepts P2SH outputs. Like the
+# verifier, the 8 value bytes of an output are compared as a big-endian number
+# against the bytes8 price of the agreement.
+def pays_to(tx, btc_address, btc_price):
+    price = int.from_bytes(btc_price, 'big')
+    offset = 4
+    if tx[4:6] == b'\x00\x01':  # segwit marker and flag
+        offset += 2
+    count, offset = read_varint(tx, offset)
+    for _ in range(count):
+        offset += 36
+        length, offset = read_varint(tx, offset)
+        offset += length + 4
+    count, offset = read_varint(tx, offset)
+    for _ in range(count):
+        value = int.from_bytes(tx[offset:offset + 8], 'big')
+        offset += 8
+        length, offset = read_varint(tx, offset)
+        script = tx[offset:offset + length]
+        offset += length
+        if value >= price and script[:2] == b'\xa9\x14' and script[2:22] == btc_address:
+            return True
+    return False
+
+
+class SpvProver:
+    """
+    Builds SPV proofs for AtomicSwap.verify_tx. Merkle trees are built once per block
+    and kept in an LRU cache, so proofs for further transactions of recently used
+    blocks only walk the cached tree.
+    """
+
+    def __init__(self, cache_size=16):
+        self.cache_size = cache_size
+        self.trees = OrderedDict()
+
+    def tree(self, block):
+        tree = self.trees.pop(block.hash, None)
+        if tree is None:
+            tree = MerkleTree(block.txids)
+            if tree.root != block.merkle_root:
+                raise ValueError("transactions of block {} do not match its merkle root".format(block.hash[::-1].hex()))
+        self.trees[block.hash] = tree
+        while len(self.trees) > self.cache_size:
+            self.trees.popitem(last=False)
+        return tree
+
+    # txid in internal byte order
+    def prove(self, block, txid):
+        if txid not in block.positions:
+            raise KeyError("transaction {} is not part of block {}".format(txid[::-1].hex(), block.hash[::-1].hex()))
+        position = block.positions[txid]
+        hashes, indices = self.tree(block).branch(position)
+        return SpvProof(block, block.transactions[position], hashes, indices)
+
+
+class SpvProof:
+
+    def __init__(self, block, tx, hashes, indices):
+        self.block = block
+        self.tx = tx
+        self.hashes = hashes
+        self.indices = indices
+
+    # arguments of AtomicSwap.verify_tx following the trade id
+    def arguments(self):
+        return list(self.block.header_fields()) + [self.tx, self.indices, self.hashes]
+
+    # Repeats the checks of verify_tx on the uploaded data, so that no gas is spent on a
+    # proof that fails: the header hashes to tx_block_hash (the block hash agreed in
+    # verify_agreement), the branch has at most 256 hashes and leads to the merkle root of
+    # the header, and the transaction pays at least btc_price to btc_address (pays_to).
+    # Not checked are the sender and the state of the verification, and a malformed
+    # transaction that makes the verifier revert on an out-of-bounds read simply fails here.
+    def verify(self, tx_block_hash, btc_address, btc_price):
+        if header_hash(self.block.header) != tx_block_hash:
+            return False
+        if len(self.hashes) > MAX_MERKLE_DEPTH:
+            return False
+        if calc_merkle_root(double_sha256(self.tx), self.hashes, self.indices) != self.block.merkle_root:
+            return False
+        return pays_to(self.tx, btc_address, btc_price)
+
+
+def read_block_file(path):
+    f = open(path, "rb")
+    data = f.read()
+    f.close()
+
+    # hex dump of a single block, e.g. from `bitcoin-cli getblock <hash> 0`
+    try:
+        return [bytes.fromhex(data.decode().strip())]
+    except ValueError:
+        pass
+
+    if not data.startswith(BLOCK_FILE_MAGIC):
+        return [data]
+
+    # blk*.dat: sequence of (magic, size, block)
+    blocks = []
+    offset = 0
+    while offset + 8 <= len(data) and data[offset:offset + 4] == BLOCK_FILE_MAGIC:
+        size = int.from_bytes(data[offset + 4:offset + 8], 'little')
+        blocks.append(data[offset + 8:offset + 8 + size])
+        offset += 8 + size
+    return blocks
+
+
+def load_block(path, block_hash=None):
+    for raw in read_block_file(path):
+        if block_hash is None or header_hash(raw[:HEADER_SIZE]) == block_hash:
+            return Block(raw)
+    raise KeyError("block not found in {}".format(path))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Build the verify_tx arguments for a transaction.")
+    parser.add_argument('block_file', help="raw block, hex dump of a block or blk*.dat file")
+    parser.add_argument('txid', help="txid as displayed by block explorers")
+    parser.add_argument('--block-hash', help="block hash as displayed by block explorers (for blk*.dat files)")
+    args = parser.parse_args()
+
+    block_hash = bytes.fromhex(args.block_hash)[::-1] if args.block_hash else None
+    block = load_block(args.block_file, block_hash)
+    proof = SpvProver().prove(block, bytes.fromhex(args.txid)[::-1])
+
+    print("block hash:     0x{}".format(block.hash.hex()))
+    print("transaction:    0x{}".format(proof.tx.hex()))
+    print("merkle indices: {}".format(proof.indices))
+    print("merkle hashes:")
+    for h in proof.hashes:
+        print("    0x{}".format(h.hex()))
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# in-process chain with freshly deployed contracts, skipped where solc cannot be installed
+@pytest.fixture
+def chain(monkeypatch):
+    import deploy
+    from benchmark import deploy as deploy_contracts, tester_web3
+
+    monkeypatch.chdir(ROOT)  # the contracts are compiled from and cached in the repository
+    try:
+        deploy.setup_solc()
+    except Exception as e:
+        pytest.skip("solc {} is not available: {}".format(deploy.SOLC_VERSION, e))
+    w3 = tester_web3()
+    mediator, verifier = deploy_contracts(w3)
+    return w3, mediator, verifier
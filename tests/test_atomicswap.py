@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from btc import header_hash, pack_header
+from profile_verifier import CONFIRMATIONS, Profiler, header_fields, synthetic_chain
+from search import binary_mid
+from watchdog import VerificationState
+
+MINED_BLOCKS = 20
+
+
+def states(verifier, receipt):
+    return [event['args']['state'] for event in verifier.events.c_state().processReceipt(receipt)]
+
+
+def finished(verifier, receipt):
+    return [event['args']['id'] for event in verifier.events.c_finished().processReceipt(receipt)]
+
+
+# Binary search in which Alice disputes the block at position disputed, so that Bob's
+# first header in resolve_header_mismatch is the one at disputed.
+def header_mismatch(profiler, chain, disputed):
+    verifier = profiler.verifier
+    trade_id = profiler.open_verification(None, chain, MINED_BLOCKS, MINED_BLOCKS - CONFIRMATIONS)
+    profiler.transact(None, verifier.functions.search_start(trade_id), profiler.alice)
+    left, right = 0, MINED_BLOCKS
+    while left + 1 != right:
+        mid = binary_mid(left, right)
+        profiler.transact(None, verifier.functions.search_claim(trade_id, header_hash(chain[mid])), profiler.bob)
+        search_right = mid < disputed
+        profiler.transact(None, verifier.functions.search_partition(trade_id, search_right), profiler.alice)
+        left, right = (mid, right) if search_right else (left, mid)
+    assert left + 1 == disputed
+    return trade_id
+
+
+# header that extends chain[position - 1] but is not chain[position]
+def forged_header(chain, position):
+    return pack_header(0x20000000, int.from_bytes(header_hash(chain[position - 1]), 'little'), 0, 1500000000, 0x1d00ffff, 12345)
+
+
+@pytest.mark.parametrize('disputed', [MINED_BLOCKS - CONFIRMATIONS, MINED_BLOCKS])
+def test_resolve_header_mismatch_stops_at_wrong_fixed_hash(chain, disputed):
+    w3, mediator, verifier = chain
+    profiler = Profiler(w3, mediator, verifier, w3.eth.accounts[0], w3.eth.accounts[1])
+    blocks = synthetic_chain(MINED_BLOCKS, random.Random(1))
+    trade_id = header_mismatch(profiler, blocks, disputed)
+
+    # the header links to Bob's last header and meets the target, but is not the agreed block
+    receipt = profiler.transact(None, verifier.functions.resolve_header_mismatch(trade_id, *header_fields(forged_header(blocks, disputed))), profiler.bob)
+    assert finished(verifier, receipt) == [3 if disputed < MINED_BLOCKS else 4]
+    assert states(verifier, receipt) == [VerificationState.FINISHED]
+
+    # the verification stays finished, Bob cannot continue uploading
+    with pytest.raises(Exception):
+        profiler.transact(None, verifier.functions.resolve_header_mismatch(trade_id, *header_fields(blocks[disputed])), profiler.bob)
+
+
+def test_resolve_header_mismatch_restarts_timeout(chain):
+    w3, mediator, verifier = chain
+    profiler = Profiler(w3, mediator, verifier, w3.eth.accounts[0], w3.eth.accounts[1])
+    blocks = synthetic_chain(MINED_BLOCKS, random.Random(2))
+    trade_id = header_mismatch(profiler, blocks, 5)
+
+    receipt = profiler.transact(None, verifier.functions.resolve_header_mismatch(trade_id, *header_fields(blocks[5])), profiler.bob)
+    assert finished(verifier, receipt) == [1]
+    assert states(verifier, receipt) == [VerificationState.HEADER_MISMATCH]
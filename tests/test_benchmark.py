@@ -0,0 +1,35 @@
+import benchmark
+from client import ContractState
+
+DISPUTES = ('2.1', '2.2', '3')
+
+
+def trade_states(mediator, receipt):
+    return [event['args']['_state'] for event in mediator.events.TradeState().processReceipt(receipt)]
+
+
+# runs every scenario of trade.py against freshly deployed contracts, as benchmark.py does
+def test_scenarios_run_end_to_end(chain):
+    w3, _, _ = chain
+    results, slots = benchmark.run(w3, mined_blocks=0)
+
+    assert [result['scenario'] for result in results] == [name for name, _ in benchmark.SCENARIOS]
+    for result in results:
+        assert benchmark.check(result) == []
+    assert slots['create_reused'] < slots['create']
+
+
+def test_disputes_start_verification_with_registered_verifier(chain):
+    w3, mediator, verifier = chain
+    alice, bob = w3.eth.accounts[0], w3.eth.accounts[1]
+    verifier_id = benchmark.trade.register_verifier(w3, mediator, verifier, alice)
+    trade_id = benchmark.trade.scenario_1(w3, mediator, verifier, alice, bob, verifier_id)
+
+    for name, scenario in benchmark.SCENARIOS:
+        if name not in DISPUTES:
+            continue
+        trace = []
+        scenario(w3, mediator, verifier, alice, bob, verifier_id, trade_id, trace)
+        receipts = dict((function, receipt) for function, _, receipt in trace)
+        assert all(receipt['status'] == 1 for _, _, receipt in trace)
+        assert trade_states(mediator, receipts['init_verification']) == [ContractState.WAITING]
@@ -0,0 +1,174 @@
+import random
+
+import pytest
+
+from btc import header_hash, pack_headers
+from header_store import DisputeResponder, HeaderStore
+from profile_verifier import MAX_TARGET, Profiler, synthetic_chain
+from search import segment_points
+
+MINED_BLOCKS = 20
+
+
+@pytest.fixture
+def blocks():
+    return synthetic_chain(MINED_BLOCKS + 4, random.Random(2))
+
+
+@pytest.fixture
+def store(tmpdir, blocks):
+    store = HeaderStore(str(tmpdir.join('headers')), base_height=100)
+    store.append(blocks)
+    yield store
+    store.close()
+
+
+def test_store_looks_up_headers_in_both_directions(store, blocks):
+    assert len(store) == len(blocks)
+    assert store.tip_height == 100 + len(blocks) - 1
+    assert store.header(105) == blocks[5]
+    assert store.hash(105) == header_hash(blocks[5])
+    assert store.height_of(header_hash(blocks[5])) == 105
+    assert store.headers(103, 3) == blocks[3:6]
+    assert store.height_of(b'\x00' * 32) is None
+    with pytest.raises(KeyError):
+        store.header(99)
+    with pytest.raises(KeyError):
+        store.headers(store.tip_height, 2)
+
+
+def test_store_reopens_and_only_appends_linked_headers(tmpdir, blocks):
+    path = str(tmpdir.join('headers'))
+    store = HeaderStore(path)
+    store.append(blocks[:10])
+    with pytest.raises(ValueError):
+        store.append(blocks[11:])
+    store.close()
+
+    store = HeaderStore(path)
+    assert len(store) == 10
+    assert store.height_of(header_hash(blocks[9])) == 9
+    store.append(blocks[10:])
+    assert store.height_of(header_hash(blocks[-1])) == len(blocks) - 1
+    store.close()
+
+
+def test_check_chain_compares_hashes_as_little_endian_numbers(store):
+    assert store.check_chain(100, 110, MAX_TARGET)
+    assert not store.check_chain(100, 110, b'\x00' * 32)
+    # the hash has to be strictly smaller than the target
+    target = (int.from_bytes(store.hash(104), 'little')).to_bytes(32, 'little')
+    assert not store.check_pow(104, target)
+
+
+class Call:
+
+    def __init__(self, verifier, name, args):
+        self.verifier = verifier
+        self.name = name
+        self.args = args
+
+    def call(self, block_identifier='latest'):
+        if self.name == 'search_range':
+            return self.verifier.ranges[block_identifier]
+        return MAX_TARGET
+
+    def transact(self, params):
+        self.verifier.sent.append((self.name,) + self.args)
+
+
+class Functions:
+
+    def __init__(self, verifier):
+        self.verifier = verifier
+
+    def __getattr__(self, name):
+        return lambda *args: Call(self.verifier, name, args)
+
+
+class Events:
+
+    def __getattr__(self, name):
+        return self
+
+    def createFilter(self, fromBlock):
+        return None
+
+
+# verifier whose search range after every block is given by the test
+class FakeVerifier:
+
+    def __init__(self):
+        self.ranges = {}
+        self.sent = []
+        self.functions = Functions(self)
+        self.events = Events()
+
+
+def next_upload_hash(trade_id, block, index):
+    return {'args': {'id': trade_id, 'index': index}, 'blockNumber': block}
+
+
+def test_binary_search_follows_the_range_of_the_verifier(store, blocks):
+    verifier = FakeVerifier()
+    responder = DisputeResponder(None, verifier, store, 'bob')
+    responder.watch(1, header_hash(blocks[0]), MINED_BLOCKS)
+
+    # the responder missed the rounds of blocks 2 and 3
+    verifier.ranges[1] = (0, 20)
+    responder.on_next_upload_hash(next_upload_hash(1, 1, 10))
+    verifier.ranges[4] = (10, 12)
+    responder.on_next_upload_hash(next_upload_hash(1, 4, 11))
+    assert verifier.sent == [('search_claim', 1, store.hash(110)), ('search_claim', 1, store.hash(111))]
+
+    # the last partition ends the search, the headers follow the mismatch event
+    verifier.ranges[5] = (11, 12)
+    responder.on_next_upload_hash(next_upload_hash(1, 5, 11))
+    responder.on_header_mismatch({'args': {'id': 1}, 'blockNumber': 5})
+    assert verifier.sent[2:] == [('resolve_header_chain', 1, pack_headers(blocks[12:18]))]
+    assert 1 not in responder.disputes
+
+
+def test_kary_mismatch_uploads_after_the_left_index_of_the_verifier(store, blocks):
+    verifier = FakeVerifier()
+    responder = DisputeResponder(None, verifier, store, 'bob')
+    responder.watch(1, header_hash(blocks[0]), MINED_BLOCKS)
+
+    responder.on_next_upload_hashes({'args': {'id': 1, 'left_index': 0, 'right_index': 20, 'segments': 4}, 'blockNumber': 1})
+    points = segment_points(0, 20, 4)
+    assert verifier.sent == [('search_claim_kary', 1, [store.hash(100 + p) for p in points[1:-1]])]
+
+    # Alice's last segment is only known to the verifier
+    verifier.ranges[3] = (18, 19)
+    responder.on_header_mismatch({'args': {'id': 1}, 'blockNumber': 3})
+    assert verifier.sent[1:] == [('resolve_header_chain', 1, pack_headers(blocks[19:21]))]
+
+
+def test_responder_answers_a_kary_search_on_chain(chain, tmpdir):
+    w3, mediator, verifier = chain
+    alice, bob = w3.eth.accounts[0], w3.eth.accounts[1]
+    profiler = Profiler(w3, mediator, verifier, alice, bob)
+    blocks = synthetic_chain(MINED_BLOCKS, random.Random(3))
+    trade_id = profiler.open_verification(None, blocks, MINED_BLOCKS, MINED_BLOCKS - 6)
+
+    store = HeaderStore(str(tmpdir.join('headers')))
+    store.append(blocks)
+    responder = DisputeResponder(w3, verifier, store, bob)
+    responder.watch(trade_id, header_hash(blocks[0]), MINED_BLOCKS)
+
+    disputed = 13
+    profiler.transact(None, verifier.functions.search_start_kary(trade_id, 4), alice)
+    left, right = 0, MINED_BLOCKS
+    while left + 1 != right:
+        responder.poll()
+        points = segment_points(left, right, 4)
+        segment = max(i for i in range(len(points) - 1) if points[i] < disputed)
+        profiler.transact(None, verifier.functions.search_segment(trade_id, segment), alice)
+        left, right = points[segment], points[segment + 1]
+    responder.poll()
+
+    assert trade_id not in responder.disputes
+    tx_hash = w3.eth.getBlock('latest')['transactions'][0]
+    assert w3.eth.getTransactionReceipt(tx_hash)['status'] == 1
+    assert verifier.decode_function_input(w3.eth.getTransaction(tx_hash)['input'])[0].fn_name == 'resolve_header_chain'
+    store.close()
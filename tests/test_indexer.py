@@ -0,0 +1,135 @@
+import json
+
+from eth_abi import encode_abi
+from eth_utils import event_abi_to_log_topic
+from web3 import Web3
+
+from client import ContractState
+from indexer import EventIndexer
+
+MEDIATOR = '0x' + 'aa' * 20
+VERIFIER = '0x' + 'bb' * 20
+ALICE = '0x' + '11' * 20
+BOB = '0x' + '22' * 20
+
+
+def event(name, *inputs):
+    return {'type': 'event', 'name': name, 'anonymous': False,
+            'inputs': [{'name': arg, 'type': kind, 'indexed': indexed} for arg, kind, indexed in inputs]}
+
+
+MEDIATOR_ABI = [
+    event('TradeState', ('_id', 'uint32', True), ('_state', 'uint8', False), ('_sender', 'address', True)),
+    event('RegisteredVerifer', ('_verifier', 'address', True), ('_deposit', 'uint256', True), ('_id', 'uint32', False)),
+]
+
+VERIFIER_ABI = [
+    event('addressEvent', ('addressStuff', 'address', False)),
+    event('c_finished', ('id', 'uint256', False)),
+    event('next_upload_hash', ('id', 'uint256', False), ('index', 'uint256', False)),
+    event('c_state', ('id', 'uint256', False), ('state', 'uint8', False)),
+    event('next_upload_hashes', ('id', 'uint256', False), ('left_index', 'uint256', False),
+          ('right_index', 'uint256', False), ('segments', 'uint256', False)),
+]
+
+
+class Eth:
+
+    def __init__(self):
+        self.logs = []
+        self.blockNumber = 0
+
+    def emit(self, address, abi, *values):
+        topics = [event_abi_to_log_topic(abi)]
+        types, data = [], []
+        for arg, value in zip(abi['inputs'], values):
+            if arg['indexed']:
+                topics.append(encode_abi([arg['type']], [value]))
+            else:
+                types.append(arg['type'])
+                data.append(value)
+        self.blockNumber += 1
+        self.logs.append({'address': address, 'topics': topics, 'data': Web3.toHex(encode_abi(types, data)),
+                          'blockNumber': self.blockNumber, 'logIndex': 0, 'transactionIndex': 0,
+                          'transactionHash': bytes([self.blockNumber]) * 32, 'blockHash': b'\x00' * 32})
+
+    def getLogs(self, params):
+        return [log for log in self.logs if params['fromBlock'] <= log['blockNumber'] <= params['toBlock']
+                and log['address'] in params['address']]
+
+
+class FakeWeb3:
+
+    def __init__(self):
+        self.eth = Eth()
+
+
+def abi_of(abi, name):
+    return [entry for entry in abi if entry['name'] == name][0]
+
+
+def setup(tmpdir):
+    w3 = FakeWeb3()
+    contracts = Web3().eth
+    mediator = contracts.contract(address=Web3.toChecksumAddress(MEDIATOR), abi=MEDIATOR_ABI)
+    verifier = contracts.contract(address=Web3.toChecksumAddress(VERIFIER), abi=VERIFIER_ABI)
+    indexer = EventIndexer(w3, mediator, [verifier], path=str(tmpdir.join('events.db')), chunk_size=2)
+    return w3, mediator, verifier, indexer
+
+
+def test_trades_follow_their_state_events(tmpdir):
+    w3, mediator, verifier, indexer = setup(tmpdir)
+    trade_state = abi_of(MEDIATOR_ABI, 'TradeState')
+    w3.eth.emit(mediator.address, trade_state, 7, ContractState.CREATED, ALICE)
+    w3.eth.emit(mediator.address, trade_state, 7, ContractState.ACCEPTED, BOB)
+    w3.eth.emit(mediator.address, trade_state, 7, ContractState.FINISHED, ALICE)
+    w3.eth.emit(mediator.address, abi_of(MEDIATOR_ABI, 'RegisteredVerifer'), verifier.address, 1343000, 0)
+
+    assert indexer.sync() == 4
+    assert indexer.trade(7) == (7, ContractState.FINISHED, Web3.toChecksumAddress(ALICE), Web3.toChecksumAddress(BOB), 3)
+    assert indexer.trades_for(Web3.toChecksumAddress(BOB)) == [7]
+    assert indexer.finished_trades() == [(7, Web3.toChecksumAddress(ALICE))]
+    assert indexer.verifier_id(verifier.address) == 0
+
+
+def test_every_verifier_event_is_indexed(tmpdir):
+    w3, mediator, verifier, indexer = setup(tmpdir)
+    w3.eth.emit(verifier.address, abi_of(VERIFIER_ABI, 'addressEvent'), ALICE)
+    w3.eth.emit(verifier.address, abi_of(VERIFIER_ABI, 'c_state'), 7, 2)
+    w3.eth.emit(verifier.address, abi_of(VERIFIER_ABI, 'next_upload_hashes'), 7, 0, 65535, 16)
+    w3.eth.emit(verifier.address, abi_of(VERIFIER_ABI, 'next_upload_hash'), 7, 32767)
+    w3.eth.emit(verifier.address, abi_of(VERIFIER_ABI, 'c_finished'), 3)
+    indexer.sync()
+
+    assert indexer.verifier_events_for(7) == [(2, 'c_state', 2), (3, 'next_upload_hashes', None), (4, 'next_upload_hash', 32767)]
+    assert indexer.verifier_event_args_for(7)[1] == (3, 'next_upload_hashes', {'id': 7, 'left_index': 0, 'right_index': 65535, 'segments': 16})
+    events = indexer.db.execute('SELECT event, trade_id, value, args FROM verifier_events ORDER BY block_number').fetchall()
+    assert events[0][:3] == ('addressEvent', None, None)
+    assert json.loads(events[0][3]) == {'addressStuff': Web3.toChecksumAddress(ALICE)}
+    assert events[-1][:3] == ('c_finished', None, 3)
+
+
+def test_sync_resumes_after_the_checkpoint(tmpdir):
+    w3, mediator, verifier, indexer = setup(tmpdir)
+    w3.eth.emit(verifier.address, abi_of(VERIFIER_ABI, 'c_state'), 7, 2)
+    assert indexer.sync() == 1
+    w3.eth.emit(verifier.address, abi_of(VERIFIER_ABI, 'c_state'), 7, 5)
+    indexer.close()
+
+    indexer = EventIndexer(w3, mediator, [verifier], path=str(tmpdir.join('events.db')))
+    assert indexer.last_block == 1
+    assert indexer.sync() == 2
+    assert [row[2] for row in indexer.verifier_events_for(7)] == [2, 5]
+
+
+def test_old_databases_gain_the_args_column(tmpdir):
+    w3, mediator, verifier, indexer = setup(tmpdir)
+    indexer.db.executescript('DROP TABLE verifier_events; CREATE TABLE verifier_events (block_number INTEGER NOT NULL, '
+                             'log_index INTEGER NOT NULL, address TEXT NOT NULL, event TEXT NOT NULL, trade_id INTEGER, '
+                             'value INTEGER, tx_hash TEXT NOT NULL, PRIMARY KEY (block_number, log_index));')
+    indexer.close()
+
+    w3.eth.emit(verifier.address, abi_of(VERIFIER_ABI, 'next_upload_hash'), 7, 3)
+    indexer = EventIndexer(w3, mediator, [verifier], path=str(tmpdir.join('events.db')))
+    indexer.sync()
+    assert indexer.verifier_event_args_for(7) == [(1, 'next_upload_hash', {'id': 7, 'index': 3})]
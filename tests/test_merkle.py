@@ -0,0 +1,63 @@
+import random
+
+import pytest
+from web3 import Web3
+
+import trade
+from btc import double_sha256
+from spv import MerkleTree, calc_merkle_root
+
+
+# the header fields of trade.py lack the zero bytes the ABI encoding pads them with
+def padded(value, size):
+    return value.ljust(size, b'\x00')
+
+
+def tx_block_header():
+    return (padded(trade.btc_tx_block_version, 4) + padded(trade.btc_tx_block_prev_hash, 32)
+            + padded(trade.btc_tx_block_merkle_root, 32) + padded(trade.btc_tx_block_timestamp, 4)
+            + padded(trade.btc_tx_block_difficulty, 4) + padded(trade.btc_tx_block_nonce, 4))
+
+
+# the transaction of trade.py sits at position 6 of its block
+def test_branch_of_the_example_transaction():
+    tx_hash = double_sha256(trade.btc_transaction)
+    hashes = [padded(h, 32) for h in trade.btc_merkle_hashes]
+    root = padded(trade.btc_tx_block_merkle_root, 32)
+    assert calc_merkle_root(tx_hash, hashes, trade.btc_block_merkle_indices) == root
+    assert calc_merkle_root(tx_hash, [padded(h, 32) for h in trade.btc_merkle_hashes_manipulated], trade.btc_block_merkle_indices) != root
+    assert calc_merkle_root(tx_hash, hashes, 7) != root
+    assert double_sha256(tx_block_header()) == Web3.toBytes(hexstr=trade.btc_tx_hash)
+
+
+# Bit i of the indices is set if the hash of level i is the left sibling, i.e., the
+# indices are the position of the transaction, least significant bit first.
+def test_indices_are_the_position():
+    txids = [bytes([i]) * 32 for i in range(4)]
+    tree = MerkleTree(txids)
+    hashes, indices = tree.branch(1)
+    assert indices == 1
+    assert hashes[0] == txids[0]
+    assert hashes[1] == double_sha256(txids[2] + txids[3])
+
+
+@pytest.mark.parametrize('count', [1, 2, 3, 5, 7, 8, 13, 100])
+def test_every_position_leads_to_the_root(count):
+    rng = random.Random(count)
+    txids = [rng.getrandbits(256).to_bytes(32, 'big') for _ in range(count)]
+    tree = MerkleTree(txids)
+    for position, txid in enumerate(txids):
+        hashes, indices = tree.branch(position)
+        assert indices == position
+        assert calc_merkle_root(txid, hashes, indices) == tree.root
+
+
+def test_positions_beyond_the_last_bit_use_the_full_uint256():
+    txid = b'\x01' * 32
+    rng = random.Random(0)
+    hashes = [rng.getrandbits(256).to_bytes(32, 'big') for _ in range(256)]
+    root = calc_merkle_root(txid, hashes, 2**255)
+    current = txid
+    for h in hashes[:-1]:
+        current = double_sha256(current + h)
+    assert root == double_sha256(hashes[-1] + current)
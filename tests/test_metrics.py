@@ -0,0 +1,119 @@
+import asyncio
+import json
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from client import Trade, TradeClient
+from metrics import NULL_SPAN, Histogram, MetricsServer, Span, Tracer, parse_limit
+
+RECEIPT = {'status': 1, 'transactionHash': b'\x01' * 32, 'gasUsed': 30000, 'blockNumber': 12}
+
+
+def test_histogram_counts_values_at_their_upper_bound():
+    histogram = Histogram((1, 5))
+    for value in (0, 1, 3, 5, 9):
+        histogram.observe(value)
+    assert histogram.counts == [2, 2, 1]
+    assert histogram.sum == 18 and histogram.count == 5
+
+
+def test_mark_clamps_earlier_times_between_the_previous_mark_and_now():
+    span = Span(1, 'accept')
+    span.mark('submit', at=span.start - 10)
+    assert span.phases['submit'] == 0
+    span.mark('mempool', at=time.perf_counter() + 10)
+    span.mark('receipt')
+    assert span.phases['mempool'] >= 0 and span.last <= time.perf_counter()
+
+
+def test_finished_spans_are_rendered_and_kept():
+    tracer = Tracer()
+    span = tracer.start(1, 'accept')
+    span.mark('prepare')
+    tracer.finish(span, RECEIPT, head=10)
+
+    text = tracer.metrics.render()
+    assert 'smartjudge_calls_total{function="accept",status="ok"} 1' in text
+    assert 'smartjudge_gas_used_total{function="accept"} 30000' in text
+    assert 'smartjudge_block_delay_bucket{function="accept",le="2"} 1' in text
+    assert 'smartjudge_block_delay_bucket{function="accept",le="1"} 0' in text
+    assert tracer.recent(1)[0]['block_delay'] == 2
+
+    assert Tracer(enabled=False).start(1, 'accept') is NULL_SPAN
+
+
+def test_parse_limit():
+    assert parse_limit('') == 100
+    assert parse_limit('limit=5') == 5
+    assert parse_limit('other=1&limit=7') == 7
+    for query in ('limit=abc', 'limit=', 'limit=0', 'limit=-3'):
+        assert parse_limit(query) is None
+
+
+def get(address, path):
+    try:
+        response = urllib.request.urlopen("http://{}:{}{}".format(address[0], address[1], path))
+    except urllib.error.HTTPError as e:
+        return e.code, None
+    return response.status, response.read().decode()
+
+
+def test_server_rejects_invalid_limits():
+    tracer = Tracer()
+    for trade_id in range(3):
+        tracer.finish(tracer.start(trade_id, 'accept'), RECEIPT)
+    server = MetricsServer(tracer, port=0)
+    address = server.start()
+    try:
+        status, body = get(address, "/spans?limit=2")
+        assert status == 200 and [span['trade_id'] for span in json.loads(body)] == [1, 2]
+        assert get(address, "/spans?limit=abc") == (400, None)
+        assert get(address, "/metrics")[0] == 200
+        assert get(address, "/other")[0] == 404
+    finally:
+        server.stop()
+
+
+class Function:
+    fn_name = 'accept'
+
+    def estimateGas(self, params):
+        time.sleep(0.05)
+        return 30000
+
+    def transact(self, params):
+        assert params['gas'] == 30000
+        return RECEIPT['transactionHash']
+
+
+class Client(TradeClient):
+
+    def __init__(self, pipeline=None):
+        TradeClient.__init__(self, None, None, gas_price=1, pipeline=pipeline, tracer=Tracer())
+
+    async def wait_for_receipt(self, tx_hash):
+        return RECEIPT
+
+
+class Pipeline:
+
+    def prepare(self, function, params):
+        return 'account', dict(params, gas=function.estimateGas(params))
+
+    def sign_transaction(self, account, transaction):
+        return account, transaction, b'raw'
+
+    def send_signed(self, signed, name):
+        return RECEIPT['transactionHash']
+
+
+@pytest.mark.parametrize('pipeline', [None, Pipeline()])
+def test_prepare_covers_the_gas_estimate(pipeline):
+    client = Client(pipeline)
+    asyncio.run(client.transact(Trade('alice', 'bob', b'\x00' * 32, 1, trade_id=1), 'accept', Function(), {'from': 'bob'}))
+    phases = client.tracer.recent(1)[0]['phases']
+    assert phases['prepare'] >= 0.05
+    assert ('sign' in phases) == (pipeline is not None)
@@ -0,0 +1,30 @@
+from profile_verifier import opcode_gas, recommend
+
+
+def step(op, gas, cost, depth=1):
+    return {'op': op, 'gas': gas, 'gasCost': cost, 'depth': depth}
+
+
+# calls of the outer frame are charged with everything the callee spent
+def test_calls_are_charged_with_the_gas_they_consumed():
+    trace = [
+        step('PUSH1', 1000, 3),
+        step('CALL', 997, 700),
+        step('SSTORE', 200, 5000, depth=2),
+        step('STOP', 100, 0, depth=2),
+        step('POP', 600, 2),
+        step('STATICCALL', 598, 700),  # never returns before the trace ends
+    ]
+    gas = opcode_gas(trace)
+    assert gas == {'PUSH1': 3, 'CALL': 397, 'POP': 2, 'STATICCALL': 700}
+    assert 'SSTORE' not in gas
+
+
+def test_recommendation_is_the_most_gas_of_a_single_party():
+    paths = {
+        'binary_search': {'verifier_gas': {'alice': 400000, 'bob': 900100}},
+        'spv': {'verifier_gas': {'alice': 30000, 'bob': 200000}},
+    }
+    recommendation = recommend(paths, margin=0.1)
+    assert recommendation['path'] == 'binary_search' and recommendation['party'] == 'bob'
+    assert recommendation['verifier_cost'] == 991000
@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+
+from receipts import ReceiptResolver, TransactionNotFound
+
+
+class Eth:
+    """Chain of blocks whose receipts follow the current branch."""
+
+    def __init__(self):
+        self.blocks = []
+        self.mine([])
+
+    def mine(self, tx_hashes, fork=None):
+        number = len(self.blocks) if fork is None else fork
+        del self.blocks[number:]
+        parent = self.blocks[-1]['hash'] if self.blocks else bytes(32)
+        block_hash = bytes([number, fork is not None]) + bytes(30)
+        self.blocks.append({'number': number, 'hash': block_hash, 'parentHash': parent,
+                            'timestamp': 1000 + number, 'transactions': list(tx_hashes)})
+
+    @property
+    def blockNumber(self):
+        return len(self.blocks) - 1
+
+    def getBlock(self, number):
+        return self.blocks[number] if number < len(self.blocks) else None
+
+    def getTransactionReceipt(self, tx_hash):
+        for block in self.blocks:
+            if tx_hash in block['transactions']:
+                return {'transactionHash': tx_hash, 'blockNumber': block['number'], 'blockHash': block['hash'], 'status': 1}
+        raise TransactionNotFound("unknown transaction")
+
+
+class Web3:
+
+    def __init__(self):
+        self.eth = Eth()
+
+
+async def direct(fn, *args):
+    return fn(*args)
+
+
+def resolver(w3, **kwargs):
+    return ReceiptResolver(w3, direct, poll_interval=0.01, **kwargs)
+
+
+def tx(i):
+    return bytes([i]) * 32
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 5))
+
+
+def test_transaction_mined_while_waiting():
+    w3 = Web3()
+    receipts = resolver(w3)
+
+    async def main():
+        waiting = asyncio.ensure_future(receipts.wait(tx(1)))
+        await asyncio.sleep(0.05)
+        w3.eth.mine([tx(1)])
+        receipt = await waiting
+        await receipts.stop()
+        return receipt
+
+    assert run(main())['blockNumber'] == 1
+
+
+def test_transaction_mined_before_the_resolver_started():
+    w3 = Web3()
+    w3.eth.mine([tx(1)])
+    w3.eth.mine([])
+    receipts = resolver(w3)
+
+    async def main():
+        receipt = await receipts.wait(tx(1))
+        await receipts.stop()
+        return receipt
+
+    assert run(main())['blockNumber'] == 1
+    assert tx(1) not in receipts.included
+
+
+def test_transaction_older_than_the_remembered_blocks():
+    w3 = Web3()
+    receipts = resolver(w3, reorg_depth=2)
+
+    async def main():
+        receipts.start()
+        w3.eth.mine([tx(1)])
+        for _ in range(4):
+            w3.eth.mine([])
+        await asyncio.sleep(0.05)
+        assert tx(1) not in receipts.included
+        receipt = await receipts.wait(tx(1))
+        await receipts.stop()
+        return receipt
+
+    assert run(main())['blockNumber'] == 1
+
+
+def test_reorged_transaction_resolves_in_the_new_branch():
+    w3 = Web3()
+    receipts = resolver(w3, confirmations=1)
+
+    async def main():
+        waiting = asyncio.ensure_future(receipts.wait(tx(1)))
+        w3.eth.mine([tx(1)])
+        await asyncio.sleep(0.05)
+        # the block is replaced before it is confirmed, the transaction moves to the next one
+        w3.eth.mine([], fork=1)
+        w3.eth.mine([tx(1)])
+        w3.eth.mine([])
+        receipt = await waiting
+        await receipts.stop()
+        return receipt
+
+    receipt = run(main())
+    assert receipt['blockNumber'] == 2 and receipt['blockHash'] == w3.eth.blocks[2]['hash']
+
+
+def test_unmined_transaction_times_out():
+    receipts = resolver(Web3(), timeout=0.05)
+
+    async def main():
+        try:
+            await receipts.wait(tx(1))
+        finally:
+            await receipts.stop()
+
+    with pytest.raises(asyncio.TimeoutError):
+        run(main())
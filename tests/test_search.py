@@ -0,0 +1,64 @@
+import math
+
+import pytest
+from eth_abi import encode_abi
+from web3 import Web3
+
+from search import (CALLDATA_NONZERO, CALLDATA_ZERO, binary_mid, binary_search_gas, calldata_gas,
+                    kary_search_gas, search_rounds, segment_points)
+
+
+def test_segment_points_cover_the_range():
+    assert segment_points(0, 20, 4) == [0, 5, 10, 15, 20]
+    assert segment_points(10, 13, 16) == [10, 11, 12, 13]  # shorter ranges get segments of one block
+    for left, right, arity in [(0, 65535, 16), (7, 100, 3), (0, 13, 2)]:
+        points = segment_points(left, right, arity)
+        assert points[0] == left and points[-1] == right
+        assert all(a < b for a, b in zip(points, points[1:]))
+
+
+# rounds of a search in which Alice always names the given segment
+def play(mined_blocks, arity, choose):
+    left, right, rounds = 0, mined_blocks, 0
+    while left + 1 != right:
+        points = segment_points(left, right, arity)
+        segment = choose(points)
+        left, right = points[segment], points[segment + 1]
+        rounds += 1
+    return rounds
+
+
+@pytest.mark.parametrize('mined_blocks', [13, 20, 100, 1000, 65535])
+def test_search_rounds_is_the_worst_case(mined_blocks):
+    assert search_rounds(mined_blocks, 2) == math.ceil(math.log2(mined_blocks))
+    for arity in (2, 4, 16):
+        largest = play(mined_blocks, arity, lambda points: max(range(len(points) - 1), key=lambda i: points[i + 1] - points[i]))
+        assert search_rounds(mined_blocks, arity) == largest
+        assert play(mined_blocks, arity, lambda points: 0) <= largest
+
+
+def test_binary_mid_mirrors_search_partition():
+    assert binary_mid(0, 20) == 10
+    assert binary_mid(13, 15) == 14
+
+
+def calldata(signature, types, args):
+    data = Web3.keccak(text=signature)[:4] + encode_abi(types, args)
+    return sum(CALLDATA_ZERO if byte == 0 else CALLDATA_NONZERO for byte in data)
+
+
+# The intrinsic part of the estimate is exact for two-byte ids and hashes without zero
+# bytes, zero bytes of hashes are counted as non-zero.
+def test_calldata_gas_matches_the_abi_encoding():
+    block_hash = Web3.keccak(text="block")
+    assert calldata_gas([2, 32]) == calldata('search_claim(uint32,bytes32)', ['uint32', 'bytes32'], [300, block_hash])
+    assert calldata_gas([2, 1]) == calldata('search_partition(uint32,bool)', ['uint32', 'bool'], [300, True])
+    hashes = [Web3.keccak(text=str(i)) for i in range(3)]
+    zero_bytes = sum(h.count(0) for h in hashes)
+    assert calldata_gas([2, 1, 1] + [32] * 3) == calldata('search_claim_kary(uint32,bytes32[])', ['uint32', 'bytes32[]'], [300, hashes]) \
+        + zero_bytes * (CALLDATA_NONZERO - CALLDATA_ZERO)
+
+
+def test_kary_search_needs_fewer_rounds_but_more_gas_per_round():
+    assert kary_search_gas(65535, 16) < binary_search_gas(65535)
+    assert binary_search_gas(13) > 0
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from client import ContractState, Trade, TradeClient
+from slots import SlotPool
+
+ALICE = '0x' + '11' * 20
+CAROL = '0x' + '22' * 20
+
+
+def pool_with(events):
+    pool = SlotPool(None, None)
+    for trade_id, state, sender in events:
+        pool.apply(trade_id, state, sender)
+    return pool
+
+
+def test_finished_trades_return_to_their_creator():
+    pool = pool_with([(1, ContractState.CREATED, ALICE), (2, ContractState.CREATED, CAROL),
+                      (1, ContractState.FINISHED, CAROL), (2, ContractState.FINISHED, ALICE)])
+    assert pool.acquire(ALICE) == 1
+    assert pool.acquire(ALICE) is None
+    assert pool.acquire(CAROL) == 2
+
+
+def test_reserved_slots_are_not_handed_out_twice():
+    pool = pool_with([(1, ContractState.CREATED, ALICE), (1, ContractState.FINISHED, ALICE)])
+    assert pool.acquire(ALICE) == 1
+    pool.apply(1, ContractState.FINISHED, ALICE)  # replayed event of the old trade
+    assert pool.available(ALICE) == 0
+
+    # a cancelled slot comes back with its next FINISHED event, a created one never
+    pool.cancel(1)
+    pool.apply(1, ContractState.FINISHED, ALICE)
+    assert pool.acquire(ALICE) == 1
+    pool.apply(1, ContractState.CREATED, ALICE)
+    assert 1 not in pool.reserved and pool.available(ALICE) == 0
+
+
+def test_release_makes_the_slot_available_at_once():
+    pool = SlotPool(None, None)
+    pool.release(ALICE, 3)
+    assert pool.acquire(ALICE) == 3
+
+
+class Functions:
+
+    def create(self, *args):
+        return ('create',) + args
+
+
+class Mediator:
+    functions = Functions()
+
+
+# the reused slot was taken by another trade, so create(id, hash) reverts in the gas estimate
+class RevertingClient(TradeClient):
+
+    def __init__(self, slots, error):
+        TradeClient.__init__(self, None, Mediator(), gas_price=1, slots=slots)
+        self.error = error
+        self.sent = []
+
+    async def transact(self, trade, name, function, params):
+        self.sent.append(function)
+        if len(function) == 3:
+            raise self.error
+        trade.id = 9
+
+
+def test_create_falls_back_to_a_new_slot_when_the_reuse_reverts():
+    pool = SlotPool(None, None)
+    pool.release(ALICE, 3)
+    client = RevertingClient(pool, ValueError("execution reverted"))
+    trade = Trade(ALICE, CAROL, b'\x00' * 32, 1)
+
+    asyncio.run(client.create(trade))
+    assert client.sent == [('create', 3, trade.agreement), ('create', trade.agreement)]
+    assert trade.id == 9 and trade.state == ContractState.CREATED
+    assert pool.reserved == set()
+
+
+def test_create_gives_back_the_slot_on_other_errors():
+    pool = SlotPool(None, None)
+    pool.release(ALICE, 3)
+    client = RevertingClient(pool, asyncio.TimeoutError())
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(client.create(Trade(ALICE, CAROL, b'\x00' * 32, 1)))
+    assert pool.reserved == set()
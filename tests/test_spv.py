@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+from btc import double_sha256, header_hash, pack_header
+from profile_verifier import BTC_ADDRESS, BTC_PRICE, synthetic_tx
+from spv import BLOCK_FILE_MAGIC, Block, MerkleTree, SpvProver, load_block, parse_tx, read_block_file
+
+
+# the same transaction with a segwit marker and one witness item per input
+def with_witness(tx, rng):
+    inputs = tx[4]
+    witness = b''.join(b'\x01\x48' + bytes(rng.getrandbits(8) for _ in range(0x48)) for _ in range(inputs))
+    return tx[:4] + b'\x00\x01' + tx[4:-4] + witness + tx[-4:]
+
+
+def raw_block(transactions, merkle_root=None):
+    if merkle_root is None:
+        merkle_root = MerkleTree([double_sha256(parse_tx(tx, 0)[0]) for tx in transactions]).root
+    header = pack_header(0x20000000, 0, int.from_bytes(merkle_root, 'little'), 1500000000, 0x1d00ffff, 0)
+    return header + bytes([len(transactions)]) + b''.join(transactions)
+
+
+@pytest.fixture
+def transactions():
+    rng = random.Random(7)
+    legacy = [synthetic_tx(rng, inputs=i + 1) for i in range(5)]
+    return legacy, legacy[:2] + [with_witness(legacy[2], rng)] + legacy[3:]
+
+
+def test_txid_ignores_witness_data(transactions):
+    legacy, mixed = transactions
+    stripped, offset = parse_tx(mixed[2], 0)
+    assert stripped == legacy[2]
+    assert offset == len(mixed[2])
+
+    block = Block(raw_block(mixed))
+    assert block.transactions == legacy
+    assert block.txids == [double_sha256(tx) for tx in legacy]
+
+
+def test_proofs_verify_like_the_contract(transactions):
+    legacy, mixed = transactions
+    block = Block(raw_block(mixed))
+    proof = SpvProver().prove(block, double_sha256(legacy[3]))
+
+    assert proof.indices == 3
+    assert proof.verify(block.hash, BTC_ADDRESS, BTC_PRICE)
+    assert not proof.verify(b'\x00' * 32, BTC_ADDRESS, BTC_PRICE)
+    assert not proof.verify(block.hash, b'\x00' * 20, BTC_PRICE)
+    # the price is compared as a big-endian number
+    higher = (int.from_bytes(BTC_PRICE, 'big') + 1).to_bytes(8, 'big')
+    assert not proof.verify(block.hash, BTC_ADDRESS, higher)
+
+    proof.hashes = proof.hashes[::-1]
+    assert not proof.verify(block.hash, BTC_ADDRESS, BTC_PRICE)
+
+    fields = proof.arguments()
+    assert b''.join(fields[:6]) == block.header
+    assert fields[6:] == [legacy[3], 3, proof.hashes]
+
+
+def test_prover_caches_trees_and_checks_the_merkle_root(transactions):
+    legacy, _ = transactions
+    blocks = [Block(raw_block(legacy[:count])) for count in (2, 3, 4)]
+    prover = SpvProver(cache_size=2)
+    tree = prover.tree(blocks[0])
+    assert prover.tree(blocks[0]) is tree
+    prover.tree(blocks[1])
+    prover.tree(blocks[2])
+    assert list(prover.trees) == [blocks[1].hash, blocks[2].hash]
+
+    with pytest.raises(KeyError):
+        prover.prove(blocks[0], double_sha256(legacy[3]))
+    with pytest.raises(ValueError):
+        prover.tree(Block(raw_block(legacy, merkle_root=b'\x00' * 32)))
+
+
+def test_block_files(tmpdir, transactions):
+    legacy, mixed = transactions
+    first, second = raw_block(legacy[:2]), raw_block(mixed)
+
+    path = tmpdir.join('block.hex')
+    path.write(second.hex() + "\n")
+    assert read_block_file(str(path)) == [second]
+
+    path = tmpdir.join('blk00000.dat')
+    path.write_binary(b''.join(BLOCK_FILE_MAGIC + len(raw).to_bytes(4, 'little') + raw for raw in (first, second)))
+    assert read_block_file(str(path)) == [first, second]
+    assert load_block(str(path), header_hash(second[:80])).transactions == legacy
+    with pytest.raises(KeyError):
+        load_block(str(path), b'\x00' * 32)
@@ -0,0 +1,16 @@
+import pytest
+
+from benchmark import compare_baseline, run, run_baseline
+
+BASELINE = '38a2129^'  # last commit before the packed storage layout
+PACKED_FUNCTIONS = ('create', 'accept', 'contest', 'init_verification', 'search_partition')
+
+
+# Runs the scenarios of trade.py on the packed layout and on the baseline commit and
+# expects every function touched by the layout change to use less gas.
+def test_packed_layout_saves_gas(chain):
+    w3 = chain[0]
+    results, _ = run(w3, mined_blocks=0)
+    comparison = dict((row['function'], row) for row in compare_baseline(results, run_baseline(BASELINE)))
+    for function in PACKED_FUNCTIONS:
+        assert comparison[function]['saved'] > 0, comparison[function]
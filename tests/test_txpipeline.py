@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+import benchmark
+from txpipeline import NonceManager, RpcError, TransactionPipeline
+
+ABI = [{'type': 'function', 'name': 'f', 'inputs': [{'name': 'x', 'type': 'uint256'}], 'outputs': [],
+        'stateMutability': 'nonpayable', 'constant': False, 'payable': False}]
+
+
+@pytest.fixture
+def w3():
+    return benchmark.tester_web3()
+
+
+@pytest.fixture
+def pipeline(w3):
+    keys = [key.to_hex() for key in w3.provider.ethereum_tester.backend.account_keys[:2]]
+    return TransactionPipeline(w3, keys)
+
+
+def test_nonces_are_unique_across_threads(w3):
+    nonces = NonceManager(w3)
+    address = w3.eth.accounts[0]
+    allocated = []
+
+    def allocate():
+        for _ in range(100):
+            allocated.append(nonces.allocate(address))
+
+    threads = [threading.Thread(target=allocate) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(allocated) == list(range(800))
+
+
+def test_reset_reads_the_node_again(w3):
+    nonces = NonceManager(w3)
+    address = w3.eth.accounts[0]
+    assert [nonces.allocate(address) for _ in range(3)] == [0, 1, 2]
+    w3.eth.sendTransaction({'from': address, 'to': address, 'value': 0})
+    nonces.reset(address)
+    assert nonces.allocate(address) == 1
+
+
+def test_every_call_is_estimated(w3, pipeline, monkeypatch):
+    estimates = iter([50000, 90000])
+    monkeypatch.setattr(w3.eth, 'estimateGas', lambda transaction: next(estimates))
+    contract = w3.eth.contract(address=w3.eth.accounts[5], abi=ABI)
+    sender = pipeline.addresses[0]
+
+    gas = [pipeline.sign(contract.functions.f(i), {'from': sender})[1]['gas'] for i in range(2)]
+    assert gas == [60000, 108000]
+
+    # functions with a fixed limit are never estimated
+    pipeline.gas['f'] = 30000
+    assert pipeline.sign(contract.functions.f(2), {'from': sender})[1]['gas'] == 30000
+
+
+def test_failed_batch_leaves_gaps_that_recover_fills(w3, pipeline, monkeypatch):
+    address = pipeline.addresses[0]
+    signed = [pipeline.filler(address, pipeline.nonces.allocate(address)) for _ in range(2)]
+
+    def fail(raw_transactions):
+        raise RpcError("batch rejected")
+
+    monkeypatch.setattr(pipeline.sender, 'send', fail)
+    with pytest.raises(RpcError):
+        pipeline.submit(signed)
+    assert pipeline.gaps[address] == {0, 1}
+    monkeypatch.undo()
+
+    assert pipeline.recover() == 2
+    assert w3.eth.getTransactionCount(address) == 2
+    assert pipeline.recover() == 0
@@ -0,0 +1,109 @@
+from web3 import Web3
+
+from client import ContractState
+from watchdog import RETRY_BLOCKS, TIMEOUT_BLOCKS, VerificationState, Watchdog
+
+ALICE = Web3.toChecksumAddress('0x' + '11' * 20)
+BOB = Web3.toChecksumAddress('0x' + '22' * 20)
+
+TIMEOUT_ABI = {'type': 'function', 'name': 'timeout', 'stateMutability': 'nonpayable', 'outputs': [],
+               'inputs': [{'name': 'id', 'type': 'uint32'}]}
+MEDIATOR_ABI = [TIMEOUT_ABI, {'type': 'event', 'name': 'TradeState', 'anonymous': False, 'inputs': [
+    {'name': '_id', 'type': 'uint32', 'indexed': True}, {'name': '_state', 'type': 'uint8', 'indexed': False},
+    {'name': '_sender', 'type': 'address', 'indexed': True}]}]
+VERIFIER_ABI = [TIMEOUT_ABI, {'type': 'event', 'name': 'c_state', 'anonymous': False, 'inputs': [
+    {'name': 'id', 'type': 'uint256', 'indexed': False}, {'name': 'state', 'type': 'uint8', 'indexed': False}]}]
+
+
+def watchdog(accounts, respond=None, margin=10):
+    contracts = Web3().eth
+    mediator = contracts.contract(address=Web3.toChecksumAddress('0x' + 'aa' * 20), abi=MEDIATOR_ABI)
+    verifier = contracts.contract(address=Web3.toChecksumAddress('0x' + 'bb' * 20), abi=VERIFIER_ABI)
+    return Watchdog(None, mediator, verifier, accounts, respond=respond, margin=margin)
+
+
+def accepted(dog, trade_id, height):
+    dog.on_trade_state(trade_id, ContractState.CREATED, ALICE, height)
+    dog.on_trade_state(trade_id, ContractState.ACCEPTED, BOB, height)
+
+
+def timeouts(calls):
+    return [(function.address, function.args[0], params['from']) for function, params in calls]
+
+
+def test_timeout_is_claimed_in_the_block_of_the_deadline():
+    dog = watchdog([ALICE])
+    accepted(dog, 1, 100)
+    deadline = 100 + TIMEOUT_BLOCKS
+
+    assert dog.expired(deadline - 2) == []
+    calls = dog.expired(deadline - 1)
+    assert timeouts(calls) == [(dog.contracts['mediator'].address, 1, ALICE)]
+
+
+def test_only_expired_entries_are_popped_in_deadline_order():
+    dog = watchdog([ALICE])
+    for trade_id, height in ((1, 300), (2, 100), (3, 200)):
+        accepted(dog, trade_id, height)
+
+    assert [call[1] for call in timeouts(dog.expired(200 + TIMEOUT_BLOCKS - 1))] == [2, 3]
+    # only the retries of the sent timeouts stay in the heap besides trade 1
+    assert sorted(entry[2].trade_id for entry in dog.heap if entry[0] < 300 + TIMEOUT_BLOCKS) == [2, 3]
+
+
+def test_superseded_and_finished_deadlines_are_skipped():
+    dog = watchdog([ALICE, BOB])
+    accepted(dog, 1, 100)
+    dog.on_trade_state(1, ContractState.CONTENDED, BOB, 150)
+    assert dog.expired(100 + TIMEOUT_BLOCKS) == []
+
+    # Bob claims the timeout of the contention
+    assert timeouts(dog.expired(150 + TIMEOUT_BLOCKS)) == [(dog.contracts['mediator'].address, 1, BOB)]
+
+    # Alice starts the verification in time, which ends the mediator's deadline
+    dog.on_trade_state(1, ContractState.WAITING, ALICE, 200)
+    dog.on_verification_state(1, VerificationState.SEARCHING, 200)
+    dog.on_verification_state(1, VerificationState.FINISHED, 210)
+    assert dog.expired(200 + TIMEOUT_BLOCKS) == []
+    assert dog.current == {}
+
+
+def test_deadlines_of_other_accounts_are_ignored():
+    dog = watchdog([BOB])
+    accepted(dog, 1, 100)
+    assert dog.expired(100 + TIMEOUT_BLOCKS) == []
+
+
+def test_timeout_is_sent_again_after_retry_blocks():
+    dog = watchdog([ALICE])
+    accepted(dog, 1, 100)
+    head = 100 + TIMEOUT_BLOCKS
+    assert len(dog.expired(head)) == 1
+    assert dog.expired(head + RETRY_BLOCKS - 2) == []
+    assert len(dog.expired(head + RETRY_BLOCKS - 1)) == 1
+
+    # a new state clears the sent timeout
+    dog.on_trade_state(1, ContractState.REVEALED, BOB, head + RETRY_BLOCKS)
+    assert dog.sent == {}
+
+
+def test_own_moves_are_handed_to_respond_before_the_deadline():
+    responded = []
+
+    def respond(deadline):
+        responded.append(deadline.trade_id)
+        return [('move', deadline.trade_id)]
+
+    # Bob has to move while Alice waits for the timeout of the verification
+    dog = watchdog([BOB], respond=respond, margin=10)
+    accepted(dog, 1, 100)
+    dog.on_trade_state(1, ContractState.WAITING, ALICE, 100)
+    dog.on_verification_state(1, VerificationState.VERIFYED_CONTRACT, 100)
+    dog.on_verification_state(1, VerificationState.SEARCHING, 120)
+    deadline = 120 + TIMEOUT_BLOCKS
+
+    assert dog.expired(deadline - 12) == []
+    assert dog.expired(deadline - 11) == [('move', 1)]
+    assert responded == [1]
+    # the deadline itself belongs to Alice
+    assert dog.expired(deadline) == []
@@ -0,0 +1,15 @@
+import trade
+from profile_verifier import MAX_MINED_BLOCKS, MERKLE_DEPTH, Profiler, recommend, summarize
+
+
+# The verification fee has to cover the most gas a party spends in the verifier on
+# any path, measured on the longest chain, the largest arity and the deepest branch.
+def test_verifier_cost_covers_the_worst_case(chain):
+    w3, mediator, verifier = chain
+    profiler = Profiler(w3, mediator, verifier, w3.eth.accounts[0], w3.eth.accounts[1])
+    profiler.binary_search(MAX_MINED_BLOCKS)
+    profiler.kary_search(MAX_MINED_BLOCKS, 16)
+    profiler.spv(MERKLE_DEPTH, 1, 2)
+
+    recommendation = recommend(summarize(profiler.records))
+    assert recommendation['verifier_cost'] <= trade.worst_case_cost_atomic_swap, recommendation
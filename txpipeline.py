@@ -0,0 +1,308 @@
+import argparse
+import itertools
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from eth_account import Account
+from web3 import Web3, HTTPProvider
+
+try:
+    from web3.exceptions import TransactionNotFound
+except ImportError:  # older web3 versions return None for unknown transactions
+    TransactionNotFound = ()
+
+
+DROP_TIMEOUT = 120  # seconds after which an unmined transaction that the node no longer knows counts as dropped
+FILLER_GAS = 21000  # plain value transfer used to close nonce gaps
+
+
+class RpcError(Exception):
+    pass
+
+
+def load_keys(path):
+    keys = []
+    f = open(path, "r")
+    for line in f:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            keys.append(line)
+    f.close()
+    return keys
+
+
+class NonceManager:
+    """
+    Hands out nonces locally, so transactions of the same account can be signed and
+    sent in parallel without asking the node for every single one. Every account has
+    its own lock; the first nonce is read from the node's pending transaction count.
+    """
+
+    def __init__(self, w3):
+        self.w3 = w3
+        self.nonces = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def account_lock(self, address):
+        with self.lock:
+            if address not in self.locks:
+                self.locks[address] = threading.Lock()
+            return self.locks[address]
+
+    def allocate(self, address):
+        with self.account_lock(address):
+            if address not in self.nonces:
+                self.nonces[address] = self.w3.eth.getTransactionCount(address, 'pending')
+            nonce = self.nonces[address]
+            self.nonces[address] += 1
+            return nonce
+
+    # forget the local counter, the next allocation starts from the node's view again
+    def reset(self, address):
+        with self.account_lock(address):
+            self.nonces.pop(address, None)
+
+
+class RawSender:
+    """
+    Sends signed transactions as JSON-RPC batches over a pooled, keep-alive HTTP
+    session. Providers without an HTTP endpoint (e.g., eth-tester) fall back to
+    sending the transactions one by one through web3.
+    """
+
+    def __init__(self, w3, batch_size=100, pool_size=16, timeout=30):
+        self.w3 = w3
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.ids = itertools.count()
+        self.endpoint = getattr(w3.provider, 'endpoint_uri', None)
+        self.session = None
+        if self.endpoint is not None:
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+
+    # returns a (tx_hash, error) tuple for every raw transaction
+    def send(self, raw_transactions):
+        if self.session is None:
+            results = []
+            for raw in raw_transactions:
+                try:
+                    results.append((self.w3.eth.sendRawTransaction(raw), None))
+                except Exception as e:
+                    results.append((None, str(e)))
+            return results
+
+        results = []
+        for i in range(0, len(raw_transactions), self.batch_size):
+            results += self.send_batch(raw_transactions[i:i + self.batch_size])
+        return results
+
+    def send_batch(self, raw_transactions):
+        batch = []
+        for raw in raw_transactions:
+            batch.append({'jsonrpc': '2.0', 'id': next(self.ids), 'method': 'eth_sendRawTransaction',
+                          'params': [Web3.toHex(raw)]})
+        response = self.session.post(self.endpoint, json=batch, timeout=self.timeout)
+        response.raise_for_status()
+        answers = response.json()
+        if isinstance(answers, dict):  # a node rejecting the whole batch answers with a single error
+            raise RpcError(answers.get('error'))
+
+        answers = {answer['id']: answer for answer in answers}
+        results = []
+        for request in batch:
+            answer = answers.get(request['id'], {'error': {'message': 'no response'}})
+            if 'error' in answer:
+                results.append((None, answer['error'].get('message')))
+            else:
+                results.append((Web3.toBytes(hexstr=answer['result']), None))
+        return results
+
+
+class PendingTransaction:
+
+    def __init__(self, transaction, raw, tx_hash):
+        self.transaction = transaction
+        self.raw = raw
+        self.tx_hash = tx_hash
+        self.sent = time.time()
+
+
+class TransactionPipeline:
+    """
+    Signs transactions offline with local keys and submits them in bulk. Nonces are
+    allocated by a NonceManager, so submissions of an account are no longer serialized
+    by the node. Unmined transactions are tracked per account, which allows recover()
+    to rebroadcast dropped transactions and to close nonce gaps left by rejected ones.
+    """
+
+    def __init__(self, w3, keys, gas_price=None, gas=None, batch_size=100, pool_size=16, drop_timeout=DROP_TIMEOUT):
+        self.w3 = w3
+        self.accounts = {}
+        for key in keys:
+            account = Account.from_key(key)
+            self.accounts[account.address] = account
+        self.gas_price = gas_price if gas_price is not None else w3.eth.gasPrice
+        self.gas = gas if gas is not None else {}  # fixed gas limits per function name
+        self.chain_id = w3.eth.chainId
+        self.drop_timeout = drop_timeout
+        self.nonces = NonceManager(w3)
+        self.sender = RawSender(w3, batch_size, pool_size)
+        self.pending = {}
+        self.gaps = {}
+        self.lock = threading.Lock()
+
+    @property
+    def addresses(self):
+        return list(self.accounts)
+
+    def account(self, address):
+        account = self.accounts.get(Web3.toChecksumAddress(address))
+        if account is None:
+            raise KeyError("no key for account {}".format(address))
+        return account
+
+    # The gas of a call depends on the contract state (e.g., the last round of a search or
+    # the call that pays out a trade), so every call without a fixed limit is estimated.
+    def gas_limit(self, transaction):
+        call = dict((k, v) for k, v in transaction.items() if k not in ('gas', 'nonce', 'chainId'))
+        return int(self.w3.eth.estimateGas(call) * 1.2)
+
+    # builds a contract call with its gas limit and nonce; the node is only asked for gas estimates
+    def prepare(self, function, params):
+        account = self.account(params['from'])
+        gas = params.get('gas', self.gas.get(function.fn_name))
+        transaction = function.buildTransaction(dict(params, gas=gas or 0, gasPrice=params.get('gasPrice', self.gas_price),
+                                                     chainId=self.chain_id))
+        if gas is None:
+            transaction['gas'] = self.gas_limit(transaction)
+        transaction['nonce'] = self.nonces.allocate(account.address)
+        transaction.pop('from', None)
+        return account, transaction
+
+    def sign(self, function, params):
+        return self.sign_transaction(*self.prepare(function, params))
+
+    def sign_transaction(self, account, transaction):
+        signed = account.sign_transaction(transaction)
+        return account.address, transaction, signed.rawTransaction
+
+    def submit(self, signed):
+        try:
+            results = self.sender.send([raw for _, _, raw in signed])
+        except Exception:
+            # nothing is known about the batch, so all its nonces may be lost; recover()
+            # only fills the ones the node did not mine
+            with self.lock:
+                for address, transaction, _ in signed:
+                    self.gaps.setdefault(address, set()).add(transaction['nonce'])
+            raise
+        tx_hashes = []
+        with self.lock:
+            for (address, transaction, raw), (tx_hash, error) in zip(signed, results):
+                if error is not None:
+                    # the nonce is lost, later transactions of the account wait until the gap is closed
+                    self.gaps.setdefault(address, set()).add(transaction['nonce'])
+                    tx_hashes.append(None)
+                else:
+                    self.pending.setdefault(address, {})[transaction['nonce']] = PendingTransaction(transaction, raw, tx_hash)
+                    tx_hashes.append(tx_hash)
+        return tx_hashes
+
+    # calls is a list of (function, params) tuples; returns one hash per call (None if rejected)
+    def send_many(self, calls):
+        return self.submit([self.sign(function, params) for function, params in calls])
+
+    def send(self, function, params):
+        return self.send_signed(self.sign(function, params), function.fn_name)
+
+    # submits a single transaction returned by sign(), so callers can time both steps
+    def send_signed(self, signed, name):
+        tx_hash = self.submit([signed])[0]
+        if tx_hash is None:
+            raise RpcError("{} was rejected by the node".format(name))
+        return tx_hash
+
+    # transfer to oneself that only consumes a nonce
+    def filler(self, address, nonce):
+        transaction = {'to': address, 'value': 0, 'gas': FILLER_GAS, 'gasPrice': self.gas_price,
+                       'chainId': self.chain_id, 'nonce': nonce}
+        return self.sign_transaction(self.account(address), transaction)
+
+    # Forgets mined transactions, rebroadcasts transactions the node dropped and fills
+    # nonce gaps, so that the remaining transactions of every account can be mined.
+    # The node is only asked outside the lock, so submissions go on meanwhile.
+    def recover(self):
+        with self.lock:
+            addresses = set(self.pending) | set(self.gaps)
+        mined = dict((address, self.w3.eth.getTransactionCount(address, 'latest')) for address in addresses)
+
+        resend, stale = [], []
+        with self.lock:
+            for address in addresses:
+                pending = self.pending.get(address, {})
+                for nonce in [n for n in pending if n < mined[address]]:
+                    del pending[nonce]
+                gaps = self.gaps.pop(address, set())
+                for nonce in sorted(gaps):
+                    if nonce >= mined[address]:
+                        resend.append(self.filler(address, nonce))
+                for nonce, tx in sorted(pending.items()):
+                    if time.time() - tx.sent >= self.drop_timeout:
+                        stale.append((address, tx))
+                if not pending:
+                    self.pending.pop(address, None)
+
+        for address, tx in stale:
+            if not self.known(tx.tx_hash):
+                tx.sent = time.time()
+                resend.append((address, tx.transaction, tx.raw))
+        if resend:
+            self.submit(resend)
+        return len(resend)
+
+    def known(self, tx_hash):
+        try:
+            return self.w3.eth.getTransaction(tx_hash) is not None
+        except TransactionNotFound:
+            return False
+
+    def outstanding(self):
+        with self.lock:
+            return sum(len(pending) for pending in self.pending.values())
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Measure the submission rate of the offline signing pipeline.")
+    parser.add_argument('keys', help="file with one private key per line")
+    parser.add_argument('--count', type=int, default=1000, help="number of transfers per account")
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+
+    w3 = Web3( HTTPProvider("http://127.0.0.1:8545") )
+    pipeline = TransactionPipeline(w3, load_keys(args.keys), batch_size=args.batch_size)
+
+    signed = []
+    start = time.time()
+    for address in pipeline.addresses:
+        for _ in range(args.count):
+            transaction = {'to': address, 'value': 0, 'gas': FILLER_GAS, 'gasPrice': pipeline.gas_price,
+                           'chainId': pipeline.chain_id, 'nonce': pipeline.nonces.allocate(address)}
+            signed.append(pipeline.sign_transaction(pipeline.account(address), transaction))
+    signing = time.time() - start
+    tx_hashes = pipeline.submit(signed)
+    elapsed = time.time() - start
+
+    print("Signed {} transactions in {:.2f}s, submitted all in {:.2f}s ({:.0f} tx/s)".format(
+        len(signed), signing, elapsed, len(signed) / elapsed))
+    print("Rejected: {}".format(tx_hashes.count(None)))
+
+    while pipeline.outstanding():
+        pipeline.recover()
+        time.sleep(1)
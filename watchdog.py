@@ -0,0 +1,214 @@
+import argparse
+import heapq
+import itertools
+import time
+from enum import IntEnum
+
+from eth_utils import event_abi_to_log_topic
+from web3 import Web3, HTTPProvider
+
+from client import ContractState, load_contract
+
+TIMEOUT_BLOCKS = 6 * 60 * 24  # has to match Mediator.TIMEOUT_BLOCKS and AtomicSwap.TIMEOUT_BLOCKS
+RETRY_BLOCKS = 10  # blocks after which a timeout that did not finish the trade is sent again
+
+
+# mirrors AtomicSwap.ContractState
+class VerificationState(IntEnum):
+    INITIALIZED = 0
+    VERIFYED_CONTRACT = 1
+    SEARCHING = 2
+    CONFIRM_HASH = 3
+    HASH_UPLOAD_TIMEOUT = 4
+    UPLOADED_HASHES = 5
+    HEADER_MISMATCH = 6
+    MATCHING_HASHES = 7
+    FINISHED = 8
+
+
+# party that may call timeout in each state, i.e., the one waiting for the other
+MEDIATOR_CLAIMANT = {
+    ContractState.ACCEPTED: 'alice',
+    ContractState.REVEALED: 'alice',
+    ContractState.CONTENDED: 'bob',
+}
+VERIFIER_CLAIMANT = {
+    VerificationState.INITIALIZED: 'alice',
+    VerificationState.VERIFYED_CONTRACT: 'bob',
+    VerificationState.SEARCHING: 'alice',
+    VerificationState.CONFIRM_HASH: 'bob',
+    VerificationState.HEADER_MISMATCH: 'alice',
+    VerificationState.MATCHING_HASHES: 'alice',
+}
+
+
+class Deadline:
+
+    def __init__(self, contract, trade_id, state, height, claimant):
+        self.contract = contract  # 'mediator' or 'verifier'
+        self.trade_id = trade_id
+        self.state = state
+        self.height = height  # block in which the state was entered
+        self.claimant = claimant
+
+    @property
+    def key(self):
+        return (self.contract, self.trade_id)
+
+    @property
+    def block(self):
+        return self.height + TIMEOUT_BLOCKS
+
+    def __repr__(self):
+        return "Deadline({} {} {} at block {})".format(self.contract, self.trade_id, self.state.name, self.block)
+
+
+class Watchdog:
+    """
+    Claims timeouts of trades and verifications for a set of accounts. Deadlines are
+    derived from the mediator's TradeState and the verifier's c_state events and kept
+    in a min-heap, so every new block only pops the entries that expired instead of
+    checking every open trade. Superseded entries stay in the heap and are skipped
+    when they come up.
+
+    A deadline on which one of our accounts has to move itself is handed to the
+    optional respond callback `margin` blocks before it expires; it returns a list
+    of (function, params) tuples that are sent together with the timeouts.
+    """
+
+    def __init__(self, w3, mediator, verifier, accounts, pipeline=None, respond=None, margin=TIMEOUT_BLOCKS // 2,
+                 start_block=0, chunk_size=2000):
+        self.w3 = w3
+        self.contracts = {'mediator': mediator, 'verifier': verifier}
+        self.accounts = set(accounts)
+        self.pipeline = pipeline
+        self.respond = respond
+        self.margin = margin
+        self.chunk_size = chunk_size
+        self.last_block = start_block - 1
+
+        self.heap = []
+        self.sequence = itertools.count()  # keeps heap entries with the same block in insertion order
+        self.current = {}  # (contract, trade id) -> latest Deadline
+        self.parties = {}  # trade id -> {'alice': address, 'bob': address}
+        self.sent = {}  # (contract, trade id) -> block in which the timeout was sent
+
+        self.topics = {
+            Web3.toHex(event_abi_to_log_topic(mediator.events.TradeState().abi)): ('mediator', mediator.events.TradeState()),
+            Web3.toHex(event_abi_to_log_topic(verifier.events.c_state().abi)): ('verifier', verifier.events.c_state()),
+        }
+
+    def sync(self, to_block):
+        from_block = self.last_block + 1
+        addresses = [contract.address for contract in self.contracts.values()]
+        while from_block <= to_block:
+            end = min(from_block + self.chunk_size - 1, to_block)
+            logs = self.w3.eth.getLogs({'fromBlock': from_block, 'toBlock': end, 'address': addresses,
+                                        'topics': [list(self.topics)]})
+            for log in logs:
+                contract, event = self.topics[Web3.toHex(log['topics'][0])]
+                args = event.processLog(log)['args']
+                if contract == 'mediator':
+                    self.on_trade_state(args['_id'], ContractState(args['_state']), args['_sender'], log['blockNumber'])
+                else:
+                    self.on_verification_state(args['id'], VerificationState(args['state']), log['blockNumber'])
+            self.last_block = end
+
+    def on_trade_state(self, trade_id, state, sender, height):
+        if state == ContractState.CREATED:
+            self.parties[trade_id] = {'alice': sender, 'bob': None}
+        elif state == ContractState.ACCEPTED and trade_id in self.parties:
+            self.parties[trade_id]['bob'] = sender
+        self.update(Deadline('mediator', trade_id, state, height, MEDIATOR_CLAIMANT.get(state)))
+
+    def on_verification_state(self, trade_id, state, height):
+        # HEADER_MISMATCH is emitted again for every batch of headers Bob uploads; each one
+        # replaces Alice's deadline, so no timeout is claimed while Bob is still uploading
+        self.update(Deadline('verifier', trade_id, state, height, VERIFIER_CLAIMANT.get(state)))
+
+    def update(self, deadline):
+        self.sent.pop(deadline.key, None)
+        if deadline.claimant is None:
+            self.current.pop(deadline.key, None)
+            return
+        self.current[deadline.key] = deadline
+        self.push(deadline.block, deadline)
+        if self.respond is not None and self.mover(deadline) in self.accounts:
+            self.push(deadline.block - self.margin, deadline)
+
+    def push(self, block, deadline):
+        heapq.heappush(self.heap, (block, next(self.sequence), deadline))
+
+    def party(self, deadline, role):
+        parties = self.parties.get(deadline.trade_id)
+        return parties[role] if parties is not None else None
+
+    def claimant(self, deadline):
+        return self.party(deadline, deadline.claimant)
+
+    # the party that is expected to make the next move
+    def mover(self, deadline):
+        return self.party(deadline, 'bob' if deadline.claimant == 'alice' else 'alice')
+
+    # pops all entries due in the next block and returns the calls to send
+    def expired(self, head):
+        calls = []
+        while self.heap and self.heap[0][0] <= head + 1:
+            due, _, deadline = heapq.heappop(self.heap)
+            if self.current.get(deadline.key) is not deadline:
+                continue  # superseded by a later state
+
+            if due < deadline.block:
+                calls += self.respond(deadline) or []
+                continue
+
+            claimant = self.claimant(deadline)
+            if claimant not in self.accounts:
+                continue
+            # like the deadlines, a retry is due once the next block reaches it; an entry
+            # pushed for a block that is already due would be popped again forever
+            if deadline.key in self.sent and head + 1 < self.sent[deadline.key] + RETRY_BLOCKS:
+                self.push(self.sent[deadline.key] + RETRY_BLOCKS, deadline)
+                continue
+            self.sent[deadline.key] = head
+            # checked again once RETRY_BLOCKS passed without a new state
+            self.push(head + RETRY_BLOCKS, deadline)
+            contract = self.contracts[deadline.contract]
+            calls.append((contract.functions.timeout(deadline.trade_id), {'from': claimant}))
+        return calls
+
+    def send(self, calls):
+        if not calls:
+            return []
+        if self.pipeline is not None:
+            return self.pipeline.send_many(calls)
+        return [function.transact(params) for function, params in calls]
+
+    def step(self):
+        head = self.w3.eth.blockNumber
+        if head <= self.last_block:
+            return []
+        self.sync(head)
+        return self.send(self.expired(head))
+
+    def run(self, poll_interval=5):
+        while True:
+            for tx_hash in self.step():
+                if tx_hash is not None:
+                    print("Sent {}".format(Web3.toHex(tx_hash)))
+            time.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Claim the timeouts of all trades of the node's accounts.")
+    parser.add_argument('--start-block', type=int, default=0, help="block in which the mediator was deployed")
+    parser.add_argument('--poll-interval', type=float, default=5)
+    args = parser.parse_args()
+
+    w3 = Web3( HTTPProvider("http://127.0.0.1:8545") )
+    mediator = load_contract(w3, "mediator")
+    verifier = load_contract(w3, "atomic-swap-verifier")
+
+    watchdog = Watchdog(w3, mediator, verifier, w3.eth.accounts, start_block=args.start_block)
+    watchdog.run(args.poll_interval)